@@ -0,0 +1,123 @@
+"""
+ClipControl Backend - Tokens de acceso firmados (JWT HS256)
+
+El token lleva id, rol, sucursal y nombre del usuario, firmados con
+SECRET_KEY, así que autenticar una petición no consulta `usuarios`.
+Se firma con hmac de la librería estándar (como los QR en qr_firma);
+el formato es JWT estándar y lo puede verificar cualquier librería.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from config import settings
+
+_ALGORITMOS = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+
+if settings.ALGORITHM not in _ALGORITMOS:
+    raise ValueError(f"ALGORITHM no soportado: {settings.ALGORITHM} (usa {', '.join(_ALGORITMOS)})")
+
+_DIGEST = _ALGORITMOS[settings.ALGORITHM]
+_CLAVE = settings.secret_key().encode()
+
+
+class TokenInvalido(Exception):
+    pass
+
+
+def _b64(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode()
+
+
+def _desde_b64(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _firma(mensaje: str) -> str:
+    return _b64(hmac.new(_CLAVE, mensaje.encode(), _DIGEST).digest())
+
+
+_ENCABEZADO = _b64(json.dumps({"alg": settings.ALGORITHM, "typ": "JWT"}, separators=(",", ":")).encode())
+
+
+class UsuarioToken:
+    """Usuario autenticado tal como viene en el token"""
+    __slots__ = ("id", "username", "rol", "sucursal_id", "nombre")
+
+    def __init__(self, id: int, username: str, rol: str, sucursal_id: Optional[int], nombre: Optional[str]):
+        self.id = id
+        self.username = username
+        self.rol = rol
+        self.sucursal_id = sucursal_id
+        self.nombre = nombre
+
+
+def crear_token_acceso(usuario: dict) -> str:
+    """Token firmado para una fila de `usuarios`, válido ACCESS_TOKEN_EXPIRE_MINUTES"""
+    ahora = int(time.time())
+    datos = {
+        "sub": str(usuario['id']),
+        "username": usuario['username'],
+        "rol": (usuario.get('rol') or "").upper(),
+        "sucursal_id": usuario.get('sucursal_id'),
+        "nombre": usuario.get('nombre_completo'),
+        "iat": ahora,
+        "exp": ahora + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+    mensaje = f"{_ENCABEZADO}.{_b64(json.dumps(datos, separators=(',', ':')).encode())}"
+    return f"{mensaje}.{_firma(mensaje)}"
+
+
+def verificar_token_acceso(token: str) -> UsuarioToken:
+    """Verificar firma y expiración. TokenInvalido con el motivo si no sirve"""
+    try:
+        encabezado, payload, firma = token.split(".")
+    except ValueError:
+        raise TokenInvalido("Token inválido")
+
+    if encabezado != _ENCABEZADO or not hmac.compare_digest(firma, _firma(f"{encabezado}.{payload}")):
+        raise TokenInvalido("Token inválido")
+
+    try:
+        datos = json.loads(_desde_b64(payload))
+        exp = int(datos["exp"])
+        usuario = UsuarioToken(int(datos["sub"]), datos["username"], datos["rol"], datos.get("sucursal_id"), datos.get("nombre"))
+    except (ValueError, KeyError, TypeError):
+        raise TokenInvalido("Token inválido")
+
+    if time.time() >= exp:
+        raise TokenInvalido("Sesión expirada")
+    return usuario
+
+
+def _token_de_header(authorization: str) -> str:
+    esquema, _, token = authorization.partition(" ")
+    if esquema.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Token inválido", headers={"WWW-Authenticate": "Bearer"})
+    return token.strip()
+
+
+def usuario_actual(authorization: Optional[str] = Header(None)) -> UsuarioToken:
+    """Dependencia: usuario del header `Authorization: Bearer <token>` (401 si falta o no es válido)"""
+    if not authorization:
+        raise HTTPException(status_code=401, detail="No autenticado", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return verificar_token_acceso(_token_de_header(authorization))
+    except TokenInvalido as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+def usuario_opcional(authorization: Optional[str] = Header(None)) -> Optional[UsuarioToken]:
+    """Como `usuario_actual`, pero sin header retorna None (clientes que aún no envían el token)"""
+    if not authorization:
+        return None
+    return usuario_actual(authorization)
@@ -0,0 +1,262 @@
+"""
+ClipControl Backend - Benchmark del escaneo (día de entrega)
+
+Simula N guardias concurrentes haciendo la secuencia real de la app:
+    1. POST /api/qr/validar
+    2. POST /api/entregas/registrar-seguro (con foto)
+    3. GET  /api/entregas/estadisticas-guardia/{usuario_id}
+
+Corre la API en proceso contra una base SQLite temporal (DB_BACKEND=sqlite),
+poblada con datos de prueba, y reporta throughput y latencias p50/p95/p99
+por endpoint. El resultado se guarda en JSON para comparar versiones:
+
+    python benchmark_escaneo.py --guardias 20 --escaneos 2000
+    python benchmark_escaneo.py --comparar benchmark_escaneo.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ENDPOINTS = ("validar", "registrar", "estadisticas")
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, max(0, math.ceil(p / 100 * len(valores)) - 1))]
+
+
+def resumir(latencias: list, errores: int, duracion: float) -> dict:
+    ordenadas = sorted(latencias)
+    return {
+        "peticiones": len(ordenadas),
+        "errores": errores,
+        "rps": round(len(ordenadas) / duracion, 1) if duracion else 0,
+        "media_ms": round(sum(ordenadas) / len(ordenadas) * 1000, 2) if ordenadas else 0,
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 2),
+        "p95_ms": round(percentil(ordenadas, 95) * 1000, 2),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 2),
+        "max_ms": round(ordenadas[-1] * 1000, 2) if ordenadas else 0
+    }
+
+
+def foto_base(ancho: int, alto: int) -> bytes:
+    """JPEG con ruido para que pese como una foto real de cámara"""
+    from PIL import Image
+
+    imagen = Image.effect_noise((ancho, alto), 60).convert("RGB")
+    buffer = io.BytesIO()
+    imagen.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def version_git() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocida"
+
+
+async def ejecutar(args) -> dict:
+    # La configuración se lee al importar: fijar el entorno antes de importar la app
+    directorio = tempfile.mkdtemp(prefix="clipcontrol-bench-")
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = os.path.join(directorio, "bench.db")
+    os.environ["FOTOS_DIR"] = os.path.join(directorio, "fotos")
+
+    import httpx
+    from database import iterar_paginas
+    from repositorio_sqlite import get_repositorio_sqlite, poblar
+    import main
+
+    repositorio = get_repositorio_sqlite()
+    print(f"🌱 Poblando base de prueba ({args.empleados} empleados)...")
+    datos = poblar(repositorio, empleados=args.empleados, sucursales=args.sucursales,
+                   guardias_por_sucursal=max(1, math.ceil(args.guardias / args.sucursales)))
+    periodo_id = datos["periodo_id"]
+    guardias = repositorio.table("usuarios").select("id").eq("rol", "GUARDIA").order("id").limit(args.guardias).execute().data
+
+    await main.app.router.startup()
+    transporte = httpx.ASGITransport(app=main.app)
+    limites = httpx.Limits(max_connections=args.guardias * 2)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", limits=limites, timeout=120) as cliente:
+        # Tokens firmados para los empleados que van a retirar (fuera de la medición)
+        activos = [
+            fila
+            for pagina in iterar_paginas(lambda: repositorio.table("empleados").select("id").eq("activo", True).order("id"))
+            for fila in pagina
+        ][:args.escaneos]
+        qr_data = []
+        for inicio in range(0, len(activos), 1000):  # una respuesta de la BD trae como máximo 1000 filas
+            r = await cliente.post(
+                "/api/qr/generar-masivo",
+                params={"duracion_minutos": 240, "periodo_id": periodo_id},
+                json={"empleados_ids": [e["id"] for e in activos[inicio:inicio + 1000]]}
+            )
+            r.raise_for_status()
+            qr_data += r.json()["qr_data"]
+        pendientes = asyncio.Queue()
+        random.Random(args.semilla).shuffle(qr_data)
+        for item in qr_data:
+            pendientes.put_nowait(item)
+        if len(qr_data) < args.escaneos:
+            print(f"⚠️ Solo hay {len(qr_data)} empleados activos para escanear")
+
+        foto = foto_base(args.foto_ancho, args.foto_alto)
+        latencias = {nombre: [] for nombre in ENDPOINTS}
+        errores = {nombre: 0 for nombre in ENDPOINTS}
+        codigos = {}
+        completados = 0
+
+        async def medir(nombre: str, peticion):
+            inicio = time.perf_counter()
+            try:
+                respuesta = await peticion
+            except httpx.HTTPError:
+                errores[nombre] += 1
+                return None
+            latencias[nombre].append(time.perf_counter() - inicio)
+            if respuesta.status_code >= 400:
+                errores[nombre] += 1
+                return None
+            return respuesta.json()
+
+        async def guardia(usuario_id: int):
+            nonlocal completados
+            while True:
+                try:
+                    item = pendientes.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                validacion = await medir("validar", cliente.post(
+                    "/api/qr/validar", params={"token": item["token"], "periodo_id": periodo_id}
+                ))
+                if not validacion or not validacion.get("valido"):
+                    codigo = (validacion or {}).get("codigo", "ERROR")
+                    codigos[codigo] = codigos.get(codigo, 0) + 1
+                    continue
+                codigos["OK"] = codigos.get("OK", 0) + 1
+
+                # Bytes extra tras el fin del JPEG: cada foto es distinta, como en la vida real
+                contenido = foto + os.urandom(16)
+                registro = await medir("registrar", cliente.post(
+                    "/api/entregas/registrar-seguro",
+                    data={
+                        "qr_token_id": validacion["token_id"],
+                        "empleado_id": item["empleado_id"],
+                        "usuario_id": usuario_id,
+                        "periodo_id": periodo_id,
+                        "qr_token": item["token"],
+                        "dispositivo_id": f"bench-{usuario_id}"
+                    },
+                    files={"foto": ("foto.jpg", contenido, "image/jpeg")}
+                ))
+                if registro:
+                    completados += 1
+
+                await medir("estadisticas", cliente.get(f"/api/entregas/estadisticas-guardia/{usuario_id}"))
+
+                if args.pausa:
+                    await asyncio.sleep(args.pausa / 1000)
+
+        print(f"🚀 {len(guardias)} guardias, {pendientes.qsize()} escaneos...")
+        inicio = time.perf_counter()
+        await asyncio.gather(*(guardia(g["id"]) for g in guardias))
+        duracion = time.perf_counter() - inicio
+
+    await main.app.router.shutdown()
+    if not args.conservar:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "version": version_git(),
+        "entorno": {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        "parametros": {
+            "guardias": len(guardias),
+            "escaneos": args.escaneos,
+            "empleados": args.empleados,
+            "foto_bytes": len(foto),
+            "pausa_ms": args.pausa
+        },
+        "duracion_segundos": round(duracion, 2),
+        "escaneos_completados": completados,
+        "escaneos_por_segundo": round(completados / duracion, 1) if duracion else 0,
+        "codigos_validacion": codigos,
+        "endpoints": {nombre: resumir(latencias[nombre], errores[nombre], duracion) for nombre in ENDPOINTS}
+    }
+
+
+def imprimir(resultado: dict):
+    print("=" * 72)
+    print(f"📊 {resultado['escaneos_completados']} escaneos en {resultado['duracion_segundos']} s "
+          f"→ {resultado['escaneos_por_segundo']} escaneos/s ({resultado['parametros']['guardias']} guardias)")
+    print(f"{'endpoint':<14}{'n':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for nombre, datos in resultado["endpoints"].items():
+        print(f"{nombre:<14}{datos['peticiones']:>7}{datos['errores']:>6}{datos['rps']:>9}"
+              f"{datos['p50_ms']:>10}{datos['p95_ms']:>10}{datos['p99_ms']:>10}{datos['max_ms']:>10}")
+    print("=" * 72)
+
+
+def comparar(anterior: dict, actual: dict):
+    """Mostrar la variación contra una corrida anterior (negativo = más rápido)"""
+    def delta(antes, despues):
+        return f"{(despues - antes) / antes * 100:+.1f}%" if antes else "n/a"
+
+    print(f"🔁 Comparando con {anterior.get('version')} ({anterior.get('fecha')})")
+    print(f"   escaneos/s: {anterior['escaneos_por_segundo']} → {actual['escaneos_por_segundo']} "
+          f"({delta(anterior['escaneos_por_segundo'], actual['escaneos_por_segundo'])})")
+    for nombre in ENDPOINTS:
+        antes = anterior["endpoints"].get(nombre)
+        despues = actual["endpoints"][nombre]
+        if not antes:
+            continue
+        print(f"   {nombre:<13} p95 {antes['p95_ms']} → {despues['p95_ms']} ms ({delta(antes['p95_ms'], despues['p95_ms'])}), "
+              f"p99 {antes['p99_ms']} → {despues['p99_ms']} ms ({delta(antes['p99_ms'], despues['p99_ms'])})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del escaneo de QR con guardias concurrentes")
+    parser.add_argument("--guardias", type=int, default=20, help="Guardias escaneando en paralelo")
+    parser.add_argument("--escaneos", type=int, default=1000, help="Total de escaneos (un empleado distinto cada uno)")
+    parser.add_argument("--empleados", type=int, default=5000)
+    parser.add_argument("--sucursales", type=int, default=5)
+    parser.add_argument("--foto-ancho", type=int, default=1600)
+    parser.add_argument("--foto-alto", type=int, default=1200)
+    parser.add_argument("--pausa", type=float, default=0, help="Milisegundos entre escaneos de un mismo guardia")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", default="benchmark_escaneo.json", help="Archivo JSON con el resultado")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--conservar", action="store_true", help="No borrar la base y las fotos temporales")
+    args = parser.parse_args()
+
+    anterior = None
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            anterior = json.load(archivo)
+
+    resultado = asyncio.run(ejecutar(args))
+    imprimir(resultado)
+    if anterior:
+        comparar(anterior, resultado)
+
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+    print(f"💾 Resultado guardado en {args.salida}")
+    sys.exit(0 if resultado["escaneos_completados"] else 1)
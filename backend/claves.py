@@ -0,0 +1,232 @@
+"""
+ClipControl Backend - Contraseñas (bcrypt) y registro de último acceso
+
+bcrypt es CPU puro: cuando un turno completo de guardias inicia sesión a
+la vez, verificar en el threadpool de FastAPI lo satura y frena al resto
+de las rutas. Aquí el hashing corre en un pool propio con pocos hilos y
+una cola acotada; si la cola está llena o la espera supera el timeout,
+el login responde 503 en vez de acumular trabajo.
+
+El costo de bcrypt sale de BCRYPT_COSTO o, si no está fijado, se calibra
+al iniciar para acercarse a BCRYPT_OBJETIVO_MS por verificación, nunca
+bajo el costo por defecto de bcrypt (12). Las contraseñas con un costo
+menor se rehashean después de un login correcto; nunca se bajan. `ultimo_acceso` se acumula en
+memoria y se escribe por lotes cada ACCESOS_INTERVALO segundos.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from datetime import datetime
+from typing import Dict, Optional
+
+import bcrypt
+
+from config import settings
+
+
+# Costo por defecto de bcrypt.gensalt(): piso de la calibración
+COSTO_POR_DEFECTO = 12
+
+
+class PoolSaturado(Exception):
+    """La cola de hashing está llena o la espera superó el timeout"""
+
+
+def costo_de_hash(password_hash: str) -> Optional[int]:
+    """'$2b$12$...' -> 12"""
+    try:
+        return int(password_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PoolClaves:
+    """Hilos dedicados a bcrypt con cola acotada y costo adaptativo"""
+
+    def __init__(self, workers: int, max_cola: int, timeout: float,
+                 objetivo_ms: float, costo_min: int, costo_max: int, costo_fijo: int = 0):
+        self.workers = max(1, workers)
+        self.max_pendientes = self.workers + max(0, max_cola)
+        self.timeout = timeout
+        self.objetivo_ms = objetivo_ms
+        self.costo_min = max(costo_min, COSTO_POR_DEFECTO)
+        self.costo_max = max(costo_max, self.costo_min)
+        self.costo_fijo = costo_fijo
+        # None hasta calibrar: se hashea con el costo por defecto de bcrypt y no se rehashea
+        self.costo: Optional[int] = costo_fijo or None
+        self._pendientes = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            return self._executor
+
+    def detener(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _enviar(self, funcion, *args):
+        pool = self._pool()
+        with self._lock:
+            if self._pendientes >= self.max_pendientes:
+                raise PoolSaturado("Demasiados inicios de sesión simultáneos, intenta nuevamente")
+            self._pendientes += 1
+        futuro = pool.submit(funcion, *args)
+        futuro.add_done_callback(self._terminado)
+        return futuro
+
+    def _terminado(self, _futuro):
+        with self._lock:
+            self._pendientes -= 1
+
+    # ------------------------------------------
+    # Costo adaptativo
+    # ------------------------------------------
+
+    def calibrar(self) -> int:
+        """Mayor costo cuyo hash no supera el objetivo (cada +1 duplica el tiempo)"""
+        costo = self.costo_min
+        inicio = time.perf_counter()
+        bcrypt.hashpw(b"calibracion", bcrypt.gensalt(costo))
+        ms = (time.perf_counter() - inicio) * 1000
+        while costo < self.costo_max and ms * 2 <= self.objetivo_ms:
+            costo += 1
+            ms *= 2
+        self.costo = costo
+        print(f"🔑 Costo bcrypt calibrado: {costo} (~{ms:.0f} ms por verificación, objetivo {self.objetivo_ms:.0f} ms)")
+        return costo
+
+    def calibrar_en_segundo_plano(self):
+        if self.costo_fijo:
+            print(f"🔑 Costo bcrypt fijo: {self.costo_fijo}")
+            return
+        self._pool().submit(self.calibrar)
+
+    def necesita_rehash(self, password_hash: str) -> bool:
+        """Solo hacia arriba: workers con calibraciones distintas no se pisan entre sí"""
+        costo = costo_de_hash(password_hash)
+        return self.costo is not None and costo is not None and costo < self.costo
+
+    # ------------------------------------------
+    # Operaciones
+    # ------------------------------------------
+
+    def _hashear(self, password: str) -> str:
+        salt = bcrypt.gensalt(self.costo) if self.costo else bcrypt.gensalt()
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+    @staticmethod
+    def _verificar(password: str, password_hash: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    async def verificar(self, password: str, password_hash: str) -> bool:
+        """Verificar sin ocupar el event loop ni el threadpool de FastAPI"""
+        futuro = self._enviar(self._verificar, password, password_hash)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(futuro), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # Si aún estaba en cola no llega a ejecutarse
+            futuro.cancel()
+            raise PoolSaturado("La verificación de contraseña tardó demasiado, intenta nuevamente")
+
+    def hashear(self, password: str) -> str:
+        """Hash con el costo calibrado (para endpoints síncronos)"""
+        futuro = self._enviar(self._hashear, password)
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeout:
+            futuro.cancel()
+            raise PoolSaturado("El hash de la contraseña tardó demasiado, intenta nuevamente")
+
+    def rehashear_en_segundo_plano(self, supabase, usuario_id: int, password: str):
+        """Guardar el hash con el costo actual después de un login correcto"""
+        def rehashear():
+            try:
+                nuevo = self._hashear(password)
+                supabase.table("usuarios").update({"password_hash": nuevo}).eq("id", usuario_id).execute()
+                print(f"🔑 Contraseña del usuario {usuario_id} rehasheada con costo {self.costo}")
+            except Exception as e:
+                print(f"❌ Error rehasheando contraseña del usuario {usuario_id}: {e}")
+
+        try:
+            self._enviar(rehashear)
+        except PoolSaturado:
+            # Se reintenta en el próximo login
+            pass
+
+
+class RegistroAccesos:
+    """
+    `ultimo_acceso` diferido: los logins solo anotan en memoria y un hilo
+    escribe cada `intervalo` segundos un update por lote. Cada lote usa el
+    acceso más reciente del lote, así la precisión es de `intervalo`.
+    """
+
+    def __init__(self, intervalo: float):
+        self.intervalo = intervalo
+        self._pendientes: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self._supabase = None
+
+    def iniciar(self, supabase):
+        if self._hilo:
+            return
+        self._supabase = supabase
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._trabajar, name="ultimo-acceso", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if not self._hilo:
+            return
+        self._detener.set()
+        self._hilo.join(timeout=5)
+        self._hilo = None
+        self.escribir()
+
+    def anotar(self, usuario_id: int):
+        with self._lock:
+            self._pendientes[usuario_id] = datetime.now()
+
+    def _trabajar(self):
+        while not self._detener.wait(self.intervalo):
+            self.escribir()
+
+    def escribir(self) -> int:
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        if not pendientes:
+            return 0
+        ids = list(pendientes)
+        try:
+            self._supabase.table("usuarios").update({
+                "ultimo_acceso": max(pendientes.values()).isoformat()
+            }).in_("id", ids).execute()
+        except Exception as e:
+            print(f"❌ Error guardando último acceso: {e}")
+            # Se reintenta en el próximo lote sin pisar accesos más nuevos
+            with self._lock:
+                for usuario_id, momento in pendientes.items():
+                    self._pendientes.setdefault(usuario_id, momento)
+            return 0
+        return len(ids)
+
+
+pool_claves = PoolClaves(
+    settings.LOGIN_WORKERS,
+    settings.LOGIN_COLA_MAX,
+    settings.LOGIN_TIMEOUT,
+    settings.BCRYPT_OBJETIVO_MS,
+    settings.BCRYPT_COSTO_MIN,
+    settings.BCRYPT_COSTO_MAX,
+    settings.BCRYPT_COSTO
+)
+registro_accesos = RegistroAccesos(settings.ACCESOS_INTERVALO)
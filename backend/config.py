@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 # Cargar variables de entorno
 load_dotenv()
 
+# Valores por defecto o de ejemplo que nunca deben firmar tokens
+CLAVES_INSEGURAS = {"", "secret", "clipcontrol_secret_key_2025_cambiar_en_produccion"}
+
 class Settings:
     """Configuración de la aplicación"""
     
@@ -14,8 +17,19 @@ class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     
+    # Base de datos: "supabase" o "sqlite" (local, para desarrollo offline y pruebas de carga)
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "supabase").lower()
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "clipcontrol.db")
+    SQLITE_MAX_FILAS: int = int(os.getenv("SQLITE_MAX_FILAS", "1000"))  # tope por respuesta, como PostgREST
+    
+    # Pool de conexiones del cliente asíncrono
+    DB_POOL_MAX: int = int(os.getenv("DB_POOL_MAX", "20"))
+    DB_POOL_KEEPALIVE: int = int(os.getenv("DB_POOL_KEEPALIVE", "10"))
+    DB_KEEPALIVE_SEGUNDOS: float = float(os.getenv("DB_KEEPALIVE_SEGUNDOS", "30"))
+    DB_TIMEOUT_SEGUNDOS: float = float(os.getenv("DB_TIMEOUT_SEGUNDOS", "30"))
+    
     # Seguridad
-    SECRET_KEY: str = os.getenv("SECRET_KEY", "secret")
+    SECRET_KEY: str = os.getenv("SECRET_KEY", "")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
     
@@ -27,8 +41,80 @@ class Settings:
     # CORS
     CORS_ORIGINS: list = os.getenv("CORS_ORIGINS", "").split(",")
     
+    # QR masivo
+    QR_CHUNK_SIZE: int = int(os.getenv("QR_CHUNK_SIZE", "500"))
+    QR_PARALELISMO: int = int(os.getenv("QR_PARALELISMO", "4"))
+    QR_RENDER_PROCESOS: int = int(os.getenv("QR_RENDER_PROCESOS", "0"))  # 0 = un proceso por CPU
+    
+    # Caché del catálogo de períodos (segundos; red de seguridad con varios workers)
+    PERIODOS_CACHE_TTL: float = float(os.getenv("PERIODOS_CACHE_TTL", "30"))
+    
+    # Índice de RUT en memoria (LRU con TTL; precarga opcional al activar un período)
+    RUT_INDICE_MAX: int = int(os.getenv("RUT_INDICE_MAX", "20000"))
+    RUT_INDICE_TTL: float = float(os.getenv("RUT_INDICE_TTL", "300"))
+    RUT_INDICE_PRECARGAR: bool = os.getenv("RUT_INDICE_PRECARGAR", "False").lower() == "true"
+    
+    # Empleados que ya retiraron, por período (segundos entre resiembras desde la BD)
+    ENTREGADOS_TTL: float = float(os.getenv("ENTREGADOS_TTL", "60"))
+    
+    # Traspaso de cajas no retiradas al sindicato (filas por insert)
+    TRASPASO_CHUNK_SIZE: int = int(os.getenv("TRASPASO_CHUNK_SIZE", "500"))
+    
+    # Contadores del dashboard en memoria (segundos entre reconciliaciones con la BD)
+    ESTADISTICAS_RECONCILIAR: float = float(os.getenv("ESTADISTICAS_RECONCILIAR", "60"))
+    
+    # Eventos en vivo (SSE): segundos entre envíos de contadores y mensajes máximos en cola por panel
+    EVENTOS_INTERVALO: float = float(os.getenv("EVENTOS_INTERVALO", "15"))
+    EVENTOS_COLA_MAX: int = int(os.getenv("EVENTOS_COLA_MAX", "256"))
+    
+    # Rollups de entregas para reportes (segundos entre puestas al día y reconstrucciones completas)
+    ROLLUPS_AL_DIA: float = float(os.getenv("ROLLUPS_AL_DIA", "30"))
+    ROLLUPS_RECONSTRUIR: float = float(os.getenv("ROLLUPS_RECONSTRUIR", "3600"))
+    
+    # Importación de nómina (filas por insert/upsert)
+    NOMINA_CHUNK_SIZE: int = int(os.getenv("NOMINA_CHUNK_SIZE", "500"))
+    
+    # Login: hilos y cola del pool de bcrypt, timeout (segundos) y escritura diferida de ultimo_acceso
+    LOGIN_WORKERS: int = int(os.getenv("LOGIN_WORKERS", "2"))
+    LOGIN_COLA_MAX: int = int(os.getenv("LOGIN_COLA_MAX", "64"))
+    LOGIN_TIMEOUT: float = float(os.getenv("LOGIN_TIMEOUT", "5"))
+    ACCESOS_INTERVALO: float = float(os.getenv("ACCESOS_INTERVALO", "10"))
+    
+    # Costo bcrypt: fijo (BCRYPT_COSTO) o calibrado a un objetivo en milisegundos (nunca bajo 12)
+    BCRYPT_COSTO: int = int(os.getenv("BCRYPT_COSTO", "0"))  # 0 = calibrar al iniciar
+    BCRYPT_OBJETIVO_MS: float = float(os.getenv("BCRYPT_OBJETIVO_MS", "250"))
+    BCRYPT_COSTO_MIN: int = int(os.getenv("BCRYPT_COSTO_MIN", "12"))
+    BCRYPT_COSTO_MAX: int = int(os.getenv("BCRYPT_COSTO_MAX", "14"))
+    
+    # Fotos de entrega
+    FOTOS_BACKEND: str = os.getenv("FOTOS_BACKEND", "local")
+    FOTOS_DIR: str = os.getenv("FOTOS_DIR", "fotos")
+    FOTOS_MAX_LADO: int = int(os.getenv("FOTOS_MAX_LADO", "1600"))
+    FOTOS_CALIDAD: int = int(os.getenv("FOTOS_CALIDAD", "75"))
+    FOTOS_LADO_MINIATURA: int = int(os.getenv("FOTOS_LADO_MINIATURA", "320"))
+    FOTOS_INGESTA_WORKERS: int = int(os.getenv("FOTOS_INGESTA_WORKERS", "2"))
+    FOTOS_INGESTA_COLA: int = int(os.getenv("FOTOS_INGESTA_COLA", "64"))
+    FOTOS_INGESTA_ESPERA: float = float(os.getenv("FOTOS_INGESTA_ESPERA", "0.5"))
+    FOTOS_CACHE_MB: int = int(os.getenv("FOTOS_CACHE_MB", "64"))
+    FOTOS_LIMPIEZA_INTERVALO: float = float(os.getenv("FOTOS_LIMPIEZA_INTERVALO", "3600"))
+    FOTOS_LIMPIEZA_GRACIA: float = float(os.getenv("FOTOS_LIMPIEZA_GRACIA", "900"))  # segundos sin uso antes de poder borrar
+    
+    def secret_key(self) -> str:
+        """
+        SECRET_KEY firma los tokens de acceso y los QR: con una clave
+        conocida cualquiera podría emitirlos, así que no se arranca sin una propia.
+        """
+        if self.SECRET_KEY.strip() in CLAVES_INSEGURAS:
+            raise ValueError(
+                "SECRET_KEY no está configurado o usa un valor de ejemplo. Genera uno con: "
+                "python -c \"import secrets; print(secrets.token_urlsafe(48))\""
+            )
+        return self.SECRET_KEY
+    
     def validate(self):
         """Validar que las configuraciones necesarias están presentes"""
+        if self.DB_BACKEND == "sqlite":
+            return True
         if not self.SUPABASE_URL:
             raise ValueError("SUPABASE_URL no está configurado en .env")
         if not self.SUPABASE_KEY:
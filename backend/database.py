@@ -3,6 +3,8 @@ ClipControl Backend - Database Connection
 """
 from supabase import create_client, Client
 from config import settings
+from repositorio_sqlite import get_repositorio_sqlite
+from metricas import instrumentar
 
 def get_supabase() -> Client:
     """Crear y retornar cliente de Supabase"""
@@ -36,10 +38,12 @@ _supabase_client = None
 
 def get_supabase() -> Client:
     global _supabase_client
+    if _supabase_client is None and settings.DB_BACKEND == "sqlite":
+        _supabase_client = instrumentar(get_repositorio_sqlite())
     if _supabase_client is None:
         print(f"🔌 Creando nueva conexión Supabase...")
         print(f"   URL: {settings.SUPABASE_URL}")
-        _supabase_client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        _supabase_client = instrumentar(create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY))
         
         # Test
         try:
@@ -48,4 +52,20 @@ def get_supabase() -> Client:
         except Exception as e:
             print(f"❌ Error en test de conexión: {e}")
     
-    return _supabase_client
\ No newline at end of file
+    return _supabase_client
+
+
+def iterar_paginas(construir_query, tamano: int = 1000):
+    """
+    Recorrer un select por páginas (PostgREST limita las filas por respuesta).
+    `construir_query` debe crear una query nueva y ordenada en cada llamada.
+    """
+    desde = 0
+    while True:
+        result = construir_query().range(desde, desde + tamano - 1).execute()
+        filas = result.data or []
+        if filas:
+            yield filas
+        if len(filas) < tamano:
+            break
+        desde += tamano
@@ -0,0 +1,67 @@
+"""
+ClipControl Backend - Conexión asíncrona a la base de datos
+
+Cliente PostgREST asíncrono para los endpoints `async def`, de modo que
+esperar a la red no bloquee el event loop. Usa un pool de conexiones
+HTTP/2 con keep-alive configurable. Con DB_BACKEND=sqlite retorna la
+variante asíncrona del repositorio local.
+"""
+from typing import Optional
+
+from httpx import AsyncClient, Limits
+from postgrest import AsyncPostgrestClient
+
+from config import settings
+from repositorio_sqlite import get_repositorio_sqlite_async
+from metricas import ClienteMedido, instrumentar
+
+
+class ClienteAsync(AsyncPostgrestClient):
+    """Cliente PostgREST asíncrono con límites de pool configurables"""
+
+    def create_session(self, base_url, headers, timeout, verify=True, proxy=None) -> AsyncClient:
+        return AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            proxy=proxy,
+            follow_redirects=True,
+            http2=True,
+            limits=Limits(
+                max_connections=settings.DB_POOL_MAX,
+                max_keepalive_connections=settings.DB_POOL_KEEPALIVE,
+                keepalive_expiry=settings.DB_KEEPALIVE_SEGUNDOS
+            )
+        )
+
+
+_cliente_async: Optional[ClienteMedido] = None
+
+
+def get_supabase_async() -> ClienteMedido:
+    """Cliente asíncrono compartido (uno por worker)"""
+    global _cliente_async
+    if _cliente_async is None and settings.DB_BACKEND == "sqlite":
+        _cliente_async = instrumentar(get_repositorio_sqlite_async())
+    if _cliente_async is None:
+        print(f"🔌 Creando cliente asíncrono (pool={settings.DB_POOL_MAX}, keep-alive={settings.DB_POOL_KEEPALIVE})")
+        _cliente_async = instrumentar(ClienteAsync(
+            f"{settings.SUPABASE_URL}/rest/v1",
+            headers={
+                "apiKey": settings.SUPABASE_KEY,
+                "Authorization": f"Bearer {settings.SUPABASE_KEY}",
+                "Accept": "application/json",
+                "Content-Type": "application/json"
+            },
+            timeout=settings.DB_TIMEOUT_SEGUNDOS
+        ))
+    return _cliente_async
+
+
+async def cerrar_supabase_async():
+    """Cerrar las conexiones del pool al apagar la app"""
+    global _cliente_async
+    if _cliente_async is not None:
+        await _cliente_async.aclose()
+        _cliente_async = None
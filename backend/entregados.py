@@ -0,0 +1,155 @@
+"""
+ClipControl Backend - Empleados que ya retiraron, por período
+
+Un bit por empleado_id y período: la pregunta "¿ya retiró?" de la
+validación se responde en memoria. El conjunto de cada período se siembra
+desde `entregas` la primera vez que se consulta y se vuelve a sembrar en
+segundo plano cada ENTREGADOS_TTL segundos para recoger lo registrado por
+otros workers. Por eso un "no retiró" puede estar atrasado: las
+escrituras lo confirman en la base de datos antes de insertar.
+"""
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+from database import iterar_paginas
+
+
+class ConjuntoEntregados:
+    """empleado_id con entrega COMPLETADO en un período: un bit por id en un bytearray"""
+
+    def __init__(self):
+        self._bits = bytearray()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def contiene(self, empleado_id: int) -> bool:
+        byte = empleado_id >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (empleado_id & 7)))
+
+    def marcar(self, empleado_id: int):
+        byte = empleado_id >> 3
+        with self._lock:
+            if byte >= len(self._bits):
+                self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits))))
+            if not self._bits[byte] & (1 << (empleado_id & 7)):
+                self._bits[byte] |= 1 << (empleado_id & 7)
+                self._total += 1
+
+    def desmarcar(self, empleado_id: int):
+        byte = empleado_id >> 3
+        with self._lock:
+            if byte < len(self._bits) and self._bits[byte] & (1 << (empleado_id & 7)):
+                self._bits[byte] &= ~(1 << (empleado_id & 7)) & 0xFF
+                self._total -= 1
+
+    def total(self) -> int:
+        return self._total
+
+    def ids(self) -> Iterator[int]:
+        """empleado_id marcados, en orden ascendente"""
+        for byte, valor in enumerate(bytes(self._bits)):
+            if valor:
+                for bit in range(8):
+                    if valor & (1 << bit):
+                        yield (byte << 3) | bit
+
+
+class EntregadosPorPeriodo:
+    """Un ConjuntoEntregados por periodo_id, sembrado una vez y resembrado con TTL"""
+
+    def __init__(self, ttl_segundos: float):
+        self.ttl = ttl_segundos
+        self._periodos: Dict[int, Tuple[ConjuntoEntregados, float]] = {}
+        self._siembras: Dict[int, threading.Lock] = {}
+        # Cambios ocurridos mientras se siembra un período: se reaplican al terminar
+        self._durante_siembra: Dict[int, List[Tuple[int, bool]]] = {}
+        self._lock = threading.Lock()
+
+    def _sembrar(self, supabase, periodo_id: int) -> ConjuntoEntregados:
+        with self._lock:
+            self._durante_siembra[periodo_id] = []
+
+        conjunto = ConjuntoEntregados()
+        try:
+            for pagina in iterar_paginas(
+                lambda: supabase.table("entregas").select("id, empleado_id")
+                .eq("periodo_id", periodo_id).eq("estado", "COMPLETADO").order("id")
+            ):
+                for fila in pagina:
+                    conjunto.marcar(fila["empleado_id"])
+        finally:
+            with self._lock:
+                cambios = self._durante_siembra.pop(periodo_id)
+
+        with self._lock:
+            for empleado_id, entregado in cambios:
+                if entregado:
+                    conjunto.marcar(empleado_id)
+                else:
+                    conjunto.desmarcar(empleado_id)
+            self._periodos[periodo_id] = (conjunto, time.monotonic() + self.ttl)
+        return conjunto
+
+    def conjunto(self, supabase, periodo_id: int) -> ConjuntoEntregados:
+        entrada = self._periodos.get(periodo_id)
+        if entrada and time.monotonic() < entrada[1]:
+            return entrada[0]
+
+        with self._lock:
+            siembra = self._siembras.setdefault(periodo_id, threading.Lock())
+
+        if entrada:
+            # Vencido: se resiembra en un hilo aparte y se sigue respondiendo con el anterior
+            if siembra.acquire(blocking=False):
+                threading.Thread(
+                    target=self._resembrar, args=(supabase, periodo_id, siembra),
+                    name=f"entregados-{periodo_id}", daemon=True
+                ).start()
+            return entrada[0]
+
+        # Primera consulta del período: no hay nada que servir mientras tanto
+        with siembra:
+            entrada = self._periodos.get(periodo_id)
+            if entrada:
+                return entrada[0]
+            return self._sembrar(supabase, periodo_id)
+
+    def _resembrar(self, supabase, periodo_id: int, siembra: threading.Lock):
+        try:
+            self._sembrar(supabase, periodo_id)
+        except Exception as e:
+            print(f"❌ Error resembrando entregados del período {periodo_id}: {e}")
+        finally:
+            siembra.release()
+
+    def cargado(self, periodo_id: int) -> Optional[ConjuntoEntregados]:
+        """Conjunto del período si ya está sembrado, sin ir a la base de datos"""
+        entrada = self._periodos.get(periodo_id)
+        return entrada[0] if entrada else None
+
+    def ya_retiro(self, supabase, periodo_id: int, empleado_id: int) -> bool:
+        return self.conjunto(supabase, periodo_id).contiene(empleado_id)
+
+    def _registrar(self, periodo_id: Optional[int], empleado_id: int, entregado: bool):
+        if not periodo_id:
+            return
+        with self._lock:
+            if periodo_id in self._durante_siembra:
+                self._durante_siembra[periodo_id].append((empleado_id, entregado))
+            entrada = self._periodos.get(periodo_id)
+            if entrada:
+                if entregado:
+                    entrada[0].marcar(empleado_id)
+                else:
+                    entrada[0].desmarcar(empleado_id)
+
+    def marcar(self, periodo_id: Optional[int], empleado_id: int):
+        self._registrar(periodo_id, empleado_id, True)
+
+    def desmarcar(self, periodo_id: Optional[int], empleado_id: int):
+        self._registrar(periodo_id, empleado_id, False)
+
+
+entregados = EntregadosPorPeriodo(settings.ENTREGADOS_TTL)
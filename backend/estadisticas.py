@@ -0,0 +1,207 @@
+"""
+ClipControl Backend - Contadores del dashboard en memoria
+
+Los endpoints de estadísticas se consultan cada pocos segundos desde
+cada panel abierto. Los totales se mantienen al día en cada escritura
+(entregas y empleados) y se reconcilian con conteos de la base de datos
+cada ESTADISTICAS_RECONCILIAR segundos, lo que corrige tanto lo escrito
+por otros workers como cualquier desvío.
+"""
+import threading
+import time
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from config import settings
+from entregados import entregados
+
+
+def _inicio_hoy() -> str:
+    return f"{date.today().isoformat()}T00:00:00"
+
+
+class AgregadosEntregas:
+    """
+    Totales de empleados activos y entregas (global, de hoy y por período).
+    Los de cada período y sucursal se siembran la primera vez que se piden.
+    """
+
+    def __init__(self, intervalo_reconciliacion: float):
+        self.intervalo = intervalo_reconciliacion
+        self._empleados_activos = 0
+        self._entregas_total = 0
+        self._hoy = ""
+        self._hoy_planta = 0
+        self._hoy_plazo_fijo = 0
+        self._por_periodo: Dict[int, int] = {}
+        self._por_sucursal: Dict[Tuple[int, int], int] = {}
+        self._empleados_sucursal: Dict[int, int] = {}
+        self._proxima = 0.0
+        self._iniciado = False
+        self._lock = threading.Lock()
+        self._reconciliando = threading.Lock()
+
+    # ------------------------------------------
+    # Conteos en la base de datos
+    # ------------------------------------------
+
+    def _contar(self, query) -> int:
+        return query.limit(1).execute().count or 0
+
+    def _contar_empleados(self, supabase, sucursal_id: Optional[int] = None) -> int:
+        query = supabase.table("empleados").select("id", count="exact").eq("activo", True)
+        if sucursal_id is not None:
+            query = query.eq("sucursal_id", sucursal_id)
+        return self._contar(query)
+
+    def _contar_periodo(self, supabase, periodo_id: int) -> int:
+        return self._contar(supabase.table("entregas").select("id", count="exact").eq("periodo_id", periodo_id))
+
+    def _contar_sucursal(self, supabase, periodo_id: int, sucursal_id: int) -> int:
+        """Entregas del período a empleados de la sucursal"""
+        return self._contar(
+            supabase.table("entregas").select("id, empleados!inner(sucursal_id)", count="exact")
+            .eq("periodo_id", periodo_id).eq("empleados.sucursal_id", sucursal_id)
+        )
+
+    def reconciliar(self, supabase):
+        """Reemplazar los contadores por conteos exactos de la base de datos"""
+        hoy = _inicio_hoy()
+        empleados_activos = self._contar_empleados(supabase)
+        entregas_total = self._contar(supabase.table("entregas").select("id", count="exact"))
+        hoy_total, hoy_planta = self._contar_hoy(supabase, hoy)
+        por_periodo = {periodo_id: self._contar_periodo(supabase, periodo_id) for periodo_id in list(self._por_periodo)}
+        por_sucursal = {clave: self._contar_sucursal(supabase, *clave) for clave in list(self._por_sucursal)}
+        empleados_sucursal = {s: self._contar_empleados(supabase, s) for s in list(self._empleados_sucursal)}
+
+        with self._lock:
+            self._empleados_activos = empleados_activos
+            self._entregas_total = entregas_total
+            self._hoy = hoy
+            self._hoy_planta = hoy_planta
+            self._hoy_plazo_fijo = hoy_total - hoy_planta
+            self._por_periodo.update(por_periodo)
+            self._por_sucursal.update(por_sucursal)
+            self._empleados_sucursal.update(empleados_sucursal)
+            self._proxima = time.monotonic() + self.intervalo
+            self._iniciado = True
+
+    def _al_dia(self, supabase):
+        """Sembrar la primera vez; después reconciliar vencido el intervalo o al cambiar el día"""
+        if self._iniciado and time.monotonic() < self._proxima and self._hoy == _inicio_hoy():
+            return
+        # Un solo hilo reconcilia; el resto responde con los contadores actuales
+        if self._iniciado and not self._reconciliando.acquire(blocking=False):
+            return
+        if not self._iniciado:
+            self._reconciliando.acquire()
+        try:
+            if not self._iniciado or time.monotonic() >= self._proxima or self._hoy != _inicio_hoy():
+                self.reconciliar(supabase)
+        finally:
+            self._reconciliando.release()
+
+    # ------------------------------------------
+    # Escrituras
+    # ------------------------------------------
+
+    def registrar_entrega(self, periodo_id: Optional[int], tipo_contrato: Optional[str],
+                          fecha_hora: Optional[str] = None, delta: int = 1, sucursal_id: Optional[int] = None):
+        """Sumar (delta=1) o restar (delta=-1) una entrega; sin fecha_hora se toma como de hoy"""
+        with self._lock:
+            if not self._iniciado:
+                return
+            self._entregas_total += delta
+            if fecha_hora is None or fecha_hora >= self._hoy:
+                if tipo_contrato == "PLANTA":
+                    self._hoy_planta += delta
+                else:
+                    self._hoy_plazo_fijo += delta
+            if periodo_id in self._por_periodo:
+                self._por_periodo[periodo_id] += delta
+            if (periodo_id, sucursal_id) in self._por_sucursal:
+                self._por_sucursal[(periodo_id, sucursal_id)] += delta
+
+    def _contar_hoy(self, supabase, hoy: str) -> Tuple[int, int]:
+        """(total, de planta) de las entregas de hoy"""
+        total = self._contar(supabase.table("entregas").select("id", count="exact").gte("fecha_hora", hoy))
+        planta = self._contar(
+            supabase.table("entregas").select("id, empleados!inner(tipo_contrato)", count="exact")
+            .gte("fecha_hora", hoy).eq("empleados.tipo_contrato", "PLANTA")
+        )
+        return total, planta
+
+    def recontar_empleados(self, supabase, reasignados: bool = False):
+        """
+        Después de crear o modificar empleados. Con `reasignados` (cambió su
+        sucursal o tipo de contrato) se recuentan también las entregas por
+        sucursal y por contrato, que se agrupan por el empleado actual.
+        """
+        if not self._iniciado:
+            return
+        total = self._contar_empleados(supabase)
+        por_sucursal = {s: self._contar_empleados(supabase, s) for s in list(self._empleados_sucursal)}
+        if reasignados:
+            hoy = self._hoy
+            hoy_total, hoy_planta = self._contar_hoy(supabase, hoy)
+            entregas_sucursal = {clave: self._contar_sucursal(supabase, *clave) for clave in list(self._por_sucursal)}
+        with self._lock:
+            self._empleados_activos = total
+            self._empleados_sucursal.update(por_sucursal)
+            if reasignados and self._hoy == hoy:
+                self._hoy_planta = hoy_planta
+                self._hoy_plazo_fijo = hoy_total - hoy_planta
+            if reasignados:
+                self._por_sucursal.update(entregas_sucursal)
+
+    # ------------------------------------------
+    # Lecturas
+    # ------------------------------------------
+
+    def instantanea(self, periodo_id: Optional[int] = None, sucursal_id: Optional[int] = None) -> Optional[dict]:
+        """Contadores actuales sin tocar la base de datos (None si aún no se siembran)"""
+        if not self._iniciado:
+            return None
+        with self._lock:
+            datos = {
+                "empleados_activos": self._empleados_activos,
+                "entregas_total": self._entregas_total,
+                "entregas_hoy": self._hoy_planta + self._hoy_plazo_fijo,
+                "hoy_planta": self._hoy_planta,
+                "hoy_plazo_fijo": self._hoy_plazo_fijo,
+            }
+            if periodo_id is not None:
+                datos["entregas_periodo"] = self._por_periodo.get(periodo_id)
+            if periodo_id is not None and sucursal_id is not None:
+                datos["sucursal_id"] = sucursal_id
+                datos["empleados_sucursal"] = self._empleados_sucursal.get(sucursal_id)
+                datos["entregas_sucursal"] = self._por_sucursal.get((periodo_id, sucursal_id))
+
+        if periodo_id is not None:
+            conjunto = entregados.cargado(periodo_id)
+            datos["empleados_retiraron"] = conjunto.total() if conjunto else None
+        return datos
+
+    def resumen(self, supabase, periodo_id: Optional[int] = None, sucursal_id: Optional[int] = None) -> dict:
+        self._al_dia(supabase)
+
+        # Sembrar lo que falte del período y la sucursal pedidos
+        if periodo_id is not None:
+            entregados.conjunto(supabase, periodo_id)
+            if periodo_id not in self._por_periodo:
+                contado = self._contar_periodo(supabase, periodo_id)
+                with self._lock:
+                    self._por_periodo.setdefault(periodo_id, contado)
+            if sucursal_id is not None and (periodo_id, sucursal_id) not in self._por_sucursal:
+                contado = self._contar_sucursal(supabase, periodo_id, sucursal_id)
+                with self._lock:
+                    self._por_sucursal.setdefault((periodo_id, sucursal_id), contado)
+            if sucursal_id is not None and sucursal_id not in self._empleados_sucursal:
+                contado = self._contar_empleados(supabase, sucursal_id)
+                with self._lock:
+                    self._empleados_sucursal.setdefault(sucursal_id, contado)
+
+        return self.instantanea(periodo_id, sucursal_id)
+
+
+agregados = AgregadosEntregas(settings.ESTADISTICAS_RECONCILIAR)
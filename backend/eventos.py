@@ -0,0 +1,153 @@
+"""
+ClipControl Backend - Eventos en vivo para el dashboard (Server-Sent Events)
+
+Un solo hub por worker: cada entrega registrada o anulada se serializa una
+vez y se copia a la cola de cada panel suscrito al período (y sucursal).
+Cada EVENTOS_INTERVALO segundos el hub también envía los contadores de
+cada período/sucursal con suscriptores, calculados una vez por clave; así
+los paneles ven además lo registrado por otros workers.
+"""
+import asyncio
+import json
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from estadisticas import agregados
+
+
+def _mensaje_sse(tipo: str, datos: dict) -> str:
+    return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
+
+class _Suscripcion:
+    __slots__ = ("periodo_id", "sucursal_id", "cola")
+
+    def __init__(self, periodo_id: int, sucursal_id: Optional[int], max_cola: int):
+        self.periodo_id = periodo_id
+        self.sucursal_id = sucursal_id
+        self.cola = asyncio.Queue(maxsize=max_cola)
+
+    def acepta(self, periodo_id: Optional[int], sucursal_id: Optional[int]) -> bool:
+        return periodo_id == self.periodo_id and self.sucursal_id in (None, sucursal_id)
+
+
+class HubEventos:
+    """Difusión de eventos de entregas a los paneles suscritos en este worker"""
+
+    def __init__(self, intervalo: float, max_cola: int):
+        self.intervalo = intervalo
+        self.max_cola = max_cola
+        self._suscripciones = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tarea: Optional[asyncio.Task] = None
+
+    def iniciar(self, supabase):
+        self._loop = asyncio.get_running_loop()
+        self._tarea = self._loop.create_task(self._enviar_contadores(supabase))
+
+    async def detener(self):
+        if self._tarea:
+            self._tarea.cancel()
+            try:
+                await self._tarea
+            except asyncio.CancelledError:
+                pass
+            self._tarea = None
+        for suscripcion in list(self._suscripciones):
+            self._cerrar(suscripcion)
+
+    @property
+    def suscriptores(self) -> int:
+        return len(self._suscripciones)
+
+    # ------------------------------------------
+    # Publicación (desde cualquier hilo)
+    # ------------------------------------------
+
+    def publicar_entrega(self, accion: str, entrega: dict, periodo_id: Optional[int], sucursal_id: Optional[int]):
+        """
+        accion: "registrada" o "anulada". Se llama después de confirmar la
+        escritura; los contadores ya incluyen el cambio.
+        """
+        if not self._loop or not self._suscripciones:
+            return
+        datos = {
+            "accion": accion,
+            "periodo_id": periodo_id,
+            "sucursal_id": sucursal_id,
+            "entrega": entrega,
+            "contadores": agregados.instantanea(periodo_id, sucursal_id)
+        }
+        mensaje = _mensaje_sse("entrega", datos)
+        try:
+            self._loop.call_soon_threadsafe(self._difundir, mensaje, periodo_id, sucursal_id)
+        except RuntimeError:
+            # El loop ya se cerró (apagado del worker)
+            pass
+
+    def _difundir(self, mensaje: str, periodo_id: Optional[int], sucursal_id: Optional[int]):
+        for suscripcion in list(self._suscripciones):
+            if suscripcion.acepta(periodo_id, sucursal_id):
+                self._encolar(suscripcion, mensaje)
+
+    def _encolar(self, suscripcion: _Suscripcion, mensaje: str):
+        try:
+            suscripcion.cola.put_nowait(mensaje)
+        except asyncio.QueueFull:
+            # Panel que no alcanza a leer: se corta y el navegador reconecta con datos frescos
+            print(f"⚠️ Suscriptor de eventos atrasado (período {suscripcion.periodo_id}), se desconecta")
+            self._cerrar(suscripcion)
+
+    def _cerrar(self, suscripcion: _Suscripcion):
+        self._suscripciones.discard(suscripcion)
+        while not suscripcion.cola.empty():
+            suscripcion.cola.get_nowait()
+        suscripcion.cola.put_nowait(None)
+
+    # ------------------------------------------
+    # Contadores periódicos
+    # ------------------------------------------
+
+    async def _enviar_contadores(self, supabase):
+        while True:
+            await asyncio.sleep(self.intervalo)
+            claves = {(s.periodo_id, s.sucursal_id) for s in self._suscripciones}
+            for periodo_id, sucursal_id in claves:
+                try:
+                    datos = await run_in_threadpool(agregados.resumen, supabase, periodo_id, sucursal_id)
+                except Exception as e:
+                    print(f"❌ Error calculando contadores para eventos: {e}")
+                    continue
+                mensaje = _mensaje_sse("contadores", datos)
+                for suscripcion in list(self._suscripciones):
+                    if (suscripcion.periodo_id, suscripcion.sucursal_id) == (periodo_id, sucursal_id):
+                        self._encolar(suscripcion, mensaje)
+
+    # ------------------------------------------
+    # Suscripción (un generador por conexión SSE)
+    # ------------------------------------------
+
+    async def suscribir(self, supabase, periodo_id: int, sucursal_id: Optional[int] = None):
+        """Generador de mensajes SSE: contadores iniciales y luego cada evento"""
+        suscripcion = _Suscripcion(periodo_id, sucursal_id, self.max_cola)
+        self._suscripciones.add(suscripcion)
+        try:
+            datos = await run_in_threadpool(agregados.resumen, supabase, periodo_id, sucursal_id)
+            yield f"retry: 3000\n{_mensaje_sse('contadores', datos)}"
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(suscripcion.cola.get(), timeout=self.intervalo * 2)
+                except asyncio.TimeoutError:
+                    # Sin contadores ni eventos: comentario SSE para que proxies no corten la conexión
+                    yield ": ping\n\n"
+                    continue
+                if mensaje is None:
+                    return
+                yield mensaje
+        finally:
+            self._suscripciones.discard(suscripcion)
+
+
+hub_eventos = HubEventos(settings.EVENTOS_INTERVALO, settings.EVENTOS_COLA_MAX)
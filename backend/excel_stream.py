@@ -0,0 +1,150 @@
+"""
+ClipControl Backend - Excel (XLSX) generado y enviado por partes
+
+Hoja única de solo escritura armada directamente sobre un ZIP en modo
+streaming (como stream_zip en qr_render): cada página de filas se comprime
+y se envía al cliente apenas se escribe, así la memoria no crece con la
+cantidad de filas. El ancho de cada columna se calcula con el encabezado y
+la primera página, porque en el XML de la hoja las columnas van antes que
+los datos.
+"""
+import re
+import zipfile
+from typing import Iterable, List, Sequence
+from xml.sax.saxutils import escape
+
+from qr_render import SalidaStream
+
+ANCHO_MAXIMO = 50
+
+_CONTROL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+# Estilo 1: encabezado en negrita blanca sobre azul (4472C4), centrado
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><color rgb="FFFFFFFF"/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="3"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FF4472C4"/><bgColor rgb="FF4472C4"/></patternFill></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1" applyAlignment="1">'
+    '<alignment horizontal="center" vertical="center"/></xf></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+
+def _columna(indice: int) -> str:
+    """0 -> A, 25 -> Z, 26 -> AA"""
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _texto(valor) -> str:
+    return "" if valor is None else _CONTROL.sub("", str(valor))
+
+
+def _fila_xml(numero: int, valores: Sequence, estilo: int = 0) -> str:
+    celdas = []
+    atributo_estilo = f' s="{estilo}"' if estilo else ""
+    for indice, valor in enumerate(valores):
+        texto = _texto(valor)
+        if not texto and not estilo:
+            continue
+        celdas.append(
+            f'<c r="{_columna(indice)}{numero}" t="inlineStr"{atributo_estilo}>'
+            f'<is><t xml:space="preserve">{escape(texto)}</t></is></c>'
+        )
+    return f'<row r="{numero}">{"".join(celdas)}</row>'
+
+
+def stream_xlsx(titulo: str, encabezados: List[str], paginas: Iterable[List[Sequence]]):
+    """
+    Emitir un XLSX de una hoja: `paginas` entrega listas de filas (listas de
+    valores en el orden de `encabezados`). Cada página se envía al terminar de escribirla.
+    """
+    salida = SalidaStream()
+    paginas = iter(paginas)
+    primera = next(paginas, [])
+
+    anchos = [len(encabezado) for encabezado in encabezados]
+    for fila in primera:
+        for indice, valor in enumerate(fila):
+            anchos[indice] = max(anchos[indice], len(_texto(valor)))
+
+    workbook = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(titulo[:31], {chr(34): "&quot;"})}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _RELS)
+        zf.writestr("xl/workbook.xml", workbook)
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+        yield salida.vaciar()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as hoja:
+            columnas = "".join(
+                f'<col min="{i + 1}" max="{i + 1}" width="{min(ancho + 2, ANCHO_MAXIMO)}" customWidth="1"/>'
+                for i, ancho in enumerate(anchos)
+            )
+            hoja.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                f'<cols>{columnas}</cols><sheetData>'
+                + _fila_xml(1, encabezados, estilo=1)
+            ).encode("utf-8"))
+
+            numero = 1
+            pagina = primera
+            while True:
+                partes = []
+                for fila in pagina:
+                    numero += 1
+                    partes.append(_fila_xml(numero, fila))
+                hoja.write("".join(partes).encode("utf-8"))
+                yield salida.vaciar()
+                pagina = next(paginas, None)
+                if pagina is None:
+                    break
+
+            hoja.write(b"</sheetData></worksheet>")
+    yield salida.vaciar()
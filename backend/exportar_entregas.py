@@ -0,0 +1,111 @@
+"""
+ClipControl Backend - Exportación de entregas (CSV / JSONL)
+
+Las entregas se leen por páginas con cursor (fecha_hora, id) y cada página
+se envía al cliente apenas llega, así exportar un año completo usa memoria
+constante. Los filtros de sucursal y tipo de contrato van a la base de datos
+por el join `empleados!inner`; la foto no se exporta.
+"""
+import csv
+import io
+import json
+from typing import Optional
+
+from paginacion import filtro_keyset_desc
+
+FORMATOS_EXPORTACION = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+}
+
+COLUMNAS_ENTREGA = (
+    "id, fecha_hora, periodo_id, usuario_id, guardia, tipo_caja, metodo, estado, "
+    "dispositivo_id, duracion_escaneo, observaciones"
+)
+
+CAMPOS = (
+    "id", "fecha_hora", "periodo_id", "rut", "nombre", "apellido", "tipo_contrato",
+    "sucursal_id", "sucursal", "usuario_id", "guardia", "tipo_caja", "metodo", "estado",
+    "dispositivo_id", "duracion_escaneo", "observaciones"
+)
+
+
+def consulta_entregas(
+    supabase,
+    columnas: str = COLUMNAS_ENTREGA,
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    sucursal_id: Optional[int] = None,
+    tipo_contrato: Optional[str] = None
+):
+    """Select de entregas con su empleado y sucursal, con todos los filtros en la base de datos"""
+    query = supabase.table("entregas").select(
+        f"{columnas}, empleados!inner(id, rut, nombre, apellido, tipo_contrato, sucursal_id, sucursales(nombre))"
+    )
+    if fecha_inicio:
+        query = query.gte("fecha_hora", f"{fecha_inicio}T00:00:00")
+    if fecha_fin:
+        query = query.lte("fecha_hora", f"{fecha_fin}T23:59:59")
+    if sucursal_id:
+        query = query.eq("empleados.sucursal_id", sucursal_id)
+    if tipo_contrato:
+        query = query.eq("empleados.tipo_contrato", tipo_contrato)
+    return query
+
+
+def paginas_keyset(construir_query, tamano: int = 1000):
+    """
+    Recorrer por (fecha_hora, id) descendente: cada página pide las filas
+    estrictamente después de la última, sin offsets que crezcan.
+    """
+    ultima = None
+    while True:
+        query = construir_query()
+        if ultima:
+            query = query.or_(filtro_keyset_desc("fecha_hora", ultima["fecha_hora"], ultima["id"]))
+        filas = query.order("fecha_hora", desc=True).order("id", desc=True).limit(tamano).execute().data or []
+        if filas:
+            yield filas
+        if len(filas) < tamano:
+            break
+        ultima = filas[-1]
+
+
+def aplanar(entrega: dict) -> dict:
+    """Fila de exportación: la entrega con los datos del empleado y el nombre de la sucursal"""
+    empleado = entrega.get("empleados") or {}
+    sucursal = empleado.get("sucursales") or {}
+    fila = {campo: entrega.get(campo) for campo in CAMPOS}
+    fila.update({
+        "rut": empleado.get("rut"),
+        "nombre": empleado.get("nombre"),
+        "apellido": empleado.get("apellido"),
+        "tipo_contrato": empleado.get("tipo_contrato"),
+        "sucursal_id": empleado.get("sucursal_id"),
+        "sucursal": sucursal.get("nombre")
+    })
+    return fila
+
+
+def stream_csv(paginas):
+    """CSV con BOM (para que Excel reconozca UTF-8), una página por envío"""
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=CAMPOS)
+    buffer.write("﻿")
+    escritor.writeheader()
+    yield buffer.getvalue()
+    for pagina in paginas:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows(aplanar(entrega) for entrega in pagina)
+        yield buffer.getvalue()
+
+
+def stream_jsonl(paginas):
+    for pagina in paginas:
+        yield "".join(json.dumps(aplanar(entrega), ensure_ascii=False, default=str) + "\n" for entrega in pagina)
+
+
+def stream_exportacion(supabase, formato: str, **filtros):
+    paginas = paginas_keyset(lambda: consulta_entregas(supabase, **filtros))
+    return stream_csv(paginas) if formato == "csv" else stream_jsonl(paginas)
@@ -0,0 +1,424 @@
+"""
+ClipControl Backend - Almacenamiento de fotos de entrega
+
+Las fotos se guardan fuera de la tabla entregas, direccionadas por el
+SHA-256 de su contenido: la fila solo guarda la referencia "sha256:<hex>"
+y una foto repetida se almacena una sola vez.
+
+Como una misma foto puede estar guardada para una entrega cuya fila aún
+no existe, nada se borra al momento: LimpiezaFotos barre cada
+FOTOS_LIMPIEZA_INTERVALO segundos las fotos sin uso hace más de
+FOTOS_LIMPIEZA_GRACIA segundos que ninguna entrega referencia.
+"""
+import base64
+import hashlib
+import io
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from config import settings
+
+PREFIJO_REF = "sha256:"
+TAMANO_BLOQUE = 64 * 1024
+_HEX = re.compile(r"^[0-9a-f]{64}$")
+
+
+def es_referencia(valor: Optional[str]) -> bool:
+    return bool(valor) and valor.startswith(PREFIJO_REF)
+
+
+def hash_de_referencia(ref: str) -> Optional[str]:
+    """Extraer y validar el hash de una referencia (o de un hash suelto)"""
+    digest = ref[len(PREFIJO_REF):] if ref.startswith(PREFIJO_REF) else ref
+    return digest if _HEX.match(digest) else None
+
+
+class AlmacenFotos(ABC):
+    """Interfaz de almacenamiento de fotos direccionado por contenido"""
+
+    @abstractmethod
+    def guardar(self, archivo: BinaryIO) -> dict:
+        """Guardar el contenido de un archivo leyéndolo por bloques. Retorna ref, bytes y si era nuevo"""
+
+    @abstractmethod
+    def abrir(self, ref: str) -> BinaryIO:
+        """Abrir una foto guardada para lectura"""
+
+    @abstractmethod
+    def existe(self, ref: str) -> bool:
+        ...
+
+    @abstractmethod
+    def listar(self) -> Iterator[Tuple[str, float]]:
+        """(ref, último uso como timestamp) de cada foto guardada"""
+
+    @abstractmethod
+    def eliminar_si_sin_uso(self, ref: str, desde: float) -> bool:
+        """
+        Eliminar la foto y su miniatura salvo que se haya usado desde `desde`
+        (un `guardar` de los mismos bytes cuenta como uso). True si se eliminó
+        """
+
+    @abstractmethod
+    def guardar_miniatura(self, ref: str, datos: bytes):
+        """Guardar la miniatura asociada a una foto"""
+
+    @abstractmethod
+    def abrir_miniatura(self, ref: str) -> BinaryIO:
+        ...
+
+
+class AlmacenFotosLocal(AlmacenFotos):
+    """Fotos en el sistema de archivos local: <directorio>/ab/cd/<hash>.jpg"""
+
+    def __init__(self, directorio: str):
+        self.directorio = os.path.abspath(directorio)
+        self.directorio_tmp = os.path.join(self.directorio, "tmp")
+        os.makedirs(self.directorio_tmp, exist_ok=True)
+
+    def ruta(self, ref: str) -> str:
+        digest = hash_de_referencia(ref)
+        if not digest:
+            raise ValueError(f"Referencia de foto inválida: {ref}")
+        return os.path.join(self.directorio, digest[:2], digest[2:4], f"{digest}.jpg")
+
+    def guardar(self, archivo: BinaryIO) -> dict:
+        sha = hashlib.sha256()
+        total = 0
+
+        # Copiar por bloques a un temporal mientras se calcula el hash
+        fd, ruta_tmp = tempfile.mkstemp(dir=self.directorio_tmp, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as destino:
+                while True:
+                    bloque = archivo.read(TAMANO_BLOQUE)
+                    if not bloque:
+                        break
+                    sha.update(bloque)
+                    destino.write(bloque)
+                    total += len(bloque)
+
+            ref = PREFIJO_REF + sha.hexdigest()
+            ruta_final = self.ruta(ref)
+
+            # Marcar el uso: la limpieza no borra fotos usadas hace poco.
+            # Si justo se estaba borrando, se vuelve a guardar
+            try:
+                os.utime(ruta_final)
+                os.remove(ruta_tmp)
+                return {"ref": ref, "bytes": total, "nuevo": False}
+            except FileNotFoundError:
+                pass
+
+            os.makedirs(os.path.dirname(ruta_final), exist_ok=True)
+            os.replace(ruta_tmp, ruta_final)
+            return {"ref": ref, "bytes": total, "nuevo": True}
+        except Exception:
+            if os.path.exists(ruta_tmp):
+                os.remove(ruta_tmp)
+            raise
+
+    def abrir(self, ref: str) -> BinaryIO:
+        return open(self.ruta(ref), "rb")
+
+    def existe(self, ref: str) -> bool:
+        return os.path.exists(self.ruta(ref))
+
+    def listar(self) -> Iterator[Tuple[str, float]]:
+        for raiz, directorios, archivos in os.walk(self.directorio):
+            if raiz == self.directorio:
+                directorios[:] = [d for d in directorios if d != "tmp"]
+            for archivo in archivos:
+                digest = archivo[:-len(".jpg")]
+                if archivo.endswith(".jpg") and _HEX.match(digest):
+                    try:
+                        yield PREFIJO_REF + digest, os.stat(os.path.join(raiz, archivo)).st_mtime
+                    except FileNotFoundError:
+                        continue
+
+    def eliminar_si_sin_uso(self, ref: str, desde: float) -> bool:
+        ruta = self.ruta(ref)
+        # Apartarla primero: un `guardar` concurrente o ya tocó la foto
+        # (y se restaura) o no la encuentra y la vuelve a escribir
+        apartada = os.path.join(self.directorio_tmp, f"{hash_de_referencia(ref)}.borrar")
+        try:
+            os.rename(ruta, apartada)
+        except FileNotFoundError:
+            return False
+        if os.stat(apartada).st_mtime >= desde:
+            os.replace(apartada, ruta)
+            return False
+        os.remove(apartada)
+        try:
+            os.remove(self.ruta_miniatura(ref))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def ruta_miniatura(self, ref: str) -> str:
+        return self.ruta(ref)[:-len(".jpg")] + ".thumb.jpg"
+
+    def guardar_miniatura(self, ref: str, datos: bytes):
+        ruta = self.ruta_miniatura(ref)
+        ruta_tmp = ruta + ".part"
+        with open(ruta_tmp, "wb") as destino:
+            destino.write(datos)
+        os.replace(ruta_tmp, ruta)
+
+    def abrir_miniatura(self, ref: str) -> BinaryIO:
+        return open(self.ruta_miniatura(ref), "rb")
+
+
+_almacen: Optional[AlmacenFotos] = None
+
+
+def get_almacen_fotos() -> AlmacenFotos:
+    """Crear (una vez) el almacén configurado en FOTOS_BACKEND"""
+    global _almacen
+    if _almacen is None:
+        if settings.FOTOS_BACKEND == "local":
+            _almacen = AlmacenFotosLocal(settings.FOTOS_DIR)
+        else:
+            raise ValueError(f"FOTOS_BACKEND no soportado: {settings.FOTOS_BACKEND}")
+    return _almacen
+
+
+# ==========================================
+# INGESTA: NORMALIZAR FOTOS FUERA DEL REQUEST
+# ==========================================
+
+def normalizar_foto(datos: BinaryIO) -> tuple:
+    """
+    Limitar resolución, recomprimir y quitar EXIF (aplicando antes la orientación).
+    Retorna (jpeg_normalizado, jpeg_miniatura).
+    """
+    with Image.open(datos) as original:
+        # Decodificar el JPEG ya reducido (escala 1/2, 1/4, 1/8) cuando es posible
+        original.draft("RGB", (settings.FOTOS_MAX_LADO, settings.FOTOS_MAX_LADO))
+        imagen = ImageOps.exif_transpose(original).convert("RGB")
+
+    imagen.thumbnail((settings.FOTOS_MAX_LADO, settings.FOTOS_MAX_LADO), Image.LANCZOS)
+    normalizada = io.BytesIO()
+    imagen.save(normalizada, format="JPEG", quality=settings.FOTOS_CALIDAD, optimize=True, progressive=True)
+
+    imagen.thumbnail((settings.FOTOS_LADO_MINIATURA, settings.FOTOS_LADO_MINIATURA), Image.LANCZOS)
+    miniatura = io.BytesIO()
+    imagen.save(miniatura, format="JPEG", quality=settings.FOTOS_CALIDAD, optimize=True)
+
+    return normalizada.getvalue(), miniatura.getvalue()
+
+
+class IngestaFotos:
+    """
+    Pool acotado de workers que normaliza las fotos ya guardadas y
+    reemplaza la referencia en la fila de entregas. La cola tiene tamaño
+    máximo: si está llena, `encolar` espera un poco y luego se rinde, y
+    la entrega se queda con la foto original.
+    """
+
+    def __init__(self, workers: int, tamano_cola: int):
+        self.workers = max(1, workers)
+        self.cola = queue.Queue(maxsize=max(1, tamano_cola))
+        self._hilos = []
+
+    def iniciar(self):
+        if self._hilos:
+            return
+        for i in range(self.workers):
+            hilo = threading.Thread(target=self._trabajar, name=f"ingesta-fotos-{i}", daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+
+    def detener(self):
+        for _ in self._hilos:
+            self.cola.put(None)
+        for hilo in self._hilos:
+            hilo.join(timeout=5)
+        self._hilos = []
+
+    def encolar(self, supabase, entrega_id: int, ref: str, espera: Optional[float] = None) -> bool:
+        """Encolar una foto para normalizar. Retorna False si la cola siguió llena"""
+        espera = settings.FOTOS_INGESTA_ESPERA if espera is None else espera
+        try:
+            self.cola.put((supabase, entrega_id, ref), timeout=espera)
+            return True
+        except queue.Full:
+            print(f"⚠️ Cola de ingesta llena, foto de entrega {entrega_id} queda sin normalizar")
+            return False
+
+    def _trabajar(self):
+        while True:
+            trabajo = self.cola.get()
+            try:
+                if trabajo is None:
+                    return
+                self.procesar(*trabajo)
+            except Exception as e:
+                print(f"❌ Error normalizando foto: {e}")
+            finally:
+                self.cola.task_done()
+
+    def procesar(self, supabase, entrega_id: int, ref: str):
+        almacen = get_almacen_fotos()
+        with almacen.abrir(ref) as original:
+            normalizada, miniatura = normalizar_foto(original)
+
+        guardada = almacen.guardar(io.BytesIO(normalizada))
+        almacen.guardar_miniatura(guardada["ref"], miniatura)
+
+        # El original queda sin referencia y lo borra LimpiezaFotos
+        if guardada["ref"] != ref:
+            supabase.table("entregas").update({"foto_entrega": guardada["ref"]}).eq("id", entrega_id).execute()
+
+        print(f"🗜️ Foto de entrega {entrega_id} normalizada: {guardada['bytes']} bytes")
+
+
+ingesta_fotos = IngestaFotos(settings.FOTOS_INGESTA_WORKERS, settings.FOTOS_INGESTA_COLA)
+
+
+# ==========================================
+# LIMPIEZA DE FOTOS SIN REFERENCIA
+# ==========================================
+
+class LimpiezaFotos:
+    """
+    Hilo que cada `intervalo` segundos borra las fotos que ninguna entrega
+    referencia (originales ya normalizados, subidas cuya entrega falló).
+    Solo considera las que llevan más de `gracia` segundos sin usarse, así
+    no alcanza a una foto recién guardada cuya fila aún no se inserta.
+    """
+
+    def __init__(self, intervalo: float, gracia: float, tamano_bloque: int = 200):
+        self.intervalo = intervalo
+        self.gracia = gracia
+        self.tamano_bloque = tamano_bloque
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self, supabase):
+        if self._hilo:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._trabajar, args=(supabase,), name="limpieza-fotos", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if not self._hilo:
+            return
+        self._detener.set()
+        self._hilo.join(timeout=5)
+        self._hilo = None
+
+    def _trabajar(self, supabase):
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.barrer(supabase)
+            except Exception as e:
+                print(f"❌ Error limpiando fotos: {e}")
+
+    def barrer(self, supabase) -> int:
+        """Borrar las fotos sin uso reciente ni referencia. Retorna cuántas se borraron"""
+        almacen = get_almacen_fotos()
+        desde = time.time() - self.gracia
+        candidatas = [ref for ref, uso in almacen.listar() if uso < desde]
+
+        eliminadas = 0
+        for inicio in range(0, len(candidatas), self.tamano_bloque):
+            bloque = candidatas[inicio:inicio + self.tamano_bloque]
+            usadas = {
+                fila["foto_entrega"] for fila in
+                supabase.table("entregas").select("foto_entrega").in_("foto_entrega", bloque).execute().data or []
+            }
+            for ref in bloque:
+                if ref not in usadas and almacen.eliminar_si_sin_uso(ref, desde):
+                    eliminadas += 1
+
+        if eliminadas:
+            print(f"🧹 Fotos sin referencia eliminadas: {eliminadas}")
+        return eliminadas
+
+
+limpieza_fotos = LimpiezaFotos(settings.FOTOS_LIMPIEZA_INTERVALO, settings.FOTOS_LIMPIEZA_GRACIA)
+
+
+# ==========================================
+# LECTURA DE VARIANTES (COMPLETA / MINIATURA)
+# ==========================================
+
+VARIANTES = ("completa", "miniatura")
+
+
+class CacheMiniaturas:
+    """LRU en memoria de miniaturas calientes, acotada por bytes totales"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: str) -> Optional[bytes]:
+        with self._lock:
+            datos = self._datos.get(clave)
+            if datos is not None:
+                self._datos.move_to_end(clave)
+            return datos
+
+    def guardar(self, clave: str, datos: bytes):
+        if len(datos) > self.max_bytes:
+            return
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes_usados -= len(anterior)
+            self._datos[clave] = datos
+            self.bytes_usados += len(datos)
+            while self.bytes_usados > self.max_bytes:
+                _, expulsado = self._datos.popitem(last=False)
+                self.bytes_usados -= len(expulsado)
+
+
+cache_miniaturas = CacheMiniaturas(settings.FOTOS_CACHE_MB * 1024 * 1024)
+
+
+def leer_variante(foto_entrega: str, variante: str) -> tuple:
+    """
+    Leer una variante de la foto de una entrega. Retorna (datos, etag).
+    Soporta referencias del almacén y data URIs antiguos (se sirven completos).
+    """
+    if foto_entrega.startswith("data:"):
+        datos = base64.b64decode(foto_entrega.split(",", 1)[1])
+        return datos, hashlib.sha256(datos).hexdigest()
+
+    digest = hash_de_referencia(foto_entrega)
+    if not digest:
+        raise ValueError("Referencia de foto inválida")
+
+    almacen = get_almacen_fotos()
+
+    if variante == "miniatura":
+        clave = f"{digest}-miniatura"
+        datos = cache_miniaturas.obtener(clave)
+        if datos is None:
+            try:
+                with almacen.abrir_miniatura(digest) as archivo:
+                    datos = archivo.read()
+            except FileNotFoundError:
+                # Foto aún sin normalizar: generar la miniatura ahora y dejarla guardada
+                with almacen.abrir(digest) as original:
+                    _, datos = normalizar_foto(original)
+                almacen.guardar_miniatura(digest, datos)
+            cache_miniaturas.guardar(clave, datos)
+        return datos, clave
+
+    with almacen.abrir(digest) as archivo:
+        return archivo.read(), digest
@@ -2,21 +2,20 @@
 ClipControl Backend - API Principal
 """
 
-from fastapi import FastAPI, HTTPException, Form, File, UploadFile
+from fastapi import FastAPI, HTTPException, Form, File, UploadFile, Request, Response, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from typing import List, Optional
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional, Union
 from datetime import datetime, date, timedelta
-import bcrypt
 import hashlib
 import secrets
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment
 from fastapi.responses import StreamingResponse
-import io
+import itertools
 
 from config import settings
-from database import get_supabase
+from database import get_supabase, iterar_paginas
+from database_async import get_supabase_async, cerrar_supabase_async
 from models import (
     LoginRequest, LoginResponse, MessageResponse,
     EmpleadoCreate, EmpleadoUpdate,
@@ -24,8 +23,27 @@ from models import (
     ValidarRetiroRequest, ValidarRetiroResponse,
     PeriodoCreate,
     UsuarioCreate, UsuarioUpdate,
-    GenerarQRMasivoRequest,
+    GenerarQRMasivoRequest, RenderQRRequest,
 )
+from qr_masivo import generar_tokens_masivo, stream_tokens_masivo, FORMATOS_STREAM
+from qr_render import stream_pdf, stream_zip, detener_pool as detener_pool_render
+from excel_stream import stream_xlsx
+from exportar_entregas import stream_exportacion, consulta_entregas, paginas_keyset, FORMATOS_EXPORTACION
+from qr_firma import firmar_token, es_token_firmado, verificar_token, tokens_usados
+from paginacion import decodificar_cursor, pagina_con_cursor, filtro_keyset_desc, hay_mas
+from fotos import get_almacen_fotos, hash_de_referencia, ingesta_fotos, limpieza_fotos, leer_variante, VARIANTES
+from periodos import cache_periodos
+from ruts import normalizar_rut, indice_rut, precargar_en_segundo_plano
+from entregados import entregados
+from estadisticas import agregados
+from eventos import hub_eventos
+from rollups import rollups, RollupsNoListos
+from nomina import importar_nomina
+from claves import pool_claves, registro_accesos, PoolSaturado
+from autenticacion import crear_token_acceso, usuario_opcional, UsuarioToken
+from permissions import requiere_permiso
+from traspaso_sindicato import traspasar_no_retiradas, stream_traspaso, TraspasoEnCurso
+from metricas import registro as registro_metricas, MiddlewareMetricas, FOTO_BYTES, QR_VALIDACIONES
 
 # Obtener cliente de Supabase
 supabase = get_supabase()
@@ -45,8 +63,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Resultados-Truncados"],
 )
 
+# Latencia y consultas a la BD por ruta (ver /metrics)
+app.add_middleware(MiddlewareMetricas)
+
+@app.on_event("startup")
+def cargar_estado_en_memoria():
+    """Sembrar los conjuntos en memoria usados en la validación de QR"""
+    try:
+        total = tokens_usados.cargar(supabase)
+        print(f"🔐 Tokens QR usados en memoria: {total}")
+    except Exception as e:
+        print(f"❌ Error cargando tokens usados: {e}")
+    
+    precargar_en_segundo_plano(supabase)
+    ingesta_fotos.iniciar()
+    limpieza_fotos.iniciar(supabase)
+    registro_accesos.iniciar(supabase)
+    rollups.iniciar(supabase)
+    pool_claves.calibrar_en_segundo_plano()
+
+
+@app.on_event("startup")
+async def iniciar_eventos():
+    hub_eventos.iniciar(supabase)
+
+
+@app.on_event("shutdown")
+async def detener_workers():
+    ingesta_fotos.detener()
+    limpieza_fotos.detener()
+    registro_accesos.detener()
+    rollups.detener()
+    pool_claves.detener()
+    detener_pool_render()
+    await hub_eventos.detener()
+    await cerrar_supabase_async()
+
 # ==========================================
 # RUTAS SALUD
 # ==========================================
@@ -77,29 +132,38 @@ def health_check():
             content={"status": "unhealthy", "error": str(e)}
         )
 
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return Response(
+        content=registro_metricas.exponer(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 # ==========================================
 # LOGIN
 # ==========================================
 
 @app.post("/api/auth/login", response_model=LoginResponse)
-def login(request: LoginRequest):
+async def login(request: LoginRequest):
     """Login de usuario"""
     try:
-        supabase = get_supabase()
+        db = get_supabase_async()
         
         # Buscar usuario
-        result = supabase.table("usuarios").select("*").eq("username", request.username).execute()
+        result = await db.table("usuarios").select("*").eq("username", request.username).execute()
         
         if not result.data or len(result.data) == 0:
             raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
         
         user = result.data[0]
         
-        # Verificar contraseña
-        password_match = bcrypt.checkpw(
-            request.password.encode('utf-8'),
-            user['password_hash'].encode('utf-8')
-        )
+        # Verificar contraseña (pool propio de bcrypt)
+        try:
+            password_match = await pool_claves.verificar(request.password, user['password_hash'])
+        except PoolSaturado as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
         
         if not password_match:
             raise HTTPException(status_code=401, detail="Usuario o contraseña incorrectos")
@@ -108,13 +172,13 @@ def login(request: LoginRequest):
         if not user.get('activo', True):
             raise HTTPException(status_code=401, detail="Usuario inactivo")
         
-        # Actualizar último acceso
-        supabase.table("usuarios").update({
-            "ultimo_acceso": datetime.now().isoformat()
-        }).eq("id", user['id']).execute()
+        # Último acceso (se escribe por lotes) y rehash si el costo cambió
+        registro_accesos.anotar(user['id'])
+        if pool_claves.necesita_rehash(user['password_hash']):
+            pool_claves.rehashear_en_segundo_plano(get_supabase(), user['id'], request.password)
         
-        # Generar token
-        token = f"token_{user['id']}_{user['username']}"
+        # Generar token firmado (id, rol, sucursal y nombre)
+        token = crear_token_acceso(user)
         
         # Preparar respuesta
         user_data = {
@@ -140,14 +204,19 @@ def login(request: LoginRequest):
 # EMPLEADOS
 # ==========================================
 
-@app.get("/api/empleados", response_model=List[dict])
+@app.get("/api/empleados", response_model=Union[List[dict], dict])
 def get_empleados(
     sucursal_id: Optional[int] = None,
     tipo_contrato: Optional[str] = None,
     activo: Optional[bool] = True,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
+    """
+    Listar empleados. Con `cursor` (vacío para la primera página) pagina por id
+    y responde {"data": [...], "next_cursor": ...}; sin él usa skip/limit.
+    """
     try:
         supabase = get_supabase()
         query = supabase.table("v_empleados_completo").select("*")
@@ -159,9 +228,21 @@ def get_empleados(
         if tipo_contrato:
             query = query.eq("tipo_contrato", tipo_contrato)
 
+        if cursor is not None:
+            try:
+                posicion = decodificar_cursor(cursor, ("id",))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if posicion:
+                query = query.gt("id", posicion["id"])
+            result = query.order("id").limit(limit + 1).execute()
+            return pagina_con_cursor(result.data, limit, ("id",))
+
         result = query.range(skip, skip + limit - 1).execute()
         return result.data
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener empleados: {str(e)}")
 
@@ -185,15 +266,20 @@ def get_empleado(empleado_id: int):
 def get_empleado_by_rut(rut: str):
     try:
         supabase = get_supabase()
-        rut_limpio = rut.replace(".", "").replace("-", "")
+        try:
+            rut_limpio = normalizar_rut(rut)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        result = supabase.table("v_empleados_completo").select("*").eq("rut", rut_limpio).execute()
+        empleado = indice_rut.obtener(supabase, rut_limpio)
 
-        if not result.data:
+        if not empleado:
             raise HTTPException(status_code=404, detail=f"Empleado con RUT {rut} no encontrado")
 
-        return result.data[0]
+        return empleado
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -202,14 +288,66 @@ def get_empleado_by_rut(rut: str):
 def create_empleado(empleado: EmpleadoCreate):
     try:
         supabase = get_supabase()
+        try:
+            empleado.rut = normalizar_rut(empleado.rut)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
         existing = supabase.table("empleados").select("id").eq("rut", empleado.rut).execute()
 
         if existing.data:
             raise HTTPException(status_code=400, detail="Ya existe un empleado con ese RUT")
 
         result = supabase.table("empleados").insert(empleado.dict()).execute()
+        indice_rut.refrescar(supabase, empleado.rut)
+        agregados.recontar_empleados(supabase)
         return result.data[0]
 
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/api/empleados/importar", response_model=dict)
+def importar_empleados(
+    archivo: UploadFile = File(...),
+    desactivar_ausentes: bool = Form(False),
+    simular: bool = Form(False),
+    usuario: UsuarioToken = Depends(requiere_permiso('empleados:create'))
+):
+    """
+    Subir la nómina (.xlsx o .csv) y aplicar altas, cambios y, si se pide,
+    desactivar a los empleados activos que no vienen en el archivo.
+    Las filas con error se informan una por una y no detienen la importación.
+    """
+    try:
+        supabase = get_supabase()
+        try:
+            resumen = importar_nomina(
+                supabase,
+                archivo.file,
+                archivo.filename or "",
+                desactivar_ausentes=desactivar_ausentes,
+                simular=simular,
+                tamano_bloque=settings.NOMINA_CHUNK_SIZE
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        ruts_modificados = resumen.pop("ruts_modificados")
+        if ruts_modificados:
+            for rut in ruts_modificados:
+                indice_rut.invalidar(rut)
+            agregados.recontar_empleados(supabase, reasignados=resumen["actualizados"] > 0)
+
+        print(f"📥 Nómina {archivo.filename} ({usuario.username}): {resumen['insertados']} nuevos, "
+              f"{resumen['actualizados']} actualizados, {resumen['desactivados']} desactivados, "
+              f"{resumen['con_error']} con error")
+        return resumen
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -225,6 +363,11 @@ def update_empleado(empleado_id: int, empleado: EmpleadoUpdate):
 
         update_data = {k: v for k, v in empleado.dict().items() if v is not None}
         result = supabase.table("empleados").update(update_data).eq("id", empleado_id).execute()
+        indice_rut.refrescar(supabase, result.data[0]['rut'])
+        if update_data.keys() & {"activo", "sucursal_id", "tipo_contrato"}:
+            agregados.recontar_empleados(
+                supabase, reasignados=bool(update_data.keys() & {"sucursal_id", "tipo_contrato"})
+            )
 
         return result.data[0]
 
@@ -235,33 +378,55 @@ def update_empleado(empleado_id: int, empleado: EmpleadoUpdate):
 # VALIDACIÓN RETIRO
 # ==========================================
 
+def _entrega_completada(supabase, empleado_id: int, periodo_id: int) -> Optional[dict]:
+    """Primera entrega COMPLETADO de un empleado en un período (para mostrar cuándo retiró)"""
+    result = supabase.table("entregas").select("id, fecha_hora").eq(
+        "empleado_id", empleado_id
+    ).eq(
+        "periodo_id", periodo_id
+    ).eq("estado", "COMPLETADO").order("id").limit(1).execute()
+    return result.data[0] if result.data else None
+
+
+def _confirmar_retiro(supabase, empleado_id: int, periodo_id: int) -> Optional[dict]:
+    """
+    ¿Ya retiró? según la base de datos, solo antes de insertar una entrega.
+    El conjunto en memoria de este worker puede no ver lo registrado en
+    otro, así que se corrige con el resultado.
+    """
+    entrega = _entrega_completada(supabase, empleado_id, periodo_id)
+    if entrega:
+        entregados.marcar(periodo_id, empleado_id)
+    elif entregados.ya_retiro(supabase, periodo_id, empleado_id):
+        entregados.desmarcar(periodo_id, empleado_id)
+    return entrega
+
+
 @app.post("/api/validar-retiro", response_model=ValidarRetiroResponse)
 def validar_retiro(validacion: ValidarRetiroRequest):
     try:
         supabase = get_supabase()
-        rut_limpio = validacion.rut.replace(".", "").replace("-", "")
+        try:
+            rut_limpio = normalizar_rut(validacion.rut)
+        except ValueError as e:
+            return ValidarRetiroResponse(valido=False, mensaje=str(e), ya_retiro=False)
 
-        # Buscar empleado
-        empleado_result = supabase.table("empleados").select("*").eq("rut", rut_limpio).eq("activo", True).execute()
+        # Buscar empleado (índice en memoria)
+        empleado = indice_rut.obtener(supabase, rut_limpio)
 
-        if not empleado_result.data:
+        if not empleado or not empleado.get('activo'):
             return ValidarRetiroResponse(
                 valido=False,
                 mensaje=f"Empleado con RUT {validacion.rut} no encontrado o inactivo",
                 ya_retiro=False
             )
 
-        empleado = empleado_result.data[0]
+        # Revisar si ya retiró (conjunto en memoria; la BD solo para la fecha del retiro)
+        entrega = None
+        if entregados.ya_retiro(supabase, validacion.periodo_id, empleado['id']):
+            entrega = _entrega_completada(supabase, empleado['id'], validacion.periodo_id)
 
-        # Revisar si ya retiró
-        entrega_result = supabase.table("entregas").select("id, fecha_hora").eq(
-            "empleado_id", empleado['id']
-        ).eq(
-            "periodo_id", validacion.periodo_id
-        ).eq("estado", "COMPLETADO").execute()
-
-        if entrega_result.data:
-            entrega = entrega_result.data[0]
+        if entrega:
             return ValidarRetiroResponse(
                 valido=False,
                 mensaje=f"Este empleado ya retiró el {entrega['fecha_hora']}",
@@ -291,12 +456,24 @@ def get_entregas_lista(
     fecha_desde: Optional[str] = None,
     fecha_hasta: Optional[str] = None,
     skip: int = 0, 
-    limit: int = 200
+    limit: int = 200,
+    cursor: Optional[str] = None
 ):
-    """Obtener lista de entregas con filtros combinados y rango de fechas"""
+    """
+    Obtener lista de entregas con filtros combinados y rango de fechas
+    Con `cursor` (vacío para la primera página) pagina por (fecha_hora, id) y responde
+    {"data": [...], "next_cursor": ...}; sin él usa skip/limit
+    """
     try:
         supabase = get_supabase()
         
+        posicion = None
+        if cursor is not None:
+            try:
+                posicion = decodificar_cursor(cursor, ("fecha_hora", "id"))
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        
         # Consulta base
         query = supabase.table("entregas").select(
             "*, empleados!inner(*, sucursales(*))"
@@ -314,9 +491,9 @@ def get_entregas_lista(
             if periodo_id:
                 query = query.eq("periodo_id", periodo_id)
             else:
-                periodo_activo = supabase.table("periodos_entrega").select("id").eq("activo", True).execute()
-                if periodo_activo.data:
-                    query = query.eq("periodo_id", periodo_activo.data[0]['id'])
+                periodo_activo = cache_periodos.activo(supabase)
+                if periodo_activo:
+                    query = query.eq("periodo_id", periodo_activo['id'])
 
         # Filtros de sucursal y tipo
         if sucursal_id:
@@ -325,6 +502,13 @@ def get_entregas_lista(
         if tipo_contrato:
             query = query.eq("empleados.tipo_contrato", tipo_contrato)
 
+        # Paginación por cursor: filas estrictamente después de la última entregada
+        if cursor is not None:
+            if posicion:
+                query = query.or_(filtro_keyset_desc("fecha_hora", posicion["fecha_hora"], posicion["id"]))
+            result = query.order("fecha_hora", desc=True).order("id", desc=True).limit(limit + 1).execute()
+            return pagina_con_cursor(result.data, limit, ("fecha_hora", "id"))
+        
         # Ejecutar query
         result = query.order("fecha_hora", desc=True).range(skip, skip + limit - 1).execute()
         
@@ -332,11 +516,127 @@ def get_entregas_lista(
         
         return result.data
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error en backend: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al obtener entregas: {str(e)}")
 
 
+@app.get("/api/entregas/pendientes")
+def get_pendientes_sucursal(
+    sucursal_id: int,
+    periodo_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100
+):
+    """
+    Empleados activos de una sucursal que todavía no retiran en el período
+    (por defecto el activo). Pagina por id con `cursor`; la primera página
+    trae además los totales de la sucursal.
+    """
+    try:
+        supabase = get_supabase()
+
+        if periodo_id is None:
+            periodo = cache_periodos.activo(supabase)
+            if not periodo:
+                raise HTTPException(status_code=404, detail="No hay período activo")
+            periodo_id = periodo['id']
+
+        try:
+            posicion = decodificar_cursor(cursor, ("id",))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        retiraron = entregados.conjunto(supabase, periodo_id)
+
+        # Recorrer empleados por id saltando los que ya retiraron hasta juntar limit + 1
+        lote = min(max(limit + 1, 200), 1000)
+        ultimo_id = posicion["id"] if posicion else 0
+        pendientes = []
+        while len(pendientes) <= limit:
+            filas = supabase.table("v_empleados_completo").select(
+                "id, rut, nombre, apellido, nombre_completo, tipo_contrato, seccion, sucursal_id, sucursal"
+            ).eq("sucursal_id", sucursal_id).eq("activo", True).gt("id", ultimo_id).order("id").limit(lote).execute().data
+            pendientes.extend(fila for fila in filas if not retiraron.contiene(fila['id']))
+            if len(filas) < lote:
+                break
+            ultimo_id = filas[-1]['id']
+
+        respuesta = pagina_con_cursor(pendientes, limit, ("id",))
+        respuesta["periodo_id"] = periodo_id
+
+        if posicion is None:
+            total = 0
+            pendientes_total = 0
+            for pagina in iterar_paginas(
+                lambda: supabase.table("empleados").select("id").eq("sucursal_id", sucursal_id).eq("activo", True).order("id")
+            ):
+                total += len(pagina)
+                pendientes_total += sum(1 for fila in pagina if not retiraron.contiene(fila['id']))
+            respuesta["total_empleados"] = total
+            respuesta["total_pendientes"] = pendientes_total
+            respuesta["total_retirados"] = total - pendientes_total
+
+        return respuesta
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ ERROR en get_pendientes_sucursal: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+def _entrega_evento(fila: dict) -> dict:
+    """Campos de una entrega que viajan en los eventos en vivo (sin foto)"""
+    campos = ("id", "empleado_id", "usuario_id", "fecha_hora", "guardia", "tipo_caja", "metodo")
+    return {campo: fila.get(campo) for campo in campos if campo in fila}
+
+
+def _entrega_registrada(entrega: dict, empleado: dict):
+    """Actualizar el estado en memoria y avisar a los paneles después de guardar una entrega"""
+    periodo_id = entrega.get("periodo_id")
+    sucursal_id = empleado.get("sucursal_id")
+    if entrega.get("estado") == "COMPLETADO":
+        entregados.marcar(periodo_id, entrega["empleado_id"])
+    agregados.registrar_entrega(periodo_id, empleado.get("tipo_contrato"), sucursal_id=sucursal_id)
+    rollups.registrar(entrega, sucursal_id, empleado.get("tipo_contrato"))
+    hub_eventos.publicar_entrega("registrada", _entrega_evento(entrega), periodo_id, sucursal_id)
+
+
+def _entrega_anulada(entrega: dict, empleado: dict):
+    """Lo mismo al eliminar una entrega (`entrega` trae fecha_hora y usuario_id)"""
+    periodo_id = entrega.get("periodo_id")
+    sucursal_id = empleado.get("sucursal_id")
+    entregados.desmarcar(periodo_id, entrega["empleado_id"])
+    agregados.registrar_entrega(
+        periodo_id, empleado.get("tipo_contrato"), entrega.get("fecha_hora"), delta=-1, sucursal_id=sucursal_id
+    )
+    rollups.registrar(entrega, sucursal_id, empleado.get("tipo_contrato"), delta=-1)
+    hub_eventos.publicar_entrega("anulada", _entrega_evento(entrega), periodo_id, sucursal_id)
+
+
+@app.get("/api/eventos/entregas")
+async def stream_eventos_entregas(periodo_id: Optional[int] = None, sucursal_id: Optional[int] = None):
+    """
+    Server-Sent Events para el dashboard: contadores al conectar y cada
+    EVENTOS_INTERVALO segundos, y un evento por entrega registrada o anulada
+    en el período (filtrado por sucursal del empleado si se indica).
+    """
+    if periodo_id is None:
+        periodo = await cache_periodos.activo_async(get_supabase_async())
+        if not periodo:
+            raise HTTPException(status_code=404, detail="No hay período activo")
+        periodo_id = periodo['id']
+    
+    return StreamingResponse(
+        hub_eventos.suscribir(get_supabase(), periodo_id, sucursal_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.put("/api/entregas/{entrega_id}")
 def update_entrega(entrega_id: int, datos: dict):
     """Actualizar observaciones de una entrega"""
@@ -369,7 +669,9 @@ def delete_entrega(entrega_id: int):
         supabase = get_supabase()
         
         # Verificar que la entrega existe
-        entrega = supabase.table("entregas").select("id, qr_token_id").eq("id", entrega_id).execute()
+        entrega = supabase.table("entregas").select(
+            "id, qr_token_id, empleado_id, usuario_id, periodo_id, fecha_hora, guardia, tipo_caja, metodo, empleados(tipo_contrato, sucursal_id)"
+        ).eq("id", entrega_id).execute()
         if not entrega.data:
             raise HTTPException(status_code=404, detail="Entrega no encontrada")
         
@@ -377,10 +679,12 @@ def delete_entrega(entrega_id: int):
         
         # Eliminar la entrega
         supabase.table("entregas").delete().eq("id", entrega_id).execute()
+        _entrega_anulada(entrega_data, entrega_data.get("empleados") or {})
         
         # Opcional: Reactivar el token QR si existe
         if entrega_data.get("qr_token_id"):
             supabase.table("qr_tokens").update({"usado": False}).eq("id", entrega_data["qr_token_id"]).execute()
+            tokens_usados.desmarcar(entrega_data["qr_token_id"])
         
         return {"message": "Entrega cancelada correctamente"}
         
@@ -445,29 +749,13 @@ def get_estadisticas_entregas():
     try:
         supabase = get_supabase()
         
-        # Total de entregas
-        total = supabase.table("entregas").select("id", count="exact").execute()
-        
-        # Entregas de hoy
-        hoy = date.today().isoformat()
-        hoy_entregas = supabase.table("entregas").select("id", count="exact").gte(
-            "fecha_hora", f"{hoy}T00:00:00"
-        ).execute()
-        
-        # Entregas por tipo de contrato (de hoy)
-        entregas_hoy_detalle = supabase.table("entregas").select(
-            "id, empleados(tipo_contrato)"
-        ).gte("fecha_hora", f"{hoy}T00:00:00").execute()
-        
-        planta = sum(1 for e in (entregas_hoy_detalle.data or []) 
-                    if e.get('empleados', {}).get('tipo_contrato') == 'PLANTA')
-        plazo_fijo = len(entregas_hoy_detalle.data or []) - planta
+        datos = agregados.resumen(supabase)
         
         return {
-            "total": total.count if total.count else 0,
-            "hoy": hoy_entregas.count if hoy_entregas.count else 0,
-            "planta": planta,
-            "plazo_fijo": plazo_fijo
+            "total": datos["entregas_total"],
+            "hoy": datos["entregas_hoy"],
+            "planta": datos["hoy_planta"],
+            "plazo_fijo": datos["hoy_plazo_fijo"]
         }
     except Exception as e:
         print(f"❌ ERROR en get_estadisticas_entregas: {str(e)}")
@@ -479,16 +767,9 @@ def get_estadisticas_dashboard():
     try:
         supabase = get_supabase()
         
-        # Total empleados activos
-        empleados = supabase.table("empleados").select("id", count="exact").eq("activo", True).execute()
-        total_empleados = empleados.count if empleados.count else 0
-        
-        # Entregas de hoy
-        hoy = date.today().isoformat()
-        entregas_hoy = supabase.table("entregas").select("id", count="exact").gte(
-            "fecha_hora", f"{hoy}T00:00:00"
-        ).execute()
-        total_hoy = entregas_hoy.count if entregas_hoy.count else 0
+        datos = agregados.resumen(supabase)
+        total_empleados = datos["empleados_activos"]
+        total_hoy = datos["entregas_hoy"]
         
         # Porcentaje de entregas (empleados que ya retiraron hoy)
         porcentaje = round((total_hoy / total_empleados * 100), 1) if total_empleados > 0 else 0
@@ -516,15 +797,7 @@ def crear_entrega(entrega: EntregaCreate):
 
         # Verificar si ya retiró
         if entrega.periodo_id:
-            check = supabase.table("entregas").select("id").eq(
-                "empleado_id", entrega.empleado_id
-            ).eq(
-                "periodo_id", entrega.periodo_id
-            ).eq(
-                "estado", "COMPLETADO"
-            ).execute()
-
-            if check.data:
+            if _confirmar_retiro(supabase, entrega.empleado_id, entrega.periodo_id):
                 raise HTTPException(status_code=400, detail="Este empleado ya retiró en este período")
 
         # Crear diccionario con todos los campos
@@ -537,6 +810,17 @@ def crear_entrega(entrega: EntregaCreate):
             data["estado"] = "COMPLETADO"
 
         result = supabase.table("entregas").insert(data).execute()
+        
+        # Dos workers pudieron pasar la verificación a la vez: se queda la primera
+        if entrega.periodo_id and data["estado"] == "COMPLETADO":
+            primera = _entrega_completada(supabase, entrega.empleado_id, entrega.periodo_id)
+            if primera and primera['id'] != result.data[0]['id']:
+                supabase.table("entregas").delete().eq("id", result.data[0]['id']).execute()
+                entregados.marcar(entrega.periodo_id, entrega.empleado_id)
+                raise HTTPException(status_code=400, detail="Este empleado ya retiró en este período")
+        
+        empleado = supabase.table("empleados").select("tipo_contrato, sucursal_id").eq("id", entrega.empleado_id).execute()
+        _entrega_registrada(result.data[0], empleado.data[0] if empleado.data else {})
         return result.data[0]
 
     except HTTPException:
@@ -552,13 +836,12 @@ def crear_entrega(entrega: EntregaCreate):
 def get_periodos(activo: Optional[bool] = None):
     try:
         supabase = get_supabase()
-        query = supabase.table("periodos_entrega").select("*")
+        periodos = cache_periodos.catalogo(supabase)
 
         if activo is not None:
-            query = query.eq("activo", activo)
+            periodos = [p for p in periodos if bool(p.get('activo')) == activo]
 
-        result = query.order("fecha_inicio", desc=True).execute()
-        return result.data
+        return periodos
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -568,12 +851,12 @@ def get_periodos(activo: Optional[bool] = None):
 def get_periodo_activo():
     try:
         supabase = get_supabase()
-        result = supabase.table("periodos_entrega").select("*").eq("activo", True).execute()
+        periodo = cache_periodos.activo(supabase)
 
-        if not result.data:
+        if not periodo:
             raise HTTPException(status_code=404, detail="No hay período activo")
 
-        return result.data[0]
+        return periodo
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -601,10 +884,10 @@ def get_sucursales(activa: Optional[bool] = None):
 @app.post("/api/sucursales")
 async def create_sucursal(sucursal: dict):
     try:
-        supabase = get_supabase()
+        db = get_supabase_async()
         
         # Verificar que no exista
-        check = supabase.table("sucursales").select("id").eq("nombre", sucursal['nombre']).execute()
+        check = await db.table("sucursales").select("id").eq("nombre", sucursal['nombre']).execute()
         if check.data:
             raise HTTPException(status_code=400, detail="Ya existe una sucursal con ese nombre")
         
@@ -615,7 +898,7 @@ async def create_sucursal(sucursal: dict):
             "activa": sucursal.get('activa', True)
         }
         
-        result = supabase.table("sucursales").insert(data).execute()
+        result = await db.table("sucursales").insert(data).execute()
         return result.data[0]
     except HTTPException:
         raise
@@ -625,7 +908,7 @@ async def create_sucursal(sucursal: dict):
 @app.put("/api/sucursales/{sucursal_id}")
 async def update_sucursal(sucursal_id: int, sucursal: dict):
     try:
-        supabase = get_supabase()
+        db = get_supabase_async()
         
         data = {}
         if 'nombre' in sucursal:
@@ -637,7 +920,7 @@ async def update_sucursal(sucursal_id: int, sucursal: dict):
         if 'activa' in sucursal:
             data['activa'] = sucursal['activa']
         
-        result = supabase.table("sucursales").update(data).eq("id", sucursal_id).execute()
+        result = await db.table("sucursales").update(data).eq("id", sucursal_id).execute()
         return {"message": "Sucursal actualizada correctamente", "data": result.data[0]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -645,10 +928,10 @@ async def update_sucursal(sucursal_id: int, sucursal: dict):
 @app.delete("/api/sucursales/{sucursal_id}")
 async def delete_sucursal(sucursal_id: int):
     try:
-        supabase = get_supabase()
+        db = get_supabase_async()
         
         # Verificar que no tenga empleados
-        empleados = supabase.table("empleados").select("id", count="exact").eq("sucursal_id", sucursal_id).execute()
+        empleados = await db.table("empleados").select("id", count="exact").eq("sucursal_id", sucursal_id).execute()
         if empleados.count and empleados.count > 0:
             raise HTTPException(
                 status_code=400, 
@@ -656,7 +939,7 @@ async def delete_sucursal(sucursal_id: int):
             )
         
         # Desactivar en vez de eliminar
-        result = supabase.table("sucursales").update({"activa": False}).eq("id", sucursal_id).execute()
+        result = await db.table("sucursales").update({"activa": False}).eq("id", sucursal_id).execute()
         return {"message": "Sucursal desactivada correctamente"}
     except HTTPException:
         raise
@@ -668,56 +951,130 @@ async def delete_sucursal(sucursal_id: int):
 
 @app.get("/api/reportes/entregas-por-sucursal")
 def get_entregas_por_sucursal():
-    """Reporte de entregas agrupadas por sucursal"""
+    """Reporte de entregas agrupadas por sucursal (desde los rollups)"""
+    try:
+        supabase = get_supabase()
+        
+        por_sucursal = {}
+        for (_, sucursal_id, _, _), total in rollups.buckets().items():
+            if sucursal_id is not None:
+                por_sucursal[sucursal_id] = por_sucursal.get(sucursal_id, 0) + total
+        
+        nombres = {s['id']: s['nombre'] for s in supabase.table("sucursales").select("id, nombre").execute().data}
+        return [
+            {"sucursal": nombres[sucursal_id], "total": total}
+            for sucursal_id, total in por_sucursal.items()
+            if sucursal_id in nombres
+        ]
+    except RollupsNoListos as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.get("/api/reportes/entregas-por-hora")
+def get_entregas_por_hora(
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    sucursal_id: Optional[int] = None,
+    usuario_id: Optional[int] = None,
+    tipo_contrato: Optional[str] = None,
+    agrupar: str = "hora",
+    por: Optional[str] = None
+):
+    """
+    Entregas por hora (o por día con agrupar=dia), con el detalle PLANTA / PLAZO_FIJO.
+    `por` = "sucursal" o "usuario" agrega esa dimensión a cada fila. Se calcula desde los rollups.
+    """
+    if agrupar not in ("hora", "dia"):
+        raise HTTPException(status_code=400, detail="agrupar debe ser hora o dia")
+    if por not in (None, "sucursal", "usuario"):
+        raise HTTPException(status_code=400, detail="por debe ser sucursal o usuario")
+    
     try:
         supabase = get_supabase()
-        result = supabase.table("entregas") \
-            .select("id, empleados(sucursal_id, sucursales(nombre))") \
-            .execute()
-        
-        # Agrupar por sucursal
-        sucursales = {}
-        for entrega in result.data:
-            if entrega.get("empleados") and entrega["empleados"].get("sucursales"):
-                sucursal = entrega["empleados"]["sucursales"]["nombre"]
-                sucursales[sucursal] = sucursales.get(sucursal, 0) + 1
-        
-        return [{"sucursal": k, "total": v} for k, v in sucursales.items()]
+        largo = 13 if agrupar == "hora" else 10
+        
+        filas = {}
+        for (hora, suc_id, usu_id, tipo), total in rollups.buckets().items():
+            if fecha_inicio and hora[:10] < fecha_inicio:
+                continue
+            if fecha_fin and hora[:10] > fecha_fin:
+                continue
+            if (sucursal_id and suc_id != sucursal_id) or (usuario_id and usu_id != usuario_id):
+                continue
+            if tipo_contrato and tipo != tipo_contrato:
+                continue
+            
+            dimension = {"sucursal": suc_id, "usuario": usu_id}.get(por)
+            fila = filas.setdefault((hora[:largo], dimension), {"total": 0, "planta": 0, "plazo_fijo": 0})
+            fila["total"] += total
+            fila["planta" if tipo == "PLANTA" else "plazo_fijo"] += total
+        
+        resultado = []
+        for (bucket, dimension), fila in sorted(filas.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            item = {agrupar: bucket, **fila}
+            if por:
+                item[f"{por}_id"] = dimension
+            resultado.append(item)
+        return resultado
+        
+    except RollupsNoListos as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.post("/api/reportes/rollups/reconstruir", status_code=202)
+def reconstruir_rollups():
+    """Pedir que se recalculen desde cero los conteos pre-agregados (en segundo plano)"""
+    rollups.solicitar_reconstruccion()
+    return {"mensaje": "Reconstrucción de rollups programada"}
+
+
 @app.get("/api/reportes/entregas-por-fecha")
 def get_entregas_por_fecha(
+    response: Response,
     fecha_inicio: str = None, 
     fecha_fin: str = None,
     sucursal_id: Optional[int] = None,
-    tipo_contrato: Optional[str] = None
+    tipo_contrato: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None
 ):
-    """Reporte de entregas filtradas por fecha, sucursal y tipo de contrato"""
+    """
+    Reporte de entregas filtradas por fecha, sucursal y tipo de contrato (todo en la BD).
+    Con `cursor` (vacío para la primera página) pagina por (fecha_hora, id) de a `limit`
+    (500 por defecto) y responde {"data": [...], "next_cursor": ...}. Sin cursor y con
+    `limit` devuelve las primeras `limit` filas y marca `X-Resultados-Truncados` si hay
+    más; sin ninguno de los dos devuelve el rango completo, leído por páginas keyset.
+    """
     try:
         supabase = get_supabase()
         
-        # Obtener todas las entregas con filtros de fecha
-        query = supabase.table("entregas").select(
-            "*, empleados(id, rut, nombre, apellido, tipo_contrato, sucursal_id, sucursales(nombre))"
-        )
-        
-        if fecha_inicio:
-            query = query.gte("fecha_hora", f"{fecha_inicio}T00:00:00")
-        if fecha_fin:
-            query = query.lte("fecha_hora", f"{fecha_fin}T23:59:59")
-        
-        result = query.order("fecha_hora", desc=True).execute()
-        
-        # Filtrar en Python (porque Supabase no soporta filtros en relaciones anidadas)
-        entregas = result.data
-        
-        if sucursal_id:
-            entregas = [e for e in entregas if e.get('empleados', {}).get('sucursal_id') == sucursal_id]
+        def construir_query():
+            return consulta_entregas(
+                supabase,
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin,
+                sucursal_id=sucursal_id,
+                tipo_contrato=tipo_contrato
+            )
         
-        if tipo_contrato:
-            entregas = [e for e in entregas if e.get('empleados', {}).get('tipo_contrato') == tipo_contrato]
+        if cursor is None and limit is None:
+            entregas = [entrega for pagina in paginas_keyset(construir_query) for entrega in pagina]
+        else:
+            limit = limit or 500
+            posicion = None
+            if cursor is not None:
+                try:
+                    posicion = decodificar_cursor(cursor, ("fecha_hora", "id"))
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+            query = construir_query()
+            if posicion:
+                query = query.or_(filtro_keyset_desc("fecha_hora", posicion["fecha_hora"], posicion["id"]))
+            entregas = query.order("fecha_hora", desc=True).order("id", desc=True).limit(limit + 1).execute().data
         
         # Adaptar respuesta
         for entrega in entregas:
@@ -726,13 +1083,53 @@ def get_entregas_por_fecha(
         
         print(f"📊 Filtros aplicados: sucursal_id={sucursal_id}, tipo_contrato={tipo_contrato}, Total={len(entregas)}")
         
+        if cursor is not None:
+            return pagina_con_cursor(entregas, limit, ("fecha_hora", "id"))
+        if limit is not None:
+            if hay_mas(entregas, limit):
+                response.headers["X-Resultados-Truncados"] = "true"
+            return entregas[:limit]
         return entregas
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ ERROR en get_entregas_por_fecha: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.get("/api/reportes/entregas/exportar")
+def exportar_entregas(
+    formato: str = "csv",
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    sucursal_id: Optional[int] = None,
+    tipo_contrato: Optional[str] = None
+):
+    """
+    Exportar entregas en CSV o JSONL (una fila por entrega, sin foto) con los
+    mismos filtros que entregas-por-fecha. El archivo se envía mientras se lee.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise HTTPException(status_code=400, detail="Formato inválido. Usa csv o jsonl")
+    
+    supabase = get_supabase()
+    fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    return StreamingResponse(
+        stream_exportacion(
+            supabase,
+            formato,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            sucursal_id=sucursal_id,
+            tipo_contrato=tipo_contrato
+        ),
+        media_type=FORMATOS_EXPORTACION[formato],
+        headers={"Content-Disposition": f"attachment; filename=entregas_{fecha_actual}.{formato}"}
+    )
+
+
 @app.get("/api/reportes/resumen")
 def get_resumen_general():
     """Resumen general del sistema"""
@@ -863,52 +1260,44 @@ def get_cajas_no_retiradas(estado: Optional[str] = None):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/api/verificar-pendientes/{periodo_id}")
-def verificar_pendientes_periodo(periodo_id: int):
+def verificar_pendientes_periodo(periodo_id: int, formato: str = "json"):
     """
-    Verificar empleados que no retiraron y marcar cajas para sindicato
+    Verificar empleados que no retiraron y marcar cajas para sindicato.
+    Es idempotente: las cajas ya registradas en el período no se duplican.
+    Con formato=ndjson o sse el avance se envía bloque a bloque.
     """
     try:
         supabase = get_supabase()
         
+        if formato != "json" and formato not in FORMATOS_STREAM:
+            raise HTTPException(status_code=400, detail="Formato inválido. Usa json, ndjson o sse")
+        
         # Obtener período
-        periodo = supabase.table("periodos_entrega").select("*").eq("id", periodo_id).execute()
-        if not periodo.data:
+        periodo_data = cache_periodos.por_id(supabase, periodo_id)
+        if not periodo_data:
             raise HTTPException(status_code=404, detail="Período no encontrado")
         
-        periodo_data = periodo.data[0]
-        fecha_fin = periodo_data['fecha_fin']
-        
-        # Obtener todos los empleados activos
-        empleados = supabase.table("empleados").select("id").eq("activo", True).execute()
-        empleados_ids = [e['id'] for e in empleados.data]
-        
-        # Obtener empleados que SÍ retiraron
-        entregas = supabase.table("entregas").select("empleado_id").eq("periodo_id", periodo_id).execute()
-        retiraron_ids = [e['empleado_id'] for e in entregas.data]
-        
-        # Empleados que NO retiraron
-        no_retiraron_ids = [e_id for e_id in empleados_ids if e_id not in retiraron_ids]
-        
-        # Marcar cajas como no retiradas
-        for empleado_id in no_retiraron_ids:
-            data = {
-                "periodo_id": periodo_id,
-                "empleado_id": empleado_id,
-                "tipo_beneficio_id": periodo_data.get('tipo_beneficio_id', 1),
-                "fecha_limite": fecha_fin,
-                "estado": "TRASPASADO_SINDICATO",
-                "fecha_traspaso": datetime.now().isoformat(),
-                "observaciones": f"No retiró en plazo. Traspasado automáticamente al sindicato."
-            }
-            supabase.table("cajas_no_retiradas").insert(data).execute()
+        eventos = traspasar_no_retiradas(supabase, periodo_data)
+        try:
+            primero = next(eventos)
+        except TraspasoEnCurso as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        
+        if formato in FORMATOS_STREAM:
+            return StreamingResponse(
+                stream_traspaso(itertools.chain([primero], eventos), formato),
+                media_type=FORMATOS_STREAM[formato],
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
         
-        return {
-            "total_empleados": len(empleados_ids),
-            "retiraron": len(retiraron_ids),
-            "no_retiraron": len(no_retiraron_ids),
-            "traspasados_sindicato": len(no_retiraron_ids)
-        }
+        resumen = None
+        for tipo, datos in eventos:
+            if tipo == "fin":
+                resumen = datos
+        return resumen
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -937,7 +1326,10 @@ def create_usuario(usuario: UsuarioCreate):
             raise HTTPException(status_code=400, detail="El nombre de usuario ya existe")
         
         # Hashear la contraseña
-        password_hash = bcrypt.hashpw(usuario.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        try:
+            password_hash = pool_claves.hashear(usuario.password)
+        except PoolSaturado as e:
+            raise HTTPException(status_code=503, detail=str(e))
         
         # Crear usuario
         data = {
@@ -996,7 +1388,10 @@ def update_usuario(usuario_id: int, usuario: UsuarioUpdate):
         if usuario.username:
             update_data["username"] = usuario.username
         if usuario.password:
-            update_data["password_hash"] = bcrypt.hashpw(usuario.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            try:
+                update_data["password_hash"] = pool_claves.hashear(usuario.password)
+            except PoolSaturado as e:
+                raise HTTPException(status_code=503, detail=str(e))
         if usuario.nombre_completo:
             update_data["nombre_completo"] = usuario.nombre_completo
         if usuario.sucursal_id is not None:
@@ -1038,11 +1433,17 @@ from datetime import timedelta
 # GENERAR QR CON TOKEN ÚNICO
 # ==========================================
 
+def _periodo_activo_id(supabase) -> Optional[int]:
+    periodo = cache_periodos.activo(supabase)
+    return periodo['id'] if periodo else None
+
+
 @app.post("/api/qr/generar/{empleado_id}")
-def generar_qr_token(empleado_id: int, duracion_minutos: int = 60):
+def generar_qr_token(empleado_id: int, duracion_minutos: int = 60, periodo_id: Optional[int] = None):
     """
     Generar token QR único de un solo uso para un empleado
     El token expira después de X minutos (default 60)
+    El QR lleva un token firmado (empleado, período y expiración) que se valida sin ir a la BD
     """
     try:
         supabase = get_supabase()
@@ -1054,21 +1455,22 @@ def generar_qr_token(empleado_id: int, duracion_minutos: int = 60):
         
         empleado_data = empleado.data[0]
         
-        # Generar token único y seguro
-        token = secrets.token_urlsafe(32)
+        if periodo_id is None:
+            periodo_id = _periodo_activo_id(supabase)
         
-        # Generar hash de seguridad (token + empleado_id + timestamp)
-        timestamp = datetime.now().isoformat()
-        hash_data = f"{token}:{empleado_id}:{timestamp}"
+        # Generar nonce único y hash de seguridad (nonce + empleado_id + timestamp)
+        fecha_emision = datetime.now()
+        nonce = secrets.token_urlsafe(16)
+        hash_data = f"{nonce}:{empleado_id}:{fecha_emision.isoformat()}"
         hash_seguridad = hashlib.sha256(hash_data.encode()).hexdigest()
         
         # Calcular fecha de expiración
-        fecha_expiracion = datetime.now() + timedelta(minutes=duracion_minutos)
+        fecha_expiracion = fecha_emision + timedelta(minutes=duracion_minutos)
         
-        # Guardar en base de datos
+        # Guardar en base de datos (auditoría y estado de uso)
         qr_data = {
             "empleado_id": empleado_id,
-            "token": token,
+            "token": nonce,
             "hash_seguridad": hash_seguridad,
             "fecha_expiracion": fecha_expiracion.isoformat()
         }
@@ -1076,6 +1478,9 @@ def generar_qr_token(empleado_id: int, duracion_minutos: int = 60):
         result = supabase.table("qr_tokens").insert(qr_data).execute()
         token_record = result.data[0]
         
+        # Token firmado con el id del registro
+        token = firmar_token(token_record['id'], empleado_id, periodo_id, fecha_emision, fecha_expiracion)
+        
         # Preparar respuesta con datos del QR
         qr_payload = {
             "token": token,
@@ -1084,6 +1489,7 @@ def generar_qr_token(empleado_id: int, duracion_minutos: int = 60):
             "nombre": f"{empleado_data['nombre']} {empleado_data['apellido']}",
             "tipo_contrato": empleado_data['tipo_contrato'],
             "expira": fecha_expiracion.isoformat(),
+            "periodo_id": periodo_id,
             "hash": hash_seguridad[:16]  # Primeros 16 caracteres para verificación visual
         }
         
@@ -1106,47 +1512,95 @@ def generar_qr_token(empleado_id: int, duracion_minutos: int = 60):
 
 @app.post("/api/qr/validar")
 def validar_qr_token(token: str, periodo_id: Optional[int] = None):
+    """Validar un token QR; el código del resultado se cuenta en /metrics"""
+    try:
+        resultado = _validar_qr_token(token, periodo_id)
+    except HTTPException:
+        QR_VALIDACIONES.inc("ERROR")
+        raise
+    QR_VALIDACIONES.inc(resultado.get("codigo", "OK"))
+    return resultado
+
+
+def _validar_qr_token(token: str, periodo_id: Optional[int]) -> dict:
     """
     Validar que un token QR es válido antes de proceder con el escaneo
     Verificaciones:
-    1. Token existe
+    1. Token existe (o su firma es válida)
     2. No ha sido usado
     3. No ha expirado
     4. Empleado no ha retirado en este período
+    Los tokens firmados se verifican localmente; solo el "ya usado" consulta estado compartido
     """
     try:
         supabase = get_supabase()
         
-        # Buscar token
-        token_result = supabase.table("qr_tokens").select("*").eq("token", token).execute()
-        
-        if not token_result.data:
-            return {
-                "valido": False,
-                "codigo": "TOKEN_INVALIDO",
-                "mensaje": "QR inválido o no encontrado"
-            }
-        
-        token_data = token_result.data[0]
-        
-        # Verificar si ya fue usado
-        if token_data['usado']:
-            return {
-                "valido": False,
-                "codigo": "TOKEN_USADO",
-                "mensaje": f"Este QR ya fue utilizado el {token_data['fecha_uso']}",
-                "fecha_uso": token_data['fecha_uso']
-            }
-        
-        # Verificar expiración
-        fecha_expiracion = datetime.fromisoformat(token_data['fecha_expiracion'].replace('Z', '+00:00'))
-        if datetime.now(fecha_expiracion.tzinfo) > fecha_expiracion:
-            return {
-                "valido": False,
-                "codigo": "TOKEN_EXPIRADO",
-                "mensaje": "Este QR ha expirado. Genera uno nuevo.",
-                "expiro": token_data['fecha_expiracion']
-            }
+        if es_token_firmado(token):
+            codigo, firmado = verificar_token(token)
+            
+            if codigo == "TOKEN_INVALIDO":
+                return {
+                    "valido": False,
+                    "codigo": "TOKEN_INVALIDO",
+                    "mensaje": "QR inválido o no encontrado"
+                }
+            
+            if tokens_usados.esta_usado(firmado['token_id']):
+                return {
+                    "valido": False,
+                    "codigo": "TOKEN_USADO",
+                    "mensaje": "Este QR ya fue utilizado",
+                    "fecha_uso": None
+                }
+            
+            if codigo == "TOKEN_EXPIRADO":
+                return {
+                    "valido": False,
+                    "codigo": "TOKEN_EXPIRADO",
+                    "mensaje": "Este QR ha expirado. Genera uno nuevo.",
+                    "expiro": firmado['fecha_expiracion'].isoformat()
+                }
+            
+            if periodo_id and firmado['periodo_id'] and firmado['periodo_id'] != periodo_id:
+                return {
+                    "valido": False,
+                    "codigo": "PERIODO_INCORRECTO",
+                    "mensaje": "Este QR fue generado para otro período"
+                }
+            
+            token_data = {"id": firmado['token_id'], "empleado_id": firmado['empleado_id']}
+            fecha_expiracion = firmado['fecha_expiracion']
+        else:
+            # Tokens antiguos (sin firma): buscar en la base de datos
+            token_result = supabase.table("qr_tokens").select("*").eq("token", token).execute()
+            
+            if not token_result.data:
+                return {
+                    "valido": False,
+                    "codigo": "TOKEN_INVALIDO",
+                    "mensaje": "QR inválido o no encontrado"
+                }
+            
+            token_data = token_result.data[0]
+            
+            # Verificar si ya fue usado
+            if token_data['usado']:
+                return {
+                    "valido": False,
+                    "codigo": "TOKEN_USADO",
+                    "mensaje": f"Este QR ya fue utilizado el {token_data['fecha_uso']}",
+                    "fecha_uso": token_data['fecha_uso']
+                }
+            
+            # Verificar expiración
+            fecha_expiracion = datetime.fromisoformat(token_data['fecha_expiracion'].replace('Z', '+00:00'))
+            if datetime.now(fecha_expiracion.tzinfo) > fecha_expiracion:
+                return {
+                    "valido": False,
+                    "codigo": "TOKEN_EXPIRADO",
+                    "mensaje": "Este QR ha expirado. Genera uno nuevo.",
+                    "expiro": token_data['fecha_expiracion']
+                }
         
         # Obtener datos del empleado
         empleado = supabase.table("empleados").select("*").eq("id", token_data['empleado_id']).execute()
@@ -1160,21 +1614,14 @@ def validar_qr_token(token: str, periodo_id: Optional[int] = None):
         empleado_data = empleado.data[0]
         
         # Verificar si ya retiró en este período (si se proporciona periodo_id)
-        if periodo_id:
-            entrega_previa = supabase.table("entregas").select("id, fecha_hora").eq(
-                "empleado_id", token_data['empleado_id']
-            ).eq(
-                "periodo_id", periodo_id
-            ).eq(
-                "estado", "COMPLETADO"
-            ).execute()
-            
-            if entrega_previa.data:
+        if periodo_id and entregados.ya_retiro(supabase, periodo_id, token_data['empleado_id']):
+            entrega_previa = _entrega_completada(supabase, token_data['empleado_id'], periodo_id)
+            if entrega_previa:
                 return {
                     "valido": False,
                     "codigo": "YA_RETIRO",
-                    "mensaje": f"Este empleado ya retiró su beneficio el {entrega_previa.data[0]['fecha_hora']}",
-                    "fecha_retiro": entrega_previa.data[0]['fecha_hora']
+                    "mensaje": f"Este empleado ya retiró su beneficio el {entrega_previa['fecha_hora']}",
+                    "fecha_retiro": entrega_previa['fecha_hora']
                 }
         
         # Todo OK - QR válido
@@ -1209,84 +1656,134 @@ def validar_qr_token(token: str, periodo_id: Optional[int] = None):
 async def registrar_entrega_seguro(
     qr_token_id: int = Form(...),
     empleado_id: int = Form(...),
-    usuario_id: int = Form(...),
+    usuario_id: Optional[int] = Form(None),
     periodo_id: Optional[int] = Form(None),
     foto: UploadFile = File(...),
     dispositivo_id: Optional[str] = Form(None),
     ip_address: Optional[str] = Form(None),
     latitud: Optional[float] = Form(None),
     longitud: Optional[float] = Form(None),
-    observaciones: Optional[str] = Form("")
+    observaciones: Optional[str] = Form(""),
+    qr_token: Optional[str] = Form(None),
+    guardia: Optional[UsuarioToken] = Depends(usuario_opcional)
 ):
     """
     Registrar entrega con seguridad completa usando FormData
+    Si se envía `qr_token` firmado, el token se verifica localmente sin leer qr_tokens
+    Con `Authorization: Bearer` el guardia (id y nombre) sale del token de acceso
     """
     try:
-        supabase = get_supabase()
-        
-        # Verificar token QR
-        token_result = supabase.table("qr_tokens").select("*").eq("id", qr_token_id).execute()
-        if not token_result.data:
-            raise HTTPException(status_code=404, detail="Token QR no encontrado")
-        
-        token_data = token_result.data[0]
-        
-        # Verificar que no fue usado
-        if token_data['usado']:
-            raise HTTPException(status_code=400, detail="Este QR ya fue utilizado")
-        
-        # Verificar que no expiró
-        fecha_expiracion = datetime.fromisoformat(token_data['fecha_expiracion'].replace('Z', '+00:00'))
-        if datetime.now(fecha_expiracion.tzinfo) > fecha_expiracion:
-            raise HTTPException(status_code=400, detail="QR expirado")
-        
-        # Leer foto y convertir a base64
-        foto_bytes = await foto.read()
-        import base64
-        foto_base64 = f"data:image/jpeg;base64,{base64.b64encode(foto_bytes).decode()}"
-        
-        print(f"📸 Foto recibida: {len(foto_bytes)} bytes")
-        
-        # Calcular duración del escaneo
-        fecha_generacion = datetime.fromisoformat(token_data['fecha_generacion'].replace('Z', '+00:00'))
-        duracion_escaneo = int((datetime.now(fecha_generacion.tzinfo) - fecha_generacion).total_seconds())
-        
-        # Obtener datos del empleado para el tipo de caja
-        empleado = supabase.table("empleados").select("tipo_contrato").eq("id", empleado_id).execute()
-        tipo_caja = "PLANTA" if empleado.data[0]['tipo_contrato'] == "PLANTA" else "PLAZO_FIJO"
-        
-        # Obtener nombre del guardia
-        usuario = supabase.table("usuarios").select("nombre_completo").eq("id", usuario_id).execute()
-        nombre_guardia = usuario.data[0]['nombre_completo'] if usuario.data else "Guardia"
-        
-        # Crear registro de entrega
-        entrega_data = {
-            "empleado_id": empleado_id,
-            "usuario_id": usuario_id,
-            "periodo_id": periodo_id,
-            "qr_token_id": qr_token_id,
-            "foto_entrega": foto_base64,
-            "dispositivo_id": dispositivo_id,
-            "ip_address": ip_address,
-            "latitud": latitud,
-            "longitud": longitud,
-            "duracion_escaneo": duracion_escaneo,
-            "guardia": nombre_guardia,
-            "tipo_caja": tipo_caja,
-            "metodo": "QR_SEGURO",
-            "estado": "COMPLETADO",
-            "observaciones": observaciones
-        }
-        
-        entrega_result = supabase.table("entregas").insert(entrega_data).execute()
+        supabase = get_supabase()  # cliente síncrono para el worker de ingesta de fotos
+        db = get_supabase_async()
+        
+        if guardia:
+            if usuario_id is not None and usuario_id != guardia.id:
+                raise HTTPException(status_code=403, detail="El usuario no coincide con la sesión")
+            usuario_id = guardia.id
+        elif usuario_id is None:
+            raise HTTPException(status_code=401, detail="No autenticado")
+        
+        if qr_token and es_token_firmado(qr_token):
+            codigo, firmado = verificar_token(qr_token)
+            if codigo == "TOKEN_INVALIDO" or firmado['token_id'] != qr_token_id or firmado['empleado_id'] != empleado_id:
+                raise HTTPException(status_code=400, detail="QR inválido")
+            if tokens_usados.esta_usado(qr_token_id):
+                raise HTTPException(status_code=400, detail="Este QR ya fue utilizado")
+            if codigo == "TOKEN_EXPIRADO":
+                raise HTTPException(status_code=400, detail="QR expirado")
+            if periodo_id and firmado['periodo_id'] and firmado['periodo_id'] != periodo_id:
+                raise HTTPException(status_code=400, detail="Este QR fue generado para otro período")
+            
+            fecha_generacion = firmado['fecha_generacion']
+        else:
+            # Verificar token QR en la base de datos
+            token_result = await db.table("qr_tokens").select("*").eq("id", qr_token_id).execute()
+            if not token_result.data:
+                raise HTTPException(status_code=404, detail="Token QR no encontrado")
+            
+            token_data = token_result.data[0]
+            
+            # Verificar que no fue usado
+            if token_data['usado']:
+                raise HTTPException(status_code=400, detail="Este QR ya fue utilizado")
+            
+            # Verificar que no expiró
+            fecha_expiracion = datetime.fromisoformat(token_data['fecha_expiracion'].replace('Z', '+00:00'))
+            if datetime.now(fecha_expiracion.tzinfo) > fecha_expiracion:
+                raise HTTPException(status_code=400, detail="QR expirado")
+            
+            fecha_generacion = datetime.fromisoformat(token_data['fecha_generacion'].replace('Z', '+00:00'))
         
-        # Marcar token como usado
-        supabase.table("qr_tokens").update({
+        # Reclamar el token antes de guardar la foto: un QR ya usado no deja fotos en el almacén.
+        # Es condicional: si otro worker ya lo usó no se actualiza nada
+        marcado = await db.table("qr_tokens").update({
             "usado": True,
             "fecha_uso": datetime.now().isoformat(),
             "ip_uso": ip_address,
             "dispositivo_uso": dispositivo_id
-        }).eq("id", qr_token_id).execute()
+        }).eq("id", qr_token_id).eq("usado", False).execute()
+        
+        if not marcado.data:
+            tokens_usados.marcar(qr_token_id)
+            raise HTTPException(status_code=400, detail="Este QR ya fue utilizado")
+        
+        try:
+            # Guardar la foto en el almacén por bloques; la fila solo lleva la referencia
+            foto_guardada = await run_in_threadpool(get_almacen_fotos().guardar, foto.file)
+            FOTO_BYTES.observar(foto_guardada['bytes'])
+            
+            print(f"📸 Foto recibida: {foto_guardada['bytes']} bytes ({'nueva' if foto_guardada['nuevo'] else 'duplicada'})")
+            
+            # Calcular duración del escaneo
+            duracion_escaneo = int((datetime.now(fecha_generacion.tzinfo) - fecha_generacion).total_seconds())
+            
+            # Obtener datos del empleado para el tipo de caja
+            empleado = await db.table("empleados").select("tipo_contrato, sucursal_id").eq("id", empleado_id).execute()
+            tipo_caja = "PLANTA" if empleado.data[0]['tipo_contrato'] == "PLANTA" else "PLAZO_FIJO"
+            
+            # Nombre del guardia: del token de acceso o, sin token, de usuarios
+            if guardia:
+                nombre_guardia = guardia.nombre or "Guardia"
+            else:
+                usuario = await db.table("usuarios").select("nombre_completo").eq("id", usuario_id).execute()
+                nombre_guardia = usuario.data[0]['nombre_completo'] if usuario.data else "Guardia"
+            
+            # Crear registro de entrega
+            entrega_data = {
+                "empleado_id": empleado_id,
+                "usuario_id": usuario_id,
+                "periodo_id": periodo_id,
+                "qr_token_id": qr_token_id,
+                "foto_entrega": foto_guardada['ref'],
+                "dispositivo_id": dispositivo_id,
+                "ip_address": ip_address,
+                "latitud": latitud,
+                "longitud": longitud,
+                "duracion_escaneo": duracion_escaneo,
+                "guardia": nombre_guardia,
+                "tipo_caja": tipo_caja,
+                "metodo": "QR_SEGURO",
+                "estado": "COMPLETADO",
+                "observaciones": observaciones
+            }
+            
+            entrega_result = await db.table("entregas").insert(entrega_data).execute()
+        except Exception:
+            # Liberar el token si la entrega no se pudo guardar; una foto ya guardada
+            # sin entrega la borra LimpiezaFotos
+            await db.table("qr_tokens").update({"usado": False}).eq("id", qr_token_id).execute()
+            raise
+        
+        tokens_usados.marcar(qr_token_id)
+        _entrega_registrada(entrega_result.data[0], empleado.data[0])
+        
+        # Normalizar la foto en segundo plano (resolución, calidad, EXIF y miniatura)
+        await run_in_threadpool(
+            ingesta_fotos.encolar,
+            supabase,
+            entrega_result.data[0]['id'],
+            foto_guardada['ref']
+        )
         
         return {
             "success": True,
@@ -1302,6 +1799,76 @@ async def registrar_entrega_seguro(
         print(f"❌ Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al registrar entrega: {str(e)}")
 
+def _respuesta_foto(request: Request, datos: bytes, etag: str, cache_control: str) -> Response:
+    """Responder una foto con ETag fuerte, If-None-Match y un rango de bytes simple"""
+    etag = f'"{etag}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+    
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    rango = request.headers.get("range")
+    if rango and rango.startswith("bytes=") and "," not in rango:
+        total = len(datos)
+        inicio_txt, _, fin_txt = rango[len("bytes="):].partition("-")
+        try:
+            if inicio_txt:
+                inicio = int(inicio_txt)
+                fin = min(int(fin_txt), total - 1) if fin_txt else total - 1
+            else:
+                inicio = max(total - int(fin_txt), 0)
+                fin = total - 1
+        except ValueError:
+            inicio, fin = total, total - 1
+        
+        if inicio > fin or inicio >= total:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{total}"})
+        
+        headers["Content-Range"] = f"bytes {inicio}-{fin}/{total}"
+        return Response(content=datos[inicio:fin + 1], status_code=206, media_type="image/jpeg", headers=headers)
+    
+    return Response(content=datos, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/api/fotos/{foto_hash}")
+def get_foto(foto_hash: str, request: Request, variante: str = "completa"):
+    """Servir una foto por su hash de contenido (inmutable: caché de un año)"""
+    digest = hash_de_referencia(foto_hash)
+    if not digest or variante not in VARIANTES:
+        raise HTTPException(status_code=400, detail="Referencia de foto inválida")
+    
+    try:
+        datos, etag = leer_variante(f"sha256:{digest}", variante)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Foto no encontrada")
+    
+    return _respuesta_foto(request, datos, etag, "public, max-age=31536000, immutable")
+
+
+@app.get("/api/entregas/{entrega_id}/foto")
+def get_foto_entrega(entrega_id: int, request: Request, variante: str = "miniatura"):
+    """
+    Servir la foto de una entrega (variante 'miniatura' o 'completa').
+    La referencia puede cambiar cuando la foto se normaliza, por eso el caché es de un día
+    y se revalida con el ETag del contenido.
+    """
+    if variante not in VARIANTES:
+        raise HTTPException(status_code=400, detail="Variante inválida. Usa miniatura o completa")
+    
+    supabase = get_supabase()
+    entrega = supabase.table("entregas").select("foto_entrega").eq("id", entrega_id).execute()
+    if not entrega.data or not entrega.data[0].get("foto_entrega"):
+        raise HTTPException(status_code=404, detail="Entrega sin foto")
+    
+    try:
+        datos, etag = leer_variante(entrega.data[0]["foto_entrega"], variante)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Foto no encontrada")
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Referencia de foto inválida")
+    
+    return _respuesta_foto(request, datos, etag, "public, max-age=86400")
+
 # ==========================================
 # CONSULTAR AUDITORÍA DE SEGURIDAD
 # ==========================================
@@ -1366,95 +1933,109 @@ async def generar_qr_masivo(
     request: GenerarQRMasivoRequest,  # ← Body
     sucursal_id: Optional[int] = None,
     tipo_contrato: Optional[str] = None,
-    duracion_minutos: int = 60
+    duracion_minutos: int = 60,
+    chunk_size: Optional[int] = None,
+    paralelismo: Optional[int] = None,
+    formato: str = "json",
+    periodo_id: Optional[int] = None
 ):
     """
     Generar QR para múltiples empleados a la vez
+    Los tokens se insertan por bloques de `chunk_size` filas, varios bloques en paralelo
+    formato: 'json' (respuesta única), 'ndjson' o 'sse' (un evento por bloque guardado + progreso)
     """
     try:
-        supabase = get_supabase()
+        db = get_supabase_async()
+        
+        if formato != "json" and formato not in FORMATOS_STREAM:
+            raise HTTPException(status_code=400, detail="Formato inválido. Usa json, ndjson o sse")
         
         empleados_ids = request.empleados_ids
+        columnas = "id, rut, nombre, apellido, tipo_contrato"
+        
+        def filtrar(query):
+            query = query.eq("activo", True)
+            # Si hay lista específica de empleados
+            if empleados_ids:
+                return query.in_("id", empleados_ids)
+            # Si no, todos los empleados activos con filtros
+            if sucursal_id:
+                query = query.eq("sucursal_id", sucursal_id)
+            if tipo_contrato:
+                query = query.eq("tipo_contrato", tipo_contrato.upper())
+            return query
         
-        # Si hay lista específica de empleados
-        if empleados_ids and len(empleados_ids) > 0:
-            print(f"🔍 Generando para IDs específicos: {empleados_ids}")
-            empleados_query = supabase.table("empleados").select("*").in_("id", empleados_ids).eq("activo", True)
+        if empleados_ids:
+            print(f"🔍 Generando para IDs específicos: {len(empleados_ids)} empleados")
         else:
             print(f"🔍 Generando para TODOS (filtros: sucursal={sucursal_id}, tipo={tipo_contrato})")
-            # Obtener todos los empleados activos con filtros
-            empleados_query = supabase.table("empleados").select("*").eq("activo", True)
-            
-            if sucursal_id:
-                empleados_query = empleados_query.eq("sucursal_id", sucursal_id)
-            
-            if tipo_contrato:
-                empleados_query = empleados_query.eq("tipo_contrato", tipo_contrato.upper())
         
-        empleados_result = empleados_query.execute()
+        conteo = await filtrar(db.table("empleados").select("id", count="exact")).limit(1).execute()
+        total_empleados = conteo.count or 0
         
-        print(f"📊 Empleados encontrados: {len(empleados_result.data) if empleados_result.data else 0}")
+        print(f"📊 Empleados encontrados: {total_empleados}")
         
-        if not empleados_result.data or len(empleados_result.data) == 0:
+        if total_empleados == 0:
             raise HTTPException(status_code=404, detail="No se encontraron empleados activos")
         
-        empleados = empleados_result.data
-        qr_generados = []
-        errores = []
-        fecha_expiracion = None
+        if periodo_id is None:
+            periodo = await cache_periodos.activo_async(db)
+            periodo_id = periodo['id'] if periodo else None
         
-        # Generar QR para cada empleado
-        for empleado in empleados:
-            try:
-                token = secrets.token_urlsafe(32)
-                timestamp = datetime.now().isoformat()
-                hash_data = f"{token}:{empleado['id']}:{timestamp}"
-                hash_seguridad = hashlib.sha256(hash_data.encode()).hexdigest()
-                fecha_expiracion = datetime.now() + timedelta(minutes=duracion_minutos)
-                
-                qr_data = {
-                    "empleado_id": empleado['id'],
-                    "token": token,
-                    "hash_seguridad": hash_seguridad,
-                    "fecha_expiracion": fecha_expiracion.isoformat()
-                }
-                
-                result = supabase.table("qr_tokens").insert(qr_data).execute()
-                
-                qr_generados.append({
-                    "empleado_id": empleado['id'],
-                    "rut": empleado['rut'],
-                    "nombre": f"{empleado['nombre']} {empleado['apellido']}",
-                    "tipo_contrato": empleado['tipo_contrato'],
-                    "token": token,
-                    "qr_string": f"CLIPCONTROL:{token}:{empleado['id']}",
-                    "expira": fecha_expiracion.isoformat(),
-                    "hash": hash_seguridad[:16]
-                })
-                
-                print(f"✅ QR generado para: {empleado['nombre']} {empleado['apellido']}")
-                
-            except Exception as e:
-                print(f"❌ Error en empleado {empleado['id']}: {str(e)}")
-                errores.append({
-                    "empleado_id": empleado['id'],
-                    "rut": empleado.get('rut', 'N/A'),
-                    "nombre": f"{empleado.get('nombre', '')} {empleado.get('apellido', '')}",
-                    "error": str(e)
-                })
-        
-        print(f"🎉 Total generados: {len(qr_generados)}, Errores: {len(errores)}")
+        # Los inserts por bloques corren en hilos con el cliente síncrono; los
+        # empleados se leen por páginas a medida que se generan los bloques
+        supabase = get_supabase()
+        empleados = (
+            empleado
+            for pagina in iterar_paginas(lambda: filtrar(supabase.table("empleados").select(columnas)).order("id"))
+            for empleado in pagina
+        )
+        
+        # Modo streaming: cada bloque se envía apenas queda guardado
+        if formato in FORMATOS_STREAM:
+            return StreamingResponse(
+                stream_tokens_masivo(
+                    supabase,
+                    empleados,
+                    total_empleados,
+                    duracion_minutos,
+                    periodo_id=periodo_id,
+                    formato=formato,
+                    chunk_size=chunk_size,
+                    paralelismo=paralelismo
+                ),
+                media_type=FORMATOS_STREAM[formato],
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        # Construir tokens en memoria e insertarlos por bloques en paralelo
+        resultado = await run_in_threadpool(
+            generar_tokens_masivo,
+            supabase,
+            empleados,
+            duracion_minutos,
+            periodo_id=periodo_id,
+            chunk_size=chunk_size,
+            paralelismo=paralelismo
+        )
+        qr_generados = resultado["qr_data"]
+        chunks_fallidos = resultado["chunks_fallidos"]
+        
+        print(f"🎉 Total generados: {len(qr_generados)}, Chunks fallidos: {len(chunks_fallidos)}, {resultado['tokens_por_segundo']} tokens/s")
         
         return {
             "success": True,
-            "total_empleados": len(empleados),
+            "total_empleados": total_empleados,
             "qr_generados": len(qr_generados),
-            "qr_fallidos": len(errores),
+            "qr_fallidos": resultado["qr_fallidos"],
             "duracion_minutos": duracion_minutos,
-            "expira": fecha_expiracion.isoformat() if fecha_expiracion else None,
+            "expira": resultado["fecha_expiracion"].isoformat(),
             "qr_data": qr_generados,
-            "errores": errores if errores else None,
-            "mensaje": f"Se generaron {len(qr_generados)} QR de {len(empleados)} empleados"
+            "total_chunks": resultado["total_chunks"],
+            "chunks_fallidos": chunks_fallidos if chunks_fallidos else None,
+            "duracion_segundos": resultado["duracion_segundos"],
+            "tokens_por_segundo": resultado["tokens_por_segundo"],
+            "mensaje": f"Se generaron {len(qr_generados)} QR de {total_empleados} empleados"
         }
         
     except HTTPException:
@@ -1464,6 +2045,35 @@ async def generar_qr_masivo(
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.post("/api/qr/render")
+def render_qr_masivo(request: RenderQRRequest, formato: str = "pdf"):
+    """
+    Renderizar en el servidor las etiquetas de un resultado de generación masiva
+    (nombre, RUT y QR por empleado) como PDF imprimible o ZIP de PNG
+    """
+    if formato not in ("pdf", "zip"):
+        raise HTTPException(status_code=400, detail="Formato inválido. Usa pdf o zip")
+    if not request.qr_data:
+        raise HTTPException(status_code=400, detail="No hay QR para renderizar")
+    
+    items = [qr.dict() for qr in request.qr_data]
+    fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
+    print(f"🖨️ Renderizando {len(items)} etiquetas QR ({formato})")
+    
+    if formato == "zip":
+        return StreamingResponse(
+            stream_zip(items),
+            media_type="application/zip",
+            headers={"Content-Disposition": f"attachment; filename=qr_{fecha_actual}.zip"}
+        )
+    
+    return StreamingResponse(
+        stream_pdf(items),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename=qr_{fecha_actual}.pdf"}
+    )
+
+
 @app.get("/api/qr/estadisticas")
 def get_estadisticas_qr():
     """
@@ -1502,10 +2112,11 @@ def get_estadisticas_qr():
 @app.get("/api/estadisticas/dashboard")
 async def get_estadisticas_dashboard():
     try:
+        db = get_supabase_async()
         # Obtener período activo
-        periodo_result = supabase.table("periodos_entrega").select("*").eq("activo", True).execute()
+        periodo_activo = await cache_periodos.activo_async(db)
         
-        if not periodo_result.data:
+        if not periodo_activo:
             return {
                 "total_empleados": 0,
                 "entregas_realizadas": 0,
@@ -1515,17 +2126,11 @@ async def get_estadisticas_dashboard():
                 "periodo_activo": None
             }
         
-        periodo_activo = periodo_result.data[0]
-        
-        # Total empleados activos
-        emp_result = supabase.table("empleados").select("id", count="exact").eq("activo", True).execute()
-        total_empleados = emp_result.count
-        
-        # Entregas DEL PERÍODO ACTIVO (directo por periodo_id)
-        entregas_result = supabase.table("entregas").select("empleado_id").eq("periodo_id", periodo_activo['id']).execute()
-        
-        total_entregas = len(entregas_result.data)
-        empleados_que_retiraron = len(set([e['empleado_id'] for e in entregas_result.data]))
+        # Contadores en memoria (la primera llamada los siembra desde la BD)
+        datos = await run_in_threadpool(agregados.resumen, get_supabase(), periodo_activo['id'])
+        total_empleados = datos["empleados_activos"]
+        total_entregas = datos["entregas_periodo"]
+        empleados_que_retiraron = datos["empleados_retiraron"]
         
         # Pendientes
         pendientes = total_empleados - empleados_que_retiraron
@@ -1549,45 +2154,16 @@ async def get_estadisticas_dashboard():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/reportes/pendientes")
-async def generar_reporte_pendientes():
-    try:
-        # Obtener período activo
-        periodo_result = supabase.table("periodos_entrega").select("*").eq("activo", True).execute()
-        if not periodo_result.data:
-            raise HTTPException(status_code=404, detail="No hay período activo")
-        
-        periodo_activo = periodo_result.data[0]
-        
-        # Todos los empleados activos
-        empleados_result = supabase.table("v_empleados_completo").select("*").eq("activo", True).execute()
-        empleados = empleados_result.data
-        
-        # Empleados que YA retiraron EN ESTE PERÍODO
-        entregas_result = supabase.table("entregas").select("empleado_id").eq("periodo_id", periodo_activo['id']).execute()
-        empleados_con_entrega = set([e['empleado_id'] for e in entregas_result.data])
-        
-        # Filtrar solo los pendientes
-        pendientes = [emp for emp in empleados if emp['id'] not in empleados_con_entrega]
-        
-        # Crear Excel
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Empleados Pendientes"
-        
-        headers = ['RUT', 'Nombre Completo', 'Sucursal', 'Tipo Contrato', 'Sección', 'Email', 'Teléfono']
-        ws.append(headers)
-        
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF")
-        
-        for cell in ws[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-        
-        for emp in pendientes:
-            ws.append([
+def _paginas_pendientes(supabase, periodo_id: int):
+    """Filas del Excel de pendientes, una página de empleados activos a la vez"""
+    retiraron = entregados.conjunto(supabase, periodo_id)
+    for pagina in iterar_paginas(
+        lambda: supabase.table("v_empleados_completo").select(
+            "id, rut, nombre_completo, sucursal, tipo_contrato, seccion, email, telefono"
+        ).eq("activo", True).order("id")
+    ):
+        yield [
+            [
                 emp.get('rut', ''),
                 emp.get('nombre_completo', ''),
                 emp.get('sucursal', ''),
@@ -1595,33 +2171,35 @@ async def generar_reporte_pendientes():
                 emp.get('seccion', ''),
                 emp.get('email', ''),
                 emp.get('telefono', '')
-            ])
-        
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = min(max_length + 2, 50)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            ]
+            for emp in pagina
+            if not retiraron.contiene(emp['id'])
+        ]
+
+
+@app.get("/api/reportes/pendientes")
+async def generar_reporte_pendientes():
+    """Excel de empleados activos que no han retirado en el período activo (se envía mientras se genera)"""
+    try:
+        db = get_supabase_async()
+        # Obtener período activo
+        periodo_activo = await cache_periodos.activo_async(db)
+        if not periodo_activo:
+            raise HTTPException(status_code=404, detail="No hay período activo")
         
-        excel_file = io.BytesIO()
-        wb.save(excel_file)
-        excel_file.seek(0)
+        headers = ['RUT', 'Nombre Completo', 'Sucursal', 'Tipo Contrato', 'Sección', 'Email', 'Teléfono']
         
         fecha_actual = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"pendientes_{periodo_activo['nombre']}_{fecha_actual}.xlsx"
         
         return StreamingResponse(
-            excel_file,
+            stream_xlsx("Empleados Pendientes", headers, _paginas_pendientes(get_supabase(), periodo_activo['id'])),
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 # ============================================
@@ -1631,18 +2209,19 @@ async def generar_reporte_pendientes():
 @app.get("/api/periodos")
 async def get_periodos():
     try:
-        result = supabase.table("periodos_entrega").select("*").order("fecha_inicio", desc=True).execute()
-        return result.data
+        db = get_supabase_async()
+        return await cache_periodos.catalogo_async(db)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/periodos/activo")
 async def get_periodo_activo():
     try:
-        result = supabase.table("periodos_entrega").select("*").eq("activo", True).execute()
-        if not result.data:
+        db = get_supabase_async()
+        periodo = await cache_periodos.activo_async(db)
+        if not periodo:
             raise HTTPException(status_code=404, detail="No hay período activo")
-        return result.data[0]
+        return periodo
     except HTTPException:
         raise
     except Exception as e:
@@ -1651,8 +2230,10 @@ async def get_periodo_activo():
 @app.post("/api/periodos")
 async def create_periodo(periodo: dict):
     try:
+        db = get_supabase_async()
         # Desactivar otros períodos activos
-        supabase.table("periodos_entrega").update({"activo": False}).eq("activo", True).execute()
+        await db.table("periodos_entrega").update({"activo": False}).eq("activo", True).execute()
+        cache_periodos.invalidar()
         
         # Crear nuevo período activo
         data = {
@@ -1662,7 +2243,9 @@ async def create_periodo(periodo: dict):
             "activo": True
         }
         
-        result = supabase.table("periodos_entrega").insert(data).execute()
+        result = await db.table("periodos_entrega").insert(data).execute()
+        cache_periodos.invalidar()
+        precargar_en_segundo_plano(get_supabase())
         return result.data[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1670,8 +2253,10 @@ async def create_periodo(periodo: dict):
 @app.put("/api/periodos/{periodo_id}/cerrar")
 async def cerrar_periodo(periodo_id: int):
     try:
+        db = get_supabase_async()
         # Cerrar período
-        result = supabase.table("periodos_entrega").update({"activo": False}).eq("id", periodo_id).execute()
+        result = await db.table("periodos_entrega").update({"activo": False}).eq("id", periodo_id).execute()
+        cache_periodos.invalidar()
         return {"message": "Período cerrado correctamente", "data": result.data[0]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1679,11 +2264,15 @@ async def cerrar_periodo(periodo_id: int):
 @app.put("/api/periodos/{periodo_id}/activar")
 async def activar_periodo(periodo_id: int):
     try:
+        db = get_supabase_async()
         # Desactivar otros períodos
-        supabase.table("periodos_entrega").update({"activo": False}).eq("activo", True).execute()
+        await db.table("periodos_entrega").update({"activo": False}).eq("activo", True).execute()
+        cache_periodos.invalidar()
         
         # Activar el seleccionado
-        result = supabase.table("periodos_entrega").update({"activo": True}).eq("id", periodo_id).execute()
+        result = await db.table("periodos_entrega").update({"activo": True}).eq("id", periodo_id).execute()
+        cache_periodos.invalidar()
+        precargar_en_segundo_plano(get_supabase())
         return {"message": "Período activado correctamente", "data": result.data[0]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1695,6 +2284,7 @@ async def activar_periodo(periodo_id: int):
 @app.put("/api/periodos/{periodo_id}")
 async def update_periodo(periodo_id: int, periodo: dict):
     try:
+        db = get_supabase_async()
         data = {}
         if 'nombre' in periodo:
             data['nombre'] = periodo['nombre']
@@ -1703,7 +2293,8 @@ async def update_periodo(periodo_id: int, periodo: dict):
         if 'fecha_fin' in periodo:
             data['fecha_fin'] = periodo['fecha_fin']
         
-        result = supabase.table("periodos_entrega").update(data).eq("id", periodo_id).execute()
+        result = await db.table("periodos_entrega").update(data).eq("id", periodo_id).execute()
+        cache_periodos.invalidar()
         return {"message": "Período actualizado correctamente", "data": result.data[0]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1711,17 +2302,19 @@ async def update_periodo(periodo_id: int, periodo: dict):
 @app.delete("/api/periodos/{periodo_id}")
 async def delete_periodo(periodo_id: int):
     try:
+        db = get_supabase_async()
         # Verificar que no sea el período activo
-        periodo = supabase.table("periodos_entrega").select("*").eq("id", periodo_id).execute()
+        periodo = await db.table("periodos_entrega").select("*").eq("id", periodo_id).execute()
         if periodo.data and periodo.data[0].get('activo'):
             raise HTTPException(status_code=400, detail="No puedes eliminar el período activo")
         
         # Verificar que no tenga entregas
-        entregas = supabase.table("entregas").select("id", count="exact").eq("periodo_id", periodo_id).execute()
+        entregas = await db.table("entregas").select("id", count="exact").eq("periodo_id", periodo_id).execute()
         if entregas.count and entregas.count > 0:
             raise HTTPException(status_code=400, detail="No puedes eliminar un período con entregas registradas")
         
-        result = supabase.table("periodos_entrega").delete().eq("id", periodo_id).execute()
+        result = await db.table("periodos_entrega").delete().eq("id", periodo_id).execute()
+        cache_periodos.invalidar()
         return {"message": "Período eliminado correctamente"}
     except HTTPException:
         raise
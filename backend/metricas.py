@@ -0,0 +1,277 @@
+"""
+ClipControl Backend - Métricas (formato de texto de Prometheus)
+
+Cada hilo registra en su propio fragmento (un dict local al hilo), así
+registrar una observación no toma ningún lock; solo al exponer /metrics se
+suman los fragmentos de todos los hilos.
+"""
+import contextvars
+import inspect
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Optional, Tuple
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_CONSULTA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+BUCKETS_CONSULTAS_POR_PETICION = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+BUCKETS_BYTES = (50_000, 100_000, 250_000, 500_000, 1_000_000, 2_000_000, 5_000_000, 10_000_000)
+
+
+class Registro:
+    """Conjunto de métricas con un fragmento de datos por hilo"""
+
+    def __init__(self):
+        self.metricas = []
+        self._local = threading.local()
+        self._fragmentos = []
+        self._lock = threading.Lock()
+
+    def fragmento(self) -> dict:
+        datos = getattr(self._local, "datos", None)
+        if datos is None:
+            datos = self._local.datos = {}
+            with self._lock:
+                self._fragmentos.append(datos)
+        return datos
+
+    def agregar(self, metrica: "_Metrica") -> "_Metrica":
+        self.metricas.append(metrica)
+        return metrica
+
+    def exponer(self) -> str:
+        """Texto para /metrics: suma de los fragmentos de todos los hilos"""
+        with self._lock:
+            fragmentos = [datos.copy() for datos in self._fragmentos]
+
+        lineas = []
+        for metrica in self.metricas:
+            series = {}
+            for datos in fragmentos:
+                for (nombre, etiquetas), valor in datos.items():
+                    if nombre == metrica.nombre:
+                        series.setdefault(etiquetas, []).append(valor)
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            for etiquetas in sorted(series):
+                lineas.extend(metrica.exponer(etiquetas, series[etiquetas]))
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metrica(ABC):
+    tipo = ""
+
+    def __init__(self, registro: Registro, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = ()):
+        self.registro = registro
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        registro.agregar(self)
+
+    def _etiquetas(self, valores: tuple, extra: str = "") -> str:
+        pares = [f'{clave}="{_escapar(valor)}"' for clave, valor in zip(self.etiquetas, valores)]
+        if extra:
+            pares.append(extra)
+        return "{" + ",".join(pares) + "}" if pares else ""
+
+    @abstractmethod
+    def exponer(self, valores: tuple, fragmentos: list) -> list:
+        ...
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, *valores, cantidad: float = 1):
+        datos = self.registro.fragmento()
+        clave = (self.nombre, valores)
+        datos[clave] = datos.get(clave, 0) + cantidad
+
+    def exponer(self, valores: tuple, fragmentos: list) -> list:
+        return [f"{self.nombre}{self._etiquetas(valores)} {sum(fragmentos)}"]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, registro: Registro, nombre: str, ayuda: str, etiquetas: Tuple[str, ...] = (), buckets: tuple = BUCKETS_LATENCIA):
+        super().__init__(registro, nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor: float, *valores):
+        """Cada fragmento guarda un contador por bucket (sin acumular) y la suma al final"""
+        datos = self.registro.fragmento()
+        clave = (self.nombre, valores)
+        conteos = datos.get(clave)
+        if conteos is None:
+            conteos = datos[clave] = [0] * (len(self.buckets) + 2)
+        conteos[bisect_left(self.buckets, valor)] += 1
+        conteos[-1] += valor
+
+    def exponer(self, valores: tuple, fragmentos: list) -> list:
+        totales = [sum(columna) for columna in zip(*(list(f) for f in fragmentos))]
+        lineas = []
+        acumulado = 0
+        for limite, conteo in zip(self.buckets + ("+Inf",), totales[:-1]):
+            acumulado += conteo
+            le = f'le="{limite}"'
+            lineas.append(f"{self.nombre}_bucket{self._etiquetas(valores, le)} {acumulado}")
+        lineas.append(f"{self.nombre}_sum{self._etiquetas(valores)} {totales[-1]}")
+        lineas.append(f"{self.nombre}_count{self._etiquetas(valores)} {acumulado}")
+        return lineas
+
+
+registro = Registro()
+
+HTTP_DURACION = Histograma(
+    registro, "clipcontrol_http_duracion_segundos",
+    "Latencia de las peticiones HTTP por ruta", ("metodo", "ruta")
+)
+HTTP_PETICIONES = Contador(
+    registro, "clipcontrol_http_peticiones_total",
+    "Peticiones HTTP por ruta y código de estado", ("metodo", "ruta", "estado")
+)
+DB_CONSULTAS_POR_PETICION = Histograma(
+    registro, "clipcontrol_db_consultas_por_peticion",
+    "Idas a la base de datos por petición", ("ruta",), BUCKETS_CONSULTAS_POR_PETICION
+)
+DB_DURACION = Histograma(
+    registro, "clipcontrol_db_consulta_duracion_segundos",
+    "Duración de cada consulta a la base de datos por tabla", ("tabla",), BUCKETS_CONSULTA
+)
+DB_ERRORES = Contador(
+    registro, "clipcontrol_db_errores_total",
+    "Consultas a la base de datos que fallaron, por tabla", ("tabla",)
+)
+FOTO_BYTES = Histograma(
+    registro, "clipcontrol_foto_bytes",
+    "Tamaño de las fotos de entrega subidas", (), BUCKETS_BYTES
+)
+QR_VALIDACIONES = Contador(
+    registro, "clipcontrol_qr_validaciones_total",
+    "Resultados de /api/qr/validar por código", ("codigo",)
+)
+
+
+# ==========================================
+# CONSULTAS A LA BASE DE DATOS
+# ==========================================
+
+# Contador de consultas de la petición en curso (lo crea el middleware;
+# run_in_threadpool y asyncio.to_thread copian el contexto a sus hilos)
+_consultas_peticion: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("consultas_peticion", default=None)
+
+
+def registrar_consulta(tabla: str, segundos: float, error: bool = False):
+    DB_DURACION.observar(segundos, tabla)
+    if error:
+        DB_ERRORES.inc(tabla)
+    contador = _consultas_peticion.get()
+    if contador is not None:
+        contador[0] += 1
+
+
+class _ConsultaMedida:
+    """Envuelve un constructor de consultas y mide su `execute()`"""
+
+    __slots__ = ("_consulta", "_tabla")
+
+    def __init__(self, consulta, tabla: str):
+        self._consulta = consulta
+        self._tabla = tabla
+
+    def __getattr__(self, nombre: str):
+        atributo = getattr(self._consulta, nombre)
+        if not callable(atributo):
+            return atributo
+
+        def llamar(*args, **kwargs):
+            resultado = atributo(*args, **kwargs)
+            return _ConsultaMedida(resultado, self._tabla) if hasattr(resultado, "execute") else resultado
+        return llamar
+
+    def execute(self):
+        ejecutar = self._consulta.execute
+        if inspect.iscoroutinefunction(ejecutar):
+            return self._execute_async(ejecutar)
+        inicio = time.perf_counter()
+        error = True
+        try:
+            resultado = ejecutar()
+            error = False
+            return resultado
+        finally:
+            registrar_consulta(self._tabla, time.perf_counter() - inicio, error)
+
+    async def _execute_async(self, ejecutar):
+        inicio = time.perf_counter()
+        error = True
+        try:
+            resultado = await ejecutar()
+            error = False
+            return resultado
+        finally:
+            registrar_consulta(self._tabla, time.perf_counter() - inicio, error)
+
+
+class ClienteMedido:
+    """Cliente de base de datos (Supabase o repositorio local) con cada consulta medida"""
+
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def table(self, nombre: str):
+        return _ConsultaMedida(self._cliente.table(nombre), nombre)
+
+    def rpc(self, funcion: str, params: Optional[dict] = None):
+        return _ConsultaMedida(self._cliente.rpc(funcion, params or {}), f"rpc:{funcion}")
+
+    def __getattr__(self, nombre: str):
+        return getattr(self._cliente, nombre)
+
+
+def instrumentar(cliente) -> ClienteMedido:
+    return cliente if isinstance(cliente, ClienteMedido) else ClienteMedido(cliente)
+
+
+# ==========================================
+# MIDDLEWARE HTTP (ASGI PURO)
+# ==========================================
+
+class MiddlewareMetricas:
+    """Mide latencia y consultas por petición usando la plantilla de la ruta como etiqueta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        contador = [0]
+        token = _consultas_peticion.set(contador)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracion = time.perf_counter() - inicio
+            _consultas_peticion.reset(token)
+            # El router deja la ruta encontrada en el scope; sin ruta se agrupa para no crear series por URL
+            ruta = getattr(scope.get("route"), "path", None) or "sin_ruta"
+            metodo = scope["method"]
+            HTTP_DURACION.observar(duracion, metodo, ruta)
+            HTTP_PETICIONES.inc(metodo, ruta, str(estado[0]))
+            DB_CONSULTAS_POR_PETICION.observar(contador[0], ruta)
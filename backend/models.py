@@ -180,4 +180,14 @@ class MessageResponse(BaseModel):
 # ==========================================
 
 class GenerarQRMasivoRequest(BaseModel):
-    empleados_ids: Optional[List[int]] = None
\ No newline at end of file
+    empleados_ids: Optional[List[int]] = None
+
+class QRRenderItem(BaseModel):
+    empleado_id: int
+    rut: Optional[str] = None
+    nombre: Optional[str] = None
+    tipo_contrato: Optional[str] = None
+    qr_string: str
+
+class RenderQRRequest(BaseModel):
+    qr_data: List[QRRenderItem]
@@ -0,0 +1,309 @@
+"""
+ClipControl Backend - Importación de nómina (XLSX / CSV)
+
+El archivo se lee fila a fila (openpyxl en modo read_only o csv), cada
+fila se valida y se compara contra los empleados existentes cargados en
+una sola pasada. Los cambios se aplican por bloques: inserts, upserts por
+id para las actualizaciones y un update por bloque para desactivar a
+quienes ya no vienen en la nómina.
+"""
+import csv
+import io
+import itertools
+import time
+import unicodedata
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database import iterar_paginas
+from qr_masivo import dividir_en_chunks
+from ruts import normalizar_rut
+
+TIPOS_CONTRATO = ("PLANTA", "PLAZO_FIJO")
+CAMPOS = ("rut", "nombre", "apellido", "email", "telefono", "tipo_contrato", "seccion", "sucursal_id", "fecha_ingreso")
+
+# Encabezados aceptados (sin tildes, minúsculas) -> campo
+ENCABEZADOS = {
+    "rut": "rut",
+    "nombre": "nombre",
+    "nombres": "nombre",
+    "apellido": "apellido",
+    "apellidos": "apellido",
+    "email": "email",
+    "correo": "email",
+    "telefono": "telefono",
+    "tipo contrato": "tipo_contrato",
+    "tipo_contrato": "tipo_contrato",
+    "contrato": "tipo_contrato",
+    "seccion": "seccion",
+    "sucursal": "sucursal",
+    "sucursal_id": "sucursal",
+    "fecha ingreso": "fecha_ingreso",
+    "fecha_ingreso": "fecha_ingreso",
+}
+
+
+def _sin_tildes(texto: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFD", texto) if unicodedata.category(c) != "Mn")
+
+
+def _limpiar(valor) -> Optional[str]:
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    return texto or None
+
+
+# ==========================================
+# LECTURA DEL ARCHIVO
+# ==========================================
+
+def _filas_xlsx(archivo) -> Iterator[tuple]:
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        yield from libro.active.iter_rows(values_only=True)
+    finally:
+        libro.close()
+
+
+def _filas_csv(archivo) -> Iterator[list]:
+    texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+    try:
+        primera = texto.readline()
+        # Excel en español guarda los CSV con ';'
+        delimitador = ";" if primera.count(";") > primera.count(",") else ","
+        yield from csv.reader(itertools.chain([primera], texto), delimiter=delimitador)
+    finally:
+        # El archivo subido lo cierra quien lo abrió
+        texto.detach()
+
+
+def leer_nomina(archivo, nombre_archivo: str) -> Iterator[Tuple[int, dict]]:
+    """(número de fila en el archivo, {campo: valor}) por cada fila con datos"""
+    if nombre_archivo.lower().endswith((".xlsx", ".xlsm")):
+        filas = _filas_xlsx(archivo)
+    elif nombre_archivo.lower().endswith((".csv", ".txt")):
+        filas = _filas_csv(archivo)
+    else:
+        raise ValueError("Formato no soportado. Sube un archivo .xlsx o .csv")
+
+    encabezado = next(filas, None)
+    if not encabezado:
+        raise ValueError("El archivo está vacío")
+    campos = [ENCABEZADOS.get(_sin_tildes(str(c or "")).strip().lower()) for c in encabezado]
+    faltan = {"rut", "nombre", "apellido", "tipo_contrato", "sucursal"} - set(campos)
+    if faltan:
+        raise ValueError(f"Faltan columnas en el encabezado: {', '.join(sorted(faltan))}")
+
+    for numero, valores in enumerate(filas, start=2):
+        if not any(_limpiar(v) for v in valores):
+            continue
+        yield numero, {campo: valor for campo, valor in zip(campos, valores) if campo}
+
+
+# ==========================================
+# VALIDACIÓN
+# ==========================================
+
+def _fecha(valor) -> Optional[str]:
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    texto = str(valor).strip()
+    for formato in ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(texto, formato).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha de ingreso inválida: {texto}")
+
+
+def validar_fila(fila: dict, sucursales: Dict[str, int]) -> dict:
+    """Fila del archivo -> columnas de empleados. ValueError con el motivo si no es válida"""
+    rut = normalizar_rut(_limpiar(fila.get("rut")) or "")
+
+    nombre = _limpiar(fila.get("nombre"))
+    apellido = _limpiar(fila.get("apellido"))
+    if not nombre or not apellido:
+        raise ValueError("Nombre y apellido son obligatorios")
+
+    tipo = _sin_tildes(_limpiar(fila.get("tipo_contrato")) or "").upper().replace(" ", "_").replace("-", "_")
+    if tipo not in TIPOS_CONTRATO:
+        raise ValueError(f"Tipo de contrato inválido: {fila.get('tipo_contrato')}")
+
+    sucursal = _limpiar(fila.get("sucursal"))
+    if sucursal and sucursal.endswith(".0"):
+        sucursal = sucursal[:-2]
+    sucursal_id = sucursales.get(_sin_tildes(sucursal or "").lower())
+    if sucursal_id is None:
+        raise ValueError(f"Sucursal no encontrada: {sucursal}")
+
+    return {
+        "rut": rut,
+        "nombre": nombre,
+        "apellido": apellido,
+        "email": _limpiar(fila.get("email")),
+        "telefono": _limpiar(fila.get("telefono")),
+        "tipo_contrato": tipo,
+        "seccion": _limpiar(fila.get("seccion")),
+        "sucursal_id": sucursal_id,
+        "fecha_ingreso": _fecha(fila.get("fecha_ingreso")),
+    }
+
+
+def _mapa_sucursales(supabase) -> Dict[str, int]:
+    """Sucursal por id o por nombre (sin tildes, minúsculas)"""
+    mapa = {}
+    for sucursal in supabase.table("sucursales").select("id, nombre").execute().data or []:
+        mapa[str(sucursal["id"])] = sucursal["id"]
+        mapa[_sin_tildes(sucursal["nombre"]).lower()] = sucursal["id"]
+    return mapa
+
+
+def _empleados_por_rut(supabase) -> Dict[str, dict]:
+    existentes = {}
+    for pagina in iterar_paginas(
+        lambda: supabase.table("empleados").select("id, activo, " + ", ".join(CAMPOS)).order("id")
+    ):
+        for empleado in pagina:
+            try:
+                existentes[normalizar_rut(empleado["rut"])] = empleado
+            except ValueError:
+                existentes[empleado["rut"]] = empleado
+    return existentes
+
+
+def _cambia(actual: dict, nuevo: dict) -> bool:
+    if not actual.get("activo"):
+        return True
+    for campo in CAMPOS:
+        if campo == "fecha_ingreso" and nuevo[campo] is None:
+            continue
+        if str(actual.get(campo) or "")[:10 if campo == "fecha_ingreso" else None] != str(nuevo[campo] or ""):
+            return True
+    return False
+
+
+# ==========================================
+# IMPORTACIÓN
+# ==========================================
+
+def importar_nomina(
+    supabase,
+    archivo,
+    nombre_archivo: str,
+    desactivar_ausentes: bool = False,
+    simular: bool = False,
+    tamano_bloque: int = 500
+) -> dict:
+    """
+    Importar la nómina y devolver el resumen con un error por fila rechazada.
+    Con `simular` solo calcula los cambios sin escribir. `ruts_a_desactivar`
+    lista a los ausentes; si hubo filas con error no se desactiva a ninguno
+    (`desactivacion_omitida`).
+    """
+    inicio = time.perf_counter()
+    sucursales = _mapa_sucursales(supabase)
+    existentes = _empleados_por_rut(supabase)
+
+    errores: List[dict] = []
+    vistos: Dict[str, int] = {}
+    insertar: List[Tuple[int, dict]] = []
+    actualizar: List[Tuple[int, dict]] = []
+    sin_cambios = 0
+    total_filas = 0
+
+    for numero, fila in leer_nomina(archivo, nombre_archivo):
+        total_filas += 1
+        rut_archivo = _limpiar(fila.get("rut"))
+
+        # El RUT cuenta como presente en la nómina aunque el resto de la fila falle,
+        # así un error de tipeo no desactiva al empleado
+        try:
+            rut = normalizar_rut(rut_archivo or "")
+        except ValueError as e:
+            errores.append({"fila": numero, "rut": rut_archivo, "error": str(e)})
+            continue
+        if rut in vistos:
+            errores.append({"fila": numero, "rut": rut, "error": f"RUT repetido (fila {vistos[rut]})"})
+            continue
+        vistos[rut] = numero
+
+        try:
+            empleado = validar_fila(fila, sucursales)
+        except ValueError as e:
+            errores.append({"fila": numero, "rut": rut, "error": str(e)})
+            continue
+
+        actual = existentes.get(rut)
+        if actual is None:
+            insertar.append((numero, {**empleado, "activo": True}))
+        elif _cambia(actual, empleado):
+            if empleado["fecha_ingreso"] is None:
+                empleado["fecha_ingreso"] = actual.get("fecha_ingreso")
+            actualizar.append((numero, {**empleado, "id": actual["id"], "activo": True}))
+        else:
+            sin_cambios += 1
+
+    # Con filas rechazadas no se desactiva a nadie: un RUT mal escrito
+    # haría parecer ausente a un empleado que sí viene en la nómina
+    desactivar = []
+    desactivacion_omitida = False
+    if desactivar_ausentes:
+        desactivar = [e for rut, e in existentes.items() if e.get("activo") and rut not in vistos]
+        if errores and desactivar:
+            desactivacion_omitida = True
+    ruts_a_desactivar = [e["rut"] for e in desactivar]
+    if desactivacion_omitida:
+        desactivar = []
+
+    insertados = actualizados = desactivados = 0
+    ruts_modificados = []
+    if not simular:
+        for bloque in dividir_en_chunks(insertar, tamano_bloque):
+            try:
+                supabase.table("empleados").insert([empleado for _, empleado in bloque]).execute()
+                insertados += len(bloque)
+                ruts_modificados += [empleado["rut"] for _, empleado in bloque]
+            except Exception as e:
+                errores += [{"fila": numero, "rut": empleado["rut"], "error": f"No se pudo insertar: {e}"} for numero, empleado in bloque]
+
+        for bloque in dividir_en_chunks(actualizar, tamano_bloque):
+            try:
+                supabase.table("empleados").upsert([empleado for _, empleado in bloque], on_conflict="id").execute()
+                actualizados += len(bloque)
+                ruts_modificados += [existentes[empleado["rut"]]["rut"] for _, empleado in bloque]
+                ruts_modificados += [empleado["rut"] for _, empleado in bloque]
+            except Exception as e:
+                errores += [{"fila": numero, "rut": empleado["rut"], "error": f"No se pudo actualizar: {e}"} for numero, empleado in bloque]
+
+        for bloque in dividir_en_chunks(desactivar, tamano_bloque):
+            try:
+                supabase.table("empleados").update({"activo": False}).in_("id", [e["id"] for e in bloque]).execute()
+                desactivados += len(bloque)
+                ruts_modificados += [e["rut"] for e in bloque]
+            except Exception as e:
+                errores += [{"fila": None, "rut": emp["rut"], "error": f"No se pudo desactivar: {e}"} for emp in bloque]
+    else:
+        insertados, actualizados, desactivados = len(insertar), len(actualizar), len(desactivar)
+
+    errores.sort(key=lambda error: (error["fila"] is None, error["fila"] or 0))
+    return {
+        "simulado": simular,
+        "total_filas": total_filas,
+        "insertados": insertados,
+        "actualizados": actualizados,
+        "sin_cambios": sin_cambios,
+        "desactivados": desactivados,
+        "ruts_a_desactivar": ruts_a_desactivar,
+        "desactivacion_omitida": desactivacion_omitida,
+        "con_error": len(errores),
+        "errores": errores,
+        "ruts_modificados": ruts_modificados,
+        "duracion_segundos": round(time.perf_counter() - inicio, 3)
+    }
@@ -0,0 +1,85 @@
+"""
+ClipControl Backend - Paginación por cursor (keyset)
+
+El cursor es opaco para el cliente: JSON con los valores de la última
+fila entregada, codificado en base64url.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+# Tope de filas por respuesta de PostgREST (y de SQLITE_MAX_FILAS por defecto)
+MAX_FILAS_RESPUESTA = 1000
+
+
+def _entero(valor) -> int:
+    if isinstance(valor, bool) or not isinstance(valor, int):
+        raise ValueError
+    return valor
+
+
+def _fecha_iso(valor) -> str:
+    if not isinstance(valor, str):
+        raise ValueError
+    datetime.fromisoformat(valor)
+    return valor
+
+
+# Tipo esperado de cada clave del cursor: los valores terminan dentro de
+# filtros PostgREST, así que nada llega a la query sin validar
+_VALIDADORES = {
+    "id": _entero,
+    "fecha_hora": _fecha_iso,
+}
+
+
+def codificar_cursor(valores: dict) -> str:
+    datos = json.dumps(valores, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode()
+
+
+def decodificar_cursor(cursor: str, claves: tuple) -> Optional[dict]:
+    """Decodificar un cursor; un cursor vacío significa primera página. ValueError si es inválido"""
+    if not cursor:
+        return None
+    try:
+        datos = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(datos)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+    if not isinstance(valores, dict) or any(clave not in valores for clave in claves):
+        raise ValueError("Cursor inválido")
+    try:
+        return {clave: _VALIDADORES[clave](valores[clave]) for clave in claves}
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+
+def hay_mas(filas: list, limit: int) -> bool:
+    """
+    ¿Quedan filas después de una página pedida con limit + 1? Una respuesta
+    cortada en el tope del servidor también cuenta: la fila extra no llegó.
+    """
+    return len(filas) > limit or len(filas) >= MAX_FILAS_RESPUESTA
+
+
+def pagina_con_cursor(filas: list, limit: int, claves: tuple) -> dict:
+    """
+    Armar la respuesta de una página pedida con limit + 1 filas:
+    la fila extra solo indica que hay más y no se entrega.
+    """
+    hay_mas_filas = hay_mas(filas, limit)
+    filas = filas[:limit]
+    next_cursor = None
+    if hay_mas_filas and filas:
+        next_cursor = codificar_cursor({clave: filas[-1][clave] for clave in claves})
+    return {"data": filas, "next_cursor": next_cursor}
+
+
+def filtro_keyset_desc(columna: str, valor, id_valor: int) -> str:
+    """Filtro PostgREST `or` para (columna, id) < (valor, id_valor) en orden descendente"""
+    valor = str(valor)
+    if '"' in valor or "\\" in valor:
+        raise ValueError(f"Valor no permitido en filtro keyset: {valor!r}")
+    return f'{columna}.lt."{valor}",and({columna}.eq."{valor}",id.lt.{int(id_valor)})'
@@ -0,0 +1,73 @@
+"""
+ClipControl Backend - Caché de períodos de entrega
+
+El catálogo de períodos (y con él el período activo) cambia pocas veces
+al año, pero se consulta en casi todas las peticiones calientes. Se guarda
+en memoria; los endpoints que modifican períodos invalidan la caché y el
+TTL cubre los cambios hechos por otros workers.
+"""
+import threading
+import time
+from typing import List, Optional
+
+from config import settings
+
+
+class CachePeriodos:
+    """Catálogo completo de periodos_entrega en memoria, ordenado por fecha_inicio desc"""
+
+    def __init__(self, ttl_segundos: float):
+        self.ttl = ttl_segundos
+        self._catalogo: Optional[List[dict]] = None
+        self._expira = 0.0
+        self._generacion = 0
+        self._lock = threading.Lock()
+
+    def _query(self, cliente):
+        return cliente.table("periodos_entrega").select("*").order("fecha_inicio", desc=True)
+
+    def _vigente(self) -> Optional[List[dict]]:
+        catalogo = self._catalogo
+        if catalogo is not None and time.monotonic() < self._expira:
+            return catalogo
+        return None
+
+    def _guardar(self, filas: List[dict], generacion: int) -> List[dict]:
+        # Si se invalidó mientras se consultaba, la respuesta puede estar vieja: no guardarla
+        with self._lock:
+            if generacion == self._generacion:
+                self._catalogo = filas
+                self._expira = time.monotonic() + self.ttl
+        return filas
+
+    def invalidar(self):
+        with self._lock:
+            self._generacion += 1
+            self._catalogo = None
+
+    def catalogo(self, supabase) -> List[dict]:
+        catalogo = self._vigente()
+        if catalogo is None:
+            generacion = self._generacion
+            catalogo = self._guardar(self._query(supabase).execute().data or [], generacion)
+        return [dict(p) for p in catalogo]
+
+    async def catalogo_async(self, db) -> List[dict]:
+        catalogo = self._vigente()
+        if catalogo is None:
+            generacion = self._generacion
+            result = await self._query(db).execute()
+            catalogo = self._guardar(result.data or [], generacion)
+        return [dict(p) for p in catalogo]
+
+    def activo(self, supabase) -> Optional[dict]:
+        return next((p for p in self.catalogo(supabase) if p.get("activo")), None)
+
+    async def activo_async(self, db) -> Optional[dict]:
+        return next((p for p in await self.catalogo_async(db) if p.get("activo")), None)
+
+    def por_id(self, supabase, periodo_id: int) -> Optional[dict]:
+        return next((p for p in self.catalogo(supabase) if p["id"] == periodo_id), None)
+
+
+cache_periodos = CachePeriodos(settings.PERIODOS_CACHE_TTL)
@@ -2,9 +2,9 @@
 """
 Sistema de permisos por roles
 """
-from functools import wraps
-from fastapi import HTTPException, Header
-from typing import Optional
+from fastapi import Depends, HTTPException
+
+from autenticacion import UsuarioToken, usuario_actual
 
 # Definición de permisos por rol
 PERMISOS = {
@@ -39,23 +39,31 @@ PERMISOS = {
     ]
 }
 
+# Permisos compilados una vez: cada verificación es una búsqueda en memoria
+_SIN_PERMISOS = frozenset()
+PERMISOS_COMPILADOS = {rol: frozenset(permisos) for rol, permisos in PERMISOS.items()}
+ROLES_ACCESO_TOTAL = frozenset(rol for rol, permisos in PERMISOS_COMPILADOS.items() if 'all' in permisos)
+
 def tiene_permiso(rol: str, permiso: str) -> bool:
     """Verificar si un rol tiene un permiso específico"""
-    if rol == 'SUPERADMIN':
-        return True
-    return permiso in PERMISOS.get(rol, [])
+    return rol in ROLES_ACCESO_TOTAL or permiso in PERMISOS_COMPILADOS.get(rol, _SIN_PERMISOS)
+
+def requiere_permiso(permiso: str):
+    """Dependencia: usuario del token con el permiso indicado (403 si no lo tiene)"""
+    def dependencia(usuario: UsuarioToken = Depends(usuario_actual)) -> UsuarioToken:
+        if not tiene_permiso(usuario.rol, permiso):
+            raise HTTPException(status_code=403, detail="No tienes permiso para esta acción")
+        return usuario
+    return dependencia
 
 def requiere_rol(*roles_permitidos):
-    """Decorador para requerir roles específicos"""
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            # Aquí verificarías el token JWT y extraerías el rol
-            # Por ahora, asumimos que se pasa en el header
-            # En producción, usarías JWT
-            return await func(*args, **kwargs)
-        return wrapper
-    return decorator
+    """Dependencia: usuario del token con alguno de los roles indicados (403 si no)"""
+    permitidos = frozenset(rol.upper() for rol in roles_permitidos)
+    def dependencia(usuario: UsuarioToken = Depends(usuario_actual)) -> UsuarioToken:
+        if usuario.rol not in permitidos and usuario.rol not in ROLES_ACCESO_TOTAL:
+            raise HTTPException(status_code=403, detail="No tienes permiso para esta acción")
+        return usuario
+    return dependencia
 
 def puede_gestionar_usuario(rol_solicitante: str, rol_objetivo: str) -> bool:
     """Verificar si un rol puede gestionar a otro rol"""
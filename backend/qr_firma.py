@@ -0,0 +1,135 @@
+"""
+ClipControl Backend - Tokens QR firmados (HMAC)
+
+Formato: s1.<payload>.<firma>, ambos en base64url sin relleno.
+El payload lleva token_id, empleado_id, periodo_id, emisión y expiración,
+así que un QR falsificado o expirado se rechaza sin consultar la base de datos.
+"""
+import base64
+import hashlib
+import hmac
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from config import settings
+from database import iterar_paginas
+
+PREFIJO = "s1"
+_FORMATO = ">QIIII"  # token_id, empleado_id, periodo_id, emitido, expira
+_LARGO_FIRMA = 16
+_CLAVE = hashlib.sha256(b"clipcontrol-qr:" + settings.secret_key().encode()).digest()
+
+
+def _b64(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode()
+
+
+def _desde_b64(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+def _firma(payload: bytes) -> bytes:
+    return hmac.new(_CLAVE, payload, hashlib.sha256).digest()[:_LARGO_FIRMA]
+
+
+def firmar_token(
+    token_id: int,
+    empleado_id: int,
+    periodo_id: Optional[int],
+    fecha_emision: datetime,
+    fecha_expiracion: datetime
+) -> str:
+    """Crear el token firmado que va dentro del QR"""
+    payload = struct.pack(
+        _FORMATO,
+        token_id,
+        empleado_id,
+        periodo_id or 0,
+        int(fecha_emision.timestamp()),
+        int(fecha_expiracion.timestamp())
+    )
+    return f"{PREFIJO}.{_b64(payload)}.{_b64(_firma(payload))}"
+
+
+def es_token_firmado(token: str) -> bool:
+    return token.startswith(PREFIJO + ".")
+
+
+def verificar_token(token: str) -> Tuple[str, Optional[dict]]:
+    """
+    Verificar firma y expiración sin ir a la base de datos.
+    Retorna (codigo, datos) con codigo OK, TOKEN_INVALIDO o TOKEN_EXPIRADO.
+    """
+    try:
+        prefijo, payload_b64, firma_b64 = token.split(".")
+        payload = _desde_b64(payload_b64)
+        firma = _desde_b64(firma_b64)
+    except ValueError:
+        return "TOKEN_INVALIDO", None
+
+    if prefijo != PREFIJO or not hmac.compare_digest(firma, _firma(payload)):
+        return "TOKEN_INVALIDO", None
+
+    try:
+        token_id, empleado_id, periodo_id, emitido, expira = struct.unpack(_FORMATO, payload)
+    except struct.error:
+        return "TOKEN_INVALIDO", None
+
+    datos = {
+        "token_id": token_id,
+        "empleado_id": empleado_id,
+        "periodo_id": periodo_id or None,
+        "fecha_generacion": datetime.fromtimestamp(emitido),
+        "fecha_expiracion": datetime.fromtimestamp(expira)
+    }
+
+    if time.time() > expira:
+        return "TOKEN_EXPIRADO", datos
+
+    return "OK", datos
+
+
+class TokensUsados:
+    """
+    Conjunto compacto de token_id ya usados: un bit por id en un bytearray.
+    Es la única parte de la validación que necesita estado compartido.
+    """
+
+    def __init__(self):
+        self._bits = bytearray()
+        self._lock = threading.Lock()
+
+    def esta_usado(self, token_id: int) -> bool:
+        byte = token_id >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (token_id & 7)))
+
+    def marcar(self, token_id: int):
+        byte = token_id >> 3
+        with self._lock:
+            if byte >= len(self._bits):
+                self._bits.extend(bytes(max(byte + 1 - len(self._bits), len(self._bits))))
+            self._bits[byte] |= 1 << (token_id & 7)
+
+    def desmarcar(self, token_id: int):
+        byte = token_id >> 3
+        with self._lock:
+            if byte < len(self._bits):
+                self._bits[byte] &= ~(1 << (token_id & 7)) & 0xFF
+
+    def cargar(self, supabase) -> int:
+        """Sembrar el conjunto con los tokens usados que aún no expiran"""
+        ahora = datetime.now().isoformat()
+        total = 0
+        for pagina in iterar_paginas(
+            lambda: supabase.table("qr_tokens").select("id").eq("usado", True).gt("fecha_expiracion", ahora).order("id")
+        ):
+            for fila in pagina:
+                self.marcar(fila["id"])
+            total += len(pagina)
+        return total
+
+
+tokens_usados = TokensUsados()
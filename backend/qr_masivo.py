@@ -0,0 +1,263 @@
+"""
+ClipControl Backend - Motor de generación masiva de QR
+"""
+import hashlib
+import itertools
+import json
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from config import settings
+from qr_firma import firmar_token
+
+
+def construir_token(empleado: dict, fecha_expiracion: datetime) -> dict:
+    """Construir en memoria la fila de qr_tokens de un empleado"""
+    token = secrets.token_urlsafe(16)
+    timestamp = datetime.now().isoformat()
+    hash_data = f"{token}:{empleado['id']}:{timestamp}"
+    hash_seguridad = hashlib.sha256(hash_data.encode()).hexdigest()
+
+    return {
+        "empleado_id": empleado['id'],
+        "token": token,
+        "hash_seguridad": hash_seguridad,
+        "fecha_expiracion": fecha_expiracion.isoformat()
+    }
+
+
+def construir_payload(
+    empleado: dict,
+    fila: dict,
+    periodo_id: Optional[int],
+    fecha_emision: datetime,
+    fecha_expiracion: datetime
+) -> dict:
+    """Payload de respuesta con el token firmado que va en el QR"""
+    token = firmar_token(fila['id'], empleado['id'], periodo_id, fecha_emision, fecha_expiracion)
+    return {
+        "empleado_id": empleado['id'],
+        "rut": empleado['rut'],
+        "nombre": f"{empleado['nombre']} {empleado['apellido']}",
+        "tipo_contrato": empleado['tipo_contrato'],
+        "token": token,
+        "qr_string": f"CLIPCONTROL:{token}:{empleado['id']}",
+        "expira": fecha_expiracion.isoformat(),
+        "hash": fila['hash_seguridad'][:16]
+    }
+
+
+def dividir_en_chunks(items: list, tamano: int) -> List[list]:
+    """Dividir una lista en bloques de tamaño fijo"""
+    tamano = max(1, tamano)
+    return [items[i:i + tamano] for i in range(0, len(items), tamano)]
+
+
+def _insertar_chunk(
+    supabase,
+    numero: int,
+    empleados: list,
+    periodo_id: Optional[int],
+    fecha_expiracion: datetime
+) -> dict:
+    """Construir e insertar un bloque de tokens en un solo round trip y firmarlos con su id"""
+    fecha_emision = datetime.now()
+    filas = [construir_token(empleado, fecha_expiracion) for empleado in empleados]
+
+    try:
+        result = supabase.table("qr_tokens").insert(filas).execute()
+        insertadas = {fila['token']: fila for fila in result.data}
+        payloads = [
+            construir_payload(
+                empleado,
+                {**fila, "id": insertadas[fila['token']]['id']},
+                periodo_id,
+                fecha_emision,
+                fecha_expiracion
+            )
+            for empleado, fila in zip(empleados, filas)
+        ]
+    except Exception as e:
+        return {
+            "chunk": numero,
+            "ok": False,
+            "total": len(empleados),
+            "empleados_ids": [emp['id'] for emp in empleados],
+            "error": str(e),
+            "qr_data": []
+        }
+
+    return {
+        "chunk": numero,
+        "ok": True,
+        "total": len(empleados),
+        "qr_data": payloads
+    }
+
+
+def generar_por_chunks(
+    supabase,
+    empleados: Iterable[dict],
+    periodo_id: Optional[int],
+    fecha_expiracion: datetime,
+    chunk_size: Optional[int] = None,
+    paralelismo: Optional[int] = None
+):
+    """
+    Generar tokens por bloques, insertando varios bloques en paralelo.
+    Entrega cada bloque a medida que termina su inserción.
+
+    `empleados` puede ser un iterador (p. ej. páginas de la BD): se consume de
+    a un bloque y nunca hay más de `paralelismo` bloques en vuelo, así que la
+    memoria no crece con la nómina y un cliente lento frena la generación.
+    """
+    chunk_size = max(1, chunk_size or settings.QR_CHUNK_SIZE)
+    paralelismo = max(1, paralelismo or settings.QR_PARALELISMO)
+    pendientes = iter(empleados)
+    numeros = itertools.count()
+
+    with ThreadPoolExecutor(max_workers=paralelismo) as pool:
+        en_vuelo = set()
+        while True:
+            while len(en_vuelo) < paralelismo:
+                chunk = list(itertools.islice(pendientes, chunk_size))
+                if not chunk:
+                    break
+                en_vuelo.add(pool.submit(_insertar_chunk, supabase, next(numeros), chunk, periodo_id, fecha_expiracion))
+            if not en_vuelo:
+                return
+            listos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                yield futuro.result()
+
+
+def generar_tokens_masivo(
+    supabase,
+    empleados: Iterable[dict],
+    duracion_minutos: int,
+    periodo_id: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    paralelismo: Optional[int] = None
+) -> dict:
+    """Generar los QR de todos los empleados y resumir el resultado por bloque"""
+    inicio = time.perf_counter()
+    fecha_expiracion = datetime.now() + timedelta(minutes=duracion_minutos)
+
+    qr_generados = []
+    chunks_fallidos = []
+    total_chunks = 0
+
+    for resultado in generar_por_chunks(supabase, empleados, periodo_id, fecha_expiracion, chunk_size, paralelismo):
+        total_chunks += 1
+        if resultado["ok"]:
+            qr_generados.extend(resultado["qr_data"])
+        else:
+            print(f"❌ Error en chunk {resultado['chunk']}: {resultado['error']}")
+            chunks_fallidos.append({
+                "chunk": resultado["chunk"],
+                "total": resultado["total"],
+                "empleados_ids": resultado["empleados_ids"],
+                "error": resultado["error"]
+            })
+
+    duracion = time.perf_counter() - inicio
+    tokens_por_segundo = round(len(qr_generados) / duracion, 1) if duracion > 0 else 0
+
+    return {
+        "fecha_expiracion": fecha_expiracion,
+        "qr_data": qr_generados,
+        "total_chunks": total_chunks,
+        "chunks_fallidos": chunks_fallidos,
+        "qr_fallidos": sum(c["total"] for c in chunks_fallidos),
+        "duracion_segundos": round(duracion, 3),
+        "tokens_por_segundo": tokens_por_segundo
+    }
+
+
+FORMATOS_STREAM = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def serializar_evento(tipo: str, datos: dict, formato: str) -> str:
+    """Serializar un evento como línea NDJSON o mensaje SSE"""
+    if formato == "sse":
+        return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+    return json.dumps({"tipo": tipo, **datos}, ensure_ascii=False) + "\n"
+
+
+def stream_tokens_masivo(
+    supabase,
+    empleados: Iterable[dict],
+    total: int,
+    duracion_minutos: int,
+    periodo_id: Optional[int] = None,
+    formato: str = "ndjson",
+    chunk_size: Optional[int] = None,
+    paralelismo: Optional[int] = None
+):
+    """
+    Generar los QR emitiendo cada bloque apenas queda guardado, seguido de un
+    evento de progreso. No acumula los QR generados en memoria; `total` es
+    la cantidad de empleados que entregará el iterador (para el porcentaje).
+    """
+    inicio = time.perf_counter()
+    fecha_expiracion = datetime.now() + timedelta(minutes=duracion_minutos)
+    procesados = 0
+    generados = 0
+    fallidos = 0
+    total_chunks = 0
+    chunks_fallidos = 0
+
+    yield serializar_evento("inicio", {
+        "total_empleados": total,
+        "duracion_minutos": duracion_minutos,
+        "expira": fecha_expiracion.isoformat()
+    }, formato)
+
+    for resultado in generar_por_chunks(supabase, empleados, periodo_id, fecha_expiracion, chunk_size, paralelismo):
+        total_chunks += 1
+        procesados += resultado["total"]
+
+        if resultado["ok"]:
+            generados += resultado["total"]
+            yield serializar_evento("chunk", {
+                "chunk": resultado["chunk"],
+                "qr_data": resultado["qr_data"]
+            }, formato)
+        else:
+            print(f"❌ Error en chunk {resultado['chunk']}: {resultado['error']}")
+            fallidos += resultado["total"]
+            chunks_fallidos += 1
+            yield serializar_evento("error", {
+                "chunk": resultado["chunk"],
+                "total": resultado["total"],
+                "empleados_ids": resultado["empleados_ids"],
+                "error": resultado["error"]
+            }, formato)
+
+        duracion = time.perf_counter() - inicio
+        yield serializar_evento("progreso", {
+            "procesados": procesados,
+            "total_empleados": total,
+            "porcentaje": round(procesados / total * 100, 1) if total > 0 else 100,
+            "tokens_por_segundo": round(generados / duracion, 1) if duracion > 0 else 0
+        }, formato)
+
+    duracion = time.perf_counter() - inicio
+    # Con bloques fallidos la corrida quedó parcial: el cliente debe reintentar esos empleados
+    yield serializar_evento("fin", {
+        "success": chunks_fallidos == 0,
+        "total_empleados": total,
+        "qr_generados": generados,
+        "qr_fallidos": fallidos,
+        "total_chunks": total_chunks,
+        "chunks_fallidos": chunks_fallidos,
+        "duracion_segundos": round(duracion, 3),
+        "tokens_por_segundo": round(generados / duracion, 1) if duracion > 0 else 0,
+        "mensaje": f"Se generaron {generados} QR de {total} empleados"
+    }, formato)
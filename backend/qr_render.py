@@ -0,0 +1,202 @@
+"""
+ClipControl Backend - Renderizado de hojas de QR (PDF / ZIP de PNG)
+"""
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+import zlib
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+from config import settings
+
+# Hoja A4 a 150 dpi, 3 columnas x 4 filas de etiquetas
+PAGINA_PX = (1240, 1754)
+PAGINA_PT = (595, 842)
+COLUMNAS = 3
+FILAS = 4
+ETIQUETAS_POR_PAGINA = COLUMNAS * FILAS
+ETIQUETA_PX = (PAGINA_PX[0] // COLUMNAS, PAGINA_PX[1] // FILAS)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock_pool = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Pool de procesos compartido para renderizar (uno por worker). Se crea con
+    `spawn`: a esta altura el worker ya tiene hilos en segundo plano y un
+    fork heredaría sus locks tomados.
+    """
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            procesos = settings.QR_RENDER_PROCESOS or os.cpu_count() or 1
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def detener_pool():
+    global _pool
+    with _lock_pool:
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+FUENTES = ("DejaVuSans.ttf", "arial.ttf", "LiberationSans-Regular.ttf")
+
+
+@lru_cache(maxsize=8)
+def _fuente(tamano: int):
+    """Fuente TrueType con tildes si está disponible, si no la de Pillow"""
+    for nombre in FUENTES:
+        try:
+            return ImageFont.truetype(nombre, tamano)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=tamano)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _recortar(texto: str, maximo: int) -> str:
+    return texto if len(texto) <= maximo else texto[:maximo - 1] + "…"
+
+
+def _dibujar_etiqueta(item: dict) -> Image.Image:
+    """Dibujar una etiqueta en escala de grises: QR, nombre, RUT y tipo de contrato"""
+    ancho, alto = ETIQUETA_PX
+    etiqueta = Image.new("L", (ancho, alto), 255)
+    draw = ImageDraw.Draw(etiqueta)
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=8, border=2)
+    qr.add_data(item["qr_string"])
+    qr.make(fit=True)
+    lado = min(ancho - 40, alto - 130)
+    qr_img = qr.make_image(fill_color="black", back_color="white").convert("L")
+    qr_img = qr_img.resize((lado, lado), Image.NEAREST)
+    etiqueta.paste(qr_img, ((ancho - lado) // 2, 12))
+
+    y = lado + 20
+    lineas = [
+        (_recortar(item.get("nombre") or "", 28), _fuente(24)),
+        (f"RUT: {item.get('rut') or 'N/A'}", _fuente(20)),
+        (item.get("tipo_contrato") or "", _fuente(18)),
+    ]
+    for texto, fuente in lineas:
+        ancho_texto = draw.textlength(texto, font=fuente)
+        draw.text(((ancho - ancho_texto) / 2, y), texto, fill=0, font=fuente)
+        y += 30
+
+    draw.rectangle([0, 0, ancho - 1, alto - 1], outline=200)
+    return etiqueta
+
+
+def renderizar_etiqueta_png(item: dict) -> tuple:
+    """Renderizar una etiqueta como PNG (se ejecuta en el pool de procesos)"""
+    buffer = io.BytesIO()
+    _dibujar_etiqueta(item).save(buffer, format="PNG", optimize=True)
+    return item, buffer.getvalue()
+
+
+def renderizar_pagina(items: List[dict]) -> tuple:
+    """
+    Renderizar una hoja completa de etiquetas (se ejecuta en el pool de procesos).
+    Retorna ancho, alto y los pixeles en gris comprimidos con zlib, listos para el PDF.
+    """
+    pagina = Image.new("L", PAGINA_PX, 255)
+    for indice, item in enumerate(items):
+        fila, columna = divmod(indice, COLUMNAS)
+        pagina.paste(_dibujar_etiqueta(item), (columna * ETIQUETA_PX[0], fila * ETIQUETA_PX[1]))
+    return PAGINA_PX[0], PAGINA_PX[1], zlib.compress(pagina.tobytes(), 6)
+
+
+class SalidaStream:
+    """Archivo de solo escritura que acumula bytes para ir emitiéndolos"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, datos) -> int:
+        self.buffer.extend(datos)
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = bytes(self.buffer)
+        self.buffer.clear()
+        return datos
+
+
+def stream_zip(items: List[dict]):
+    """Emitir un ZIP con un PNG por empleado a medida que el pool los renderiza"""
+    salida = SalidaStream()
+    chunksize = max(1, len(items) // ((settings.QR_RENDER_PROCESOS or os.cpu_count() or 1) * 4))
+
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_STORED) as zf:
+        for item, png in get_pool().map(renderizar_etiqueta_png, items, chunksize=chunksize):
+            nombre = f"QR_{item.get('rut') or 'sin_rut'}_{item.get('empleado_id')}.png"
+            zf.writestr(nombre, png)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def stream_pdf(items: List[dict]):
+    """
+    Emitir un PDF (una hoja A4 por cada 12 etiquetas) a medida que el pool
+    renderiza las páginas. El objeto Pages se escribe al final para no
+    tener que conocer las páginas de antemano.
+    """
+    paginas = [items[i:i + ETIQUETAS_POR_PAGINA] for i in range(0, len(items), ETIQUETAS_POR_PAGINA)]
+    offsets = {}
+    posicion = 0
+
+    def objeto(numero: int, cuerpo: bytes) -> bytes:
+        nonlocal posicion
+        offsets[numero] = posicion
+        datos = f"{numero} 0 obj\n".encode() + cuerpo + b"\nendobj\n"
+        posicion += len(datos)
+        return datos
+
+    cabecera = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    posicion += len(cabecera)
+    yield cabecera
+    yield objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+    kids = []
+    siguiente = 3
+    for ancho, alto, pixeles in get_pool().map(renderizar_pagina, paginas):
+        img_num, contenido_num, pagina_num = siguiente, siguiente + 1, siguiente + 2
+        siguiente += 3
+
+        imagen = (
+            f"<< /Type /XObject /Subtype /Image /Width {ancho} /Height {alto} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode "
+            f"/Length {len(pixeles)} >>\nstream\n"
+        ).encode() + pixeles + b"\nendstream"
+        contenido = f"q {PAGINA_PT[0]} 0 0 {PAGINA_PT[1]} 0 0 cm /Im0 Do Q".encode()
+        contenido = f"<< /Length {len(contenido)} >>\nstream\n".encode() + contenido + b"\nendstream"
+        pagina = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGINA_PT[0]} {PAGINA_PT[1]}] "
+            f"/Resources << /XObject << /Im0 {img_num} 0 R >> >> /Contents {contenido_num} 0 R >>"
+        ).encode()
+
+        yield objeto(img_num, imagen) + objeto(contenido_num, contenido) + objeto(pagina_num, pagina)
+        kids.append(f"{pagina_num} 0 R")
+
+    yield objeto(2, f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode())
+
+    xref = [f"xref\n0 {siguiente}\n", "0000000000 65535 f \n"]
+    xref += [f"{offsets[n]:010d} 00000 n \n" for n in range(1, siguiente)]
+    trailer = f"trailer\n<< /Size {siguiente} /Root 1 0 R >>\nstartxref\n{posicion}\n%%EOF\n"
+    yield ("".join(xref) + trailer).encode()
@@ -0,0 +1,174 @@
+"""
+ClipControl Backend - Repositorio de datos
+
+Interfaz común de acceso a las tablas y vistas que usa la API. Es el
+subconjunto del cliente de Supabase (constructor fluido de PostgREST) que
+usan los handlers, así el cliente real y el respaldo SQLite local
+(`repositorio_sqlite.py`) son intercambiables sin tocar `main.py`.
+"""
+from abc import ABC, abstractmethod
+from typing import Any, List, Optional, Union
+
+TABLAS = (
+    "empleados",
+    "entregas",
+    "qr_tokens",
+    "periodos_entrega",
+    "usuarios",
+    "sucursales",
+    "cajas_no_retiradas",
+    "configuracion_sistema",
+    "tipos_beneficio",
+)
+
+VISTAS = (
+    "v_empleados_completo",
+    "v_cajas_no_retiradas",
+    "v_auditoria_seguridad",
+)
+
+# Relaciones muchos-a-uno usables en los select embebidos: (tabla, relación) -> columna FK
+RELACIONES = {
+    ("entregas", "empleados"): "empleado_id",
+    ("entregas", "usuarios"): "usuario_id",
+    ("entregas", "sucursales"): "sucursal_id",
+    ("entregas", "periodos_entrega"): "periodo_id",
+    ("entregas", "qr_tokens"): "qr_token_id",
+    ("empleados", "sucursales"): "sucursal_id",
+    ("usuarios", "sucursales"): "sucursal_id",
+    ("qr_tokens", "empleados"): "empleado_id",
+    ("cajas_no_retiradas", "empleados"): "empleado_id",
+    ("cajas_no_retiradas", "periodos_entrega"): "periodo_id",
+    ("cajas_no_retiradas", "tipos_beneficio"): "tipo_beneficio_id",
+    ("periodos_entrega", "tipos_beneficio"): "tipo_beneficio_id",
+    ("v_empleados_completo", "sucursales"): "sucursal_id",
+}
+
+
+class Resultado:
+    """Respuesta de una consulta: filas y, si se pidió, el conteo exacto"""
+
+    def __init__(self, data: Any, count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class Consulta(ABC):
+    """
+    Constructor de consultas sobre una tabla o vista. Solo acumula la
+    operación, los filtros, el orden y el rango; cada respaldo implementa
+    `execute()`.
+    """
+
+    def __init__(self, tabla: str):
+        self.tabla = tabla
+        self.operacion = "select"
+        self.columnas = "*"
+        self.conteo: Optional[str] = None
+        self.datos: Union[dict, List[dict], None] = None
+        self.on_conflict: Optional[str] = None
+        self.ignorar_duplicados = False
+        self.filtros: List[tuple] = []
+        self.orden: List[tuple] = []
+        self.limite: Optional[int] = None
+        self.desde = 0
+
+    # --- Operaciones ---
+
+    def select(self, columnas: str = "*", count: Optional[str] = None) -> "Consulta":
+        self.operacion = "select"
+        self.columnas = columnas
+        self.conteo = count
+        return self
+
+    def insert(self, datos: Union[dict, List[dict]]) -> "Consulta":
+        self.operacion = "insert"
+        self.datos = datos
+        return self
+
+    def upsert(self, datos: Union[dict, List[dict]], on_conflict: str = "", ignore_duplicates: bool = False) -> "Consulta":
+        self.operacion = "upsert"
+        self.datos = datos
+        self.on_conflict = on_conflict or None
+        self.ignorar_duplicados = ignore_duplicates
+        return self
+
+    def update(self, datos: dict) -> "Consulta":
+        self.operacion = "update"
+        self.datos = datos
+        return self
+
+    def delete(self) -> "Consulta":
+        self.operacion = "delete"
+        return self
+
+    # --- Filtros (columna puede ser "relacion.columna" en selects embebidos) ---
+
+    def _filtro(self, columna: str, operador: str, valor) -> "Consulta":
+        self.filtros.append((columna, operador, valor))
+        return self
+
+    def eq(self, columna: str, valor) -> "Consulta":
+        return self._filtro(columna, "eq", valor)
+
+    def neq(self, columna: str, valor) -> "Consulta":
+        return self._filtro(columna, "neq", valor)
+
+    def gt(self, columna: str, valor) -> "Consulta":
+        return self._filtro(columna, "gt", valor)
+
+    def gte(self, columna: str, valor) -> "Consulta":
+        return self._filtro(columna, "gte", valor)
+
+    def lt(self, columna: str, valor) -> "Consulta":
+        return self._filtro(columna, "lt", valor)
+
+    def lte(self, columna: str, valor) -> "Consulta":
+        return self._filtro(columna, "lte", valor)
+
+    def like(self, columna: str, patron: str) -> "Consulta":
+        return self._filtro(columna, "like", patron)
+
+    def ilike(self, columna: str, patron: str) -> "Consulta":
+        return self._filtro(columna, "ilike", patron)
+
+    def is_(self, columna: str, valor) -> "Consulta":
+        return self._filtro(columna, "is", valor)
+
+    def in_(self, columna: str, valores) -> "Consulta":
+        return self._filtro(columna, "in", list(valores))
+
+    def or_(self, filtros: str) -> "Consulta":
+        """Filtro `or` en sintaxis PostgREST: 'col.op.valor,and(col.op.valor,...)'"""
+        return self._filtro(None, "or", filtros)
+
+    # --- Orden y rango ---
+
+    def order(self, columna: str, desc: bool = False) -> "Consulta":
+        self.orden.append((columna, desc))
+        return self
+
+    def limit(self, cantidad: int) -> "Consulta":
+        self.limite = cantidad
+        return self
+
+    def range(self, desde: int, hasta: int) -> "Consulta":
+        self.desde = desde
+        self.limite = hasta - desde + 1
+        return self
+
+    @abstractmethod
+    def execute(self) -> Resultado:
+        ...
+
+
+class Repositorio(ABC):
+    """Interfaz del repositorio: la misma forma que el cliente de Supabase"""
+
+    @abstractmethod
+    def table(self, nombre: str) -> Consulta:
+        ...
+
+    @abstractmethod
+    def rpc(self, funcion: str, params: Optional[dict] = None):
+        """Llamar a una función de la base de datos; retorna un objeto con `execute()`"""
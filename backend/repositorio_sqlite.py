@@ -0,0 +1,756 @@
+"""
+ClipControl Backend - Repositorio SQLite local
+
+Implementación del repositorio sobre SQLite para correr la API completa
+sin un proyecto de Supabase (desarrollo offline, benchmarks, pruebas de
+carga). Replica el esquema, las vistas, la función
+`limpiar_tokens_expirados` y el tope de filas por respuesta de PostgREST.
+
+Se activa con DB_BACKEND=sqlite. Para poblar la base con datos de prueba:
+
+    python repositorio_sqlite.py --empleados 20000
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from config import settings
+from repositorio import RELACIONES, TABLAS, VISTAS, Consulta, Repositorio, Resultado
+
+_AHORA = "(strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))"
+
+ESQUEMA = f"""
+CREATE TABLE IF NOT EXISTS sucursales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    direccion TEXT,
+    ciudad TEXT,
+    activa BOOLEAN NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password_hash TEXT NOT NULL,
+    rol TEXT NOT NULL,
+    nombre_completo TEXT,
+    sucursal_id INTEGER REFERENCES sucursales(id),
+    activo BOOLEAN NOT NULL DEFAULT 1,
+    ultimo_acceso TEXT,
+    created_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS empleados (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    rut TEXT NOT NULL UNIQUE,
+    nombre TEXT NOT NULL,
+    apellido TEXT NOT NULL,
+    email TEXT,
+    telefono TEXT,
+    tipo_contrato TEXT NOT NULL,
+    seccion TEXT,
+    sucursal_id INTEGER REFERENCES sucursales(id),
+    activo BOOLEAN NOT NULL DEFAULT 1,
+    fecha_ingreso TEXT,
+    created_at TEXT NOT NULL DEFAULT {_AHORA},
+    updated_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+CREATE INDEX IF NOT EXISTS idx_empleados_sucursal ON empleados(sucursal_id);
+
+CREATE TRIGGER IF NOT EXISTS trg_empleados_updated_at AFTER UPDATE ON empleados
+WHEN NEW.updated_at = OLD.updated_at
+BEGIN
+    UPDATE empleados SET updated_at = {_AHORA} WHERE id = NEW.id;
+END;
+
+CREATE TABLE IF NOT EXISTS tipos_beneficio (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    descripcion TEXT,
+    frecuencia TEXT DEFAULT 'EVENTUAL',
+    mes_entrega INTEGER,
+    activo BOOLEAN NOT NULL DEFAULT 1,
+    created_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS periodos_entrega (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    descripcion TEXT,
+    fecha_inicio TEXT,
+    fecha_fin TEXT,
+    tipo_entrega TEXT DEFAULT 'GENERAL',
+    criterio_grupos TEXT,
+    tipo_beneficio_id INTEGER REFERENCES tipos_beneficio(id),
+    activo BOOLEAN NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+
+CREATE TABLE IF NOT EXISTS qr_tokens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    empleado_id INTEGER NOT NULL REFERENCES empleados(id),
+    token TEXT NOT NULL UNIQUE,
+    hash_seguridad TEXT,
+    fecha_generacion TEXT NOT NULL DEFAULT {_AHORA},
+    fecha_expiracion TEXT NOT NULL,
+    usado BOOLEAN NOT NULL DEFAULT 0,
+    fecha_uso TEXT,
+    ip_uso TEXT,
+    dispositivo_uso TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_qr_tokens_empleado ON qr_tokens(empleado_id);
+
+CREATE TABLE IF NOT EXISTS entregas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    empleado_id INTEGER NOT NULL REFERENCES empleados(id),
+    periodo_id INTEGER REFERENCES periodos_entrega(id),
+    sucursal_id INTEGER REFERENCES sucursales(id),
+    usuario_id INTEGER REFERENCES usuarios(id),
+    qr_token_id INTEGER REFERENCES qr_tokens(id),
+    fecha_hora TEXT NOT NULL DEFAULT {_AHORA},
+    guardia TEXT,
+    tipo_caja TEXT,
+    metodo TEXT DEFAULT 'QR',
+    estado TEXT DEFAULT 'COMPLETADO',
+    observaciones TEXT,
+    foto_url TEXT,
+    foto_entrega TEXT,
+    dispositivo_id TEXT,
+    ip_address TEXT,
+    latitud REAL,
+    longitud REAL,
+    duracion_escaneo INTEGER,
+    created_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+CREATE INDEX IF NOT EXISTS idx_entregas_periodo_empleado ON entregas(periodo_id, empleado_id);
+CREATE INDEX IF NOT EXISTS idx_entregas_fecha_hora ON entregas(fecha_hora, id);
+CREATE INDEX IF NOT EXISTS idx_entregas_usuario ON entregas(usuario_id, fecha_hora);
+
+CREATE TABLE IF NOT EXISTS cajas_no_retiradas (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    periodo_id INTEGER NOT NULL REFERENCES periodos_entrega(id),
+    empleado_id INTEGER NOT NULL REFERENCES empleados(id),
+    tipo_beneficio_id INTEGER,
+    fecha_limite TEXT,
+    estado TEXT,
+    fecha_traspaso TEXT,
+    observaciones TEXT,
+    created_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+CREATE INDEX IF NOT EXISTS idx_cajas_periodo_empleado ON cajas_no_retiradas(periodo_id, empleado_id);
+
+CREATE TABLE IF NOT EXISTS configuracion_sistema (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    clave TEXT NOT NULL UNIQUE,
+    valor TEXT,
+    descripcion TEXT,
+    updated_at TEXT NOT NULL DEFAULT {_AHORA}
+);
+
+CREATE VIEW IF NOT EXISTS v_empleados_completo AS
+SELECT e.*,
+       e.nombre || ' ' || e.apellido AS nombre_completo,
+       s.nombre AS sucursal
+FROM empleados e
+LEFT JOIN sucursales s ON s.id = e.sucursal_id;
+
+CREATE VIEW IF NOT EXISTS v_cajas_no_retiradas AS
+SELECT c.*,
+       e.rut,
+       e.nombre || ' ' || e.apellido AS empleado_nombre,
+       e.tipo_contrato,
+       p.nombre AS periodo_nombre
+FROM cajas_no_retiradas c
+JOIN empleados e ON e.id = c.empleado_id
+LEFT JOIN periodos_entrega p ON p.id = c.periodo_id;
+
+CREATE VIEW IF NOT EXISTS v_auditoria_seguridad AS
+SELECT en.id AS entrega_id,
+       en.fecha_hora,
+       e.rut,
+       e.nombre || ' ' || e.apellido AS empleado,
+       en.guardia,
+       en.metodo,
+       en.dispositivo_id,
+       en.ip_address,
+       en.latitud,
+       en.longitud,
+       en.duracion_escaneo,
+       q.fecha_generacion AS qr_generado,
+       q.fecha_uso AS qr_usado,
+       en.foto_entrega IS NOT NULL AS tiene_foto
+FROM entregas en
+JOIN empleados e ON e.id = en.empleado_id
+LEFT JOIN qr_tokens q ON q.id = en.qr_token_id
+ORDER BY en.fecha_hora DESC;
+"""
+
+OPERADORES = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+# ==========================================
+# SINTAXIS POSTGREST (select embebido y filtros `or`)
+# ==========================================
+
+def _partir(texto: str) -> List[str]:
+    """Separar por comas de primer nivel (fuera de paréntesis y comillas)"""
+    partes, actual, nivel, comillas = [], [], 0, False
+    for caracter in texto:
+        if caracter == '"':
+            comillas = not comillas
+        elif not comillas and caracter == "(":
+            nivel += 1
+        elif not comillas and caracter == ")":
+            nivel -= 1
+        elif caracter == "," and nivel == 0 and not comillas:
+            partes.append("".join(actual).strip())
+            actual = []
+            continue
+        actual.append(caracter)
+    if "".join(actual).strip():
+        partes.append("".join(actual).strip())
+    return partes
+
+
+def _parsear_select(texto: str) -> tuple:
+    """
+    "id, empleados!inner(*, sucursales(nombre))" ->
+    (["id"], [("empleados", "empleados", True, "*, sucursales(nombre)")])
+    """
+    columnas, embebidos = [], []
+    for parte in _partir(texto or "*"):
+        if "(" in parte:
+            cabeza, interior = parte.split("(", 1)
+            alias = None
+            if ":" in cabeza:
+                alias, cabeza = cabeza.split(":", 1)
+            nombre, *pistas = cabeza.strip().split("!")
+            embebidos.append((alias or nombre, nombre, "inner" in pistas, interior[:-1]))
+        else:
+            columnas.append(parte)
+    return columnas, embebidos
+
+
+def _sin_comillas(valor: str) -> str:
+    if len(valor) >= 2 and valor[0] == valor[-1] == '"':
+        return valor[1:-1].replace('\\"', '"')
+    return valor
+
+
+def _valor_sql(valor):
+    if isinstance(valor, bool):
+        return int(valor)
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor)
+    return valor
+
+
+# ==========================================
+# REPOSITORIO
+# ==========================================
+
+class ConsultaSQLite(Consulta):
+    def __init__(self, repositorio: "RepositorioSQLite", tabla: str):
+        super().__init__(tabla)
+        self.repositorio = repositorio
+
+    def execute(self) -> Resultado:
+        return self.repositorio.ejecutar(self)
+
+
+class LlamadaSQLite:
+    """Llamada a una función (equivalente a `supabase.rpc(...)`)"""
+
+    def __init__(self, repositorio: "RepositorioSQLite", funcion: str, params: Optional[dict]):
+        self.repositorio = repositorio
+        self.funcion = funcion
+        self.params = params or {}
+
+    def execute(self) -> Resultado:
+        return self.repositorio.llamar(self.funcion, self.params)
+
+
+class RepositorioSQLite(Repositorio):
+    """
+    Repositorio sobre un archivo SQLite (o ":memory:").
+    Con archivo, cada hilo usa su propia conexión (WAL permite lecturas
+    concurrentes); en memoria se comparte una conexión protegida por lock.
+    """
+
+    def __init__(self, ruta: str, max_filas: int = 1000):
+        self.ruta = ruta
+        self.max_filas = max_filas
+        self.en_memoria = ruta == ":memory:"
+        self._local = threading.local()
+        self._lock = threading.RLock() if self.en_memoria else contextlib.nullcontext()
+        self._compartida = None
+
+        conexion = self._conexion()
+        conexion.executescript(ESQUEMA)
+
+        self._columnas = {}
+        self._booleanos = {}
+        for nombre in TABLAS + VISTAS:
+            info = conexion.execute(f'PRAGMA table_info("{nombre}")').fetchall()
+            self._columnas[nombre] = {fila["name"] for fila in info}
+            self._booleanos[nombre] = {fila["name"] for fila in info if (fila["type"] or "").upper() == "BOOLEAN"}
+
+    def _conexion(self) -> sqlite3.Connection:
+        if self.en_memoria:
+            if self._compartida is None:
+                self._compartida = self._abrir()
+            return self._compartida
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = self._local.conexion = self._abrir()
+        return conexion
+
+    def _abrir(self) -> sqlite3.Connection:
+        conexion = sqlite3.connect(self.ruta, check_same_thread=False, isolation_level=None, timeout=30)
+        conexion.row_factory = sqlite3.Row
+        conexion.execute("PRAGMA foreign_keys = ON")
+        if not self.en_memoria:
+            conexion.execute("PRAGMA journal_mode = WAL")
+            conexion.execute("PRAGMA synchronous = NORMAL")
+        return conexion
+
+    @contextlib.contextmanager
+    def _transaccion(self):
+        conexion = self._conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            yield conexion
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+        conexion.execute("COMMIT")
+
+    # --- Interfaz ---
+
+    def table(self, nombre: str) -> ConsultaSQLite:
+        if nombre not in self._columnas:
+            raise ValueError(f"Tabla o vista desconocida: {nombre}")
+        return ConsultaSQLite(self, nombre)
+
+    def rpc(self, funcion: str, params: Optional[dict] = None) -> LlamadaSQLite:
+        return LlamadaSQLite(self, funcion, params)
+
+    def ejecutar(self, consulta: Consulta) -> Resultado:
+        with self._lock:
+            if consulta.operacion == "select":
+                return self._select(consulta)
+            if consulta.operacion in ("insert", "upsert"):
+                return Resultado(self._insertar(consulta))
+            if consulta.operacion == "update":
+                return Resultado(self._modificar(consulta, "update"))
+            if consulta.operacion == "delete":
+                return Resultado(self._modificar(consulta, "delete"))
+        raise ValueError(f"Operación no soportada: {consulta.operacion}")
+
+    def llamar(self, funcion: str, params: dict) -> Resultado:
+        if funcion == "limpiar_tokens_expirados":
+            with self._lock, self._transaccion() as conexion:
+                cursor = conexion.execute(
+                    "DELETE FROM qr_tokens WHERE usado = 0 AND fecha_expiracion < ?",
+                    (datetime.now().isoformat(),)
+                )
+            return Resultado(cursor.rowcount)
+        raise ValueError(f"Función desconocida: {funcion}")
+
+    # --- Columnas y valores ---
+
+    def _validar_columna(self, tabla: str, columna: str):
+        if columna not in self._columnas[tabla]:
+            raise ValueError(f'La columna "{columna}" no existe en {tabla}')
+
+    def _fk(self, tabla: str, relacion: str) -> str:
+        fk = RELACIONES.get((tabla, relacion))
+        if fk is None:
+            raise ValueError(f"No hay relación entre {tabla} y {relacion}")
+        return fk
+
+    def _convertir(self, tabla: str, columna: str, valor):
+        if columna in self._booleanos[tabla] and valor is not None:
+            if isinstance(valor, str):
+                return int(valor.lower() == "true")
+            return int(bool(valor))
+        return _valor_sql(valor)
+
+    def _fila(self, tabla: str, fila: sqlite3.Row) -> dict:
+        datos = dict(fila)
+        for columna in self._booleanos.get(tabla, ()):
+            if datos.get(columna) is not None:
+                datos[columna] = bool(datos[columna])
+        return datos
+
+    # --- Filtros ---
+
+    def _condicion(self, tabla: str, columna: str, operador: str, valor, params: list) -> str:
+        if operador == "or":
+            return self._logico(tabla, valor, "OR", params)
+
+        if "." in columna:
+            # Filtro sobre una relación embebida: subconsulta por la FK
+            relacion, resto = columna.split(".", 1)
+            fk = self._fk(tabla, relacion)
+            interior = self._condicion(relacion, resto, operador, valor, params)
+            return f'"{fk}" IN (SELECT id FROM "{relacion}" WHERE {interior})'
+
+        self._validar_columna(tabla, columna)
+        sql_columna = f'"{columna}"'
+
+        if operador == "in":
+            if not valor:
+                return "0"
+            params.extend(self._convertir(tabla, columna, v) for v in valor)
+            return f"{sql_columna} IN ({', '.join('?' * len(valor))})"
+        if operador == "is":
+            texto = "null" if valor is None else str(valor).lower()
+            if texto == "null":
+                return f"{sql_columna} IS NULL"
+            return f"{sql_columna} = {1 if texto == 'true' else 0}"
+        if operador in ("like", "ilike"):
+            params.append(str(valor).replace("*", "%"))
+            return f"{sql_columna} LIKE ?"
+
+        params.append(self._convertir(tabla, columna, valor))
+        return f"{sql_columna} {OPERADORES[operador]} ?"
+
+    def _logico(self, tabla: str, texto: str, union: str, params: list) -> str:
+        """Traducir un filtro `or`/`and` de PostgREST ('a.eq.1,and(b.lt.2,c.is.null)')"""
+        condiciones = []
+        for termino in _partir(texto):
+            for prefijo, sub_union in (("and(", "AND"), ("or(", "OR")):
+                if termino.startswith(prefijo) and termino.endswith(")"):
+                    condiciones.append(self._logico(tabla, termino[len(prefijo):-1], sub_union, params))
+                    break
+            else:
+                columna, operador, valor = termino.split(".", 2)
+                if operador == "in":
+                    valor = [_sin_comillas(v) for v in _partir(valor.strip("()"))]
+                elif operador != "is":
+                    valor = _sin_comillas(valor)
+                condiciones.append(self._condicion(tabla, columna, operador, valor, params))
+        return "(" + f" {union} ".join(condiciones) + ")"
+
+    def _where(self, tabla: str, filtros: list, params: list, extra: Optional[list] = None) -> str:
+        condiciones = [self._condicion(tabla, c, o, v, params) for c, o, v in filtros] + (extra or [])
+        return " WHERE " + " AND ".join(condiciones) if condiciones else ""
+
+    # --- Lectura ---
+
+    def _select(self, consulta: Consulta) -> Resultado:
+        columnas, _ = _parsear_select(consulta.columnas)
+
+        # select("count", count="exact"): solo el agregado
+        if columnas == ["count"] and "count" not in self._columnas[consulta.tabla]:
+            _, total = self._leer(consulta.tabla, "id", consulta.filtros, limite=0, contar=True)
+            return Resultado([{"count": total}], total)
+
+        filas, total = self._leer(
+            consulta.tabla,
+            consulta.columnas,
+            consulta.filtros,
+            consulta.orden,
+            consulta.limite,
+            consulta.desde,
+            contar=consulta.conteo is not None,
+            con_tope=True
+        )
+        return Resultado([proyectada for _, proyectada in filas], total)
+
+    def _leer(
+        self,
+        tabla: str,
+        texto_select: str,
+        filtros: list,
+        orden: Optional[list] = None,
+        limite: Optional[int] = None,
+        desde: int = 0,
+        contar: bool = False,
+        con_tope: bool = False
+    ) -> tuple:
+        """Retorna ([(fila_completa, fila_proyectada)], conteo)"""
+        columnas, embebidos = _parsear_select(texto_select)
+        internos = {nombre: alias for alias, nombre, inner, _ in embebidos if inner}
+
+        # Filtros sobre relaciones: los de un embebido !inner filtran las filas
+        # padre; los demás solo filtran el recurso embebido (como PostgREST)
+        filtros_tabla, filtros_embebidos = [], {}
+        for columna, operador, valor in filtros:
+            relacion = columna.split(".", 1)[0] if columna and "." in columna else None
+            if relacion and relacion not in internos:
+                filtros_embebidos.setdefault(relacion, []).append((columna.split(".", 1)[1], operador, valor))
+            else:
+                filtros_tabla.append((columna, operador, valor))
+
+        extra = [f'"{self._fk(tabla, nombre)}" IS NOT NULL' for nombre in internos]
+        params = []
+        where = self._where(tabla, filtros_tabla, params, extra)
+        conexion = self._conexion()
+
+        total = None
+        if contar:
+            total = conexion.execute(f'SELECT COUNT(*) FROM "{tabla}"{where}', params).fetchone()[0]
+
+        sql = f'SELECT * FROM "{tabla}"{where}'
+        if orden:
+            for columna, _ in orden:
+                self._validar_columna(tabla, columna)
+            sql += " ORDER BY " + ", ".join(f'"{c}" {"DESC" if desc else "ASC"}' for c, desc in orden)
+
+        if con_tope and self.max_filas:
+            limite = self.max_filas if limite is None else min(limite, self.max_filas)
+        if limite is not None:
+            sql += f" LIMIT {int(limite)} OFFSET {int(desde)}"
+        elif desde:
+            sql += f" LIMIT -1 OFFSET {int(desde)}"
+
+        filas = []
+        for fila in conexion.execute(sql, params).fetchall():
+            completa = self._fila(tabla, fila)
+            filas.append((completa, self._proyectar(tabla, completa, columnas)))
+
+        for alias, relacion, _, interior in embebidos:
+            fk = self._fk(tabla, relacion)
+            ids = list({completa[fk] for completa, _ in filas if completa[fk] is not None})
+            relacionadas = {}
+            for i in range(0, len(ids), 500):
+                lote, _ = self._leer(
+                    relacion,
+                    interior,
+                    [("id", "in", ids[i:i + 500])] + filtros_embebidos.get(relacion, [])
+                )
+                relacionadas.update({completa["id"]: proyectada for completa, proyectada in lote})
+            for completa, proyectada in filas:
+                proyectada[alias] = relacionadas.get(completa[fk])
+
+        return filas, total
+
+    def _proyectar(self, tabla: str, fila: dict, columnas: list) -> dict:
+        if "*" in columnas:
+            return dict(fila)
+        proyectada = {}
+        for columna in columnas:
+            alias = columna
+            if ":" in columna:
+                alias, columna = columna.split(":", 1)
+            self._validar_columna(tabla, columna)
+            proyectada[alias] = fila[columna]
+        return proyectada
+
+    # --- Escritura ---
+
+    def _insertar(self, consulta: Consulta) -> list:
+        tabla = consulta.tabla
+        filas = consulta.datos if isinstance(consulta.datos, list) else [consulta.datos]
+        insertadas = []
+
+        conflicto = None
+        if consulta.operacion == "upsert":
+            columnas_conflicto = [c.strip() for c in (consulta.on_conflict or "id").split(",")]
+            for columna in columnas_conflicto:
+                self._validar_columna(tabla, columna)
+            conflicto = ", ".join(f'"{c}"' for c in columnas_conflicto)
+
+        with self._transaccion() as conexion:
+            for fila in filas:
+                columnas = list(fila)
+                for columna in columnas:
+                    self._validar_columna(tabla, columna)
+                valores = [self._convertir(tabla, c, fila[c]) for c in columnas]
+
+                nombres = ", ".join(f'"{c}"' for c in columnas)
+                sql = f'INSERT INTO "{tabla}" ({nombres}) VALUES ({", ".join("?" * len(columnas))})'
+                if conflicto:
+                    if consulta.ignorar_duplicados:
+                        sql += f" ON CONFLICT ({conflicto}) DO NOTHING"
+                    else:
+                        sql += f" ON CONFLICT ({conflicto}) DO UPDATE SET " + ", ".join(
+                            f'"{c}" = excluded."{c}"' for c in columnas
+                        )
+                fila_db = conexion.execute(sql + " RETURNING *", valores).fetchone()
+                if fila_db is not None:
+                    insertadas.append(self._fila(tabla, fila_db))
+
+        return insertadas
+
+    def _modificar(self, consulta: Consulta, operacion: str) -> list:
+        tabla = consulta.tabla
+        params = []
+
+        if operacion == "update":
+            if not consulta.datos:
+                raise ValueError("update sin columnas")
+            asignaciones = []
+            for columna, valor in consulta.datos.items():
+                self._validar_columna(tabla, columna)
+                asignaciones.append(f'"{columna}" = ?')
+                params.append(self._convertir(tabla, columna, valor))
+            sql = f'UPDATE "{tabla}" SET {", ".join(asignaciones)}'
+        else:
+            sql = f'DELETE FROM "{tabla}"'
+
+        sql += self._where(tabla, consulta.filtros, params) + " RETURNING *"
+        with self._transaccion() as conexion:
+            return [self._fila(tabla, fila) for fila in conexion.execute(sql, params).fetchall()]
+
+
+# ==========================================
+# VARIANTE ASÍNCRONA (MISMA BASE, EXECUTE EN HILOS)
+# ==========================================
+
+class ConsultaSQLiteAsync(ConsultaSQLite):
+    async def execute(self) -> Resultado:
+        return await asyncio.to_thread(self.repositorio.ejecutar, self)
+
+
+class LlamadaSQLiteAsync(LlamadaSQLite):
+    async def execute(self) -> Resultado:
+        return await asyncio.to_thread(self.repositorio.llamar, self.funcion, self.params)
+
+
+class RepositorioSQLiteAsync(Repositorio):
+    """Vista asíncrona del repositorio SQLite, para los endpoints `async def`"""
+
+    def __init__(self, base: RepositorioSQLite):
+        self.base = base
+
+    def table(self, nombre: str) -> ConsultaSQLiteAsync:
+        self.base.table(nombre)
+        return ConsultaSQLiteAsync(self.base, nombre)
+
+    def rpc(self, funcion: str, params: Optional[dict] = None) -> LlamadaSQLiteAsync:
+        return LlamadaSQLiteAsync(self.base, funcion, params)
+
+    async def aclose(self):
+        pass
+
+
+_repositorio: Optional[RepositorioSQLite] = None
+_lock_creacion = threading.Lock()
+
+
+def get_repositorio_sqlite() -> RepositorioSQLite:
+    """Repositorio SQLite compartido (uno por worker)"""
+    global _repositorio
+    with _lock_creacion:
+        if _repositorio is None:
+            print(f"🗄️ Usando base SQLite local: {settings.SQLITE_PATH}")
+            _repositorio = RepositorioSQLite(settings.SQLITE_PATH, settings.SQLITE_MAX_FILAS)
+    return _repositorio
+
+
+def get_repositorio_sqlite_async() -> RepositorioSQLiteAsync:
+    return RepositorioSQLiteAsync(get_repositorio_sqlite())
+
+
+# ==========================================
+# DATOS DE PRUEBA
+# ==========================================
+
+NOMBRES = ("Juan", "María", "José", "Ana", "Luis", "Carmen", "Pedro", "Camila", "Jorge", "Valentina",
+           "Diego", "Francisca", "Carlos", "Javiera", "Miguel", "Constanza", "Felipe", "Catalina")
+APELLIDOS = ("González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez",
+             "Sepúlveda", "Morales", "Rodríguez", "López", "Fuentes", "Hernández", "Torres", "Araya")
+CIUDADES = ("Santiago", "Rancagua", "Talca", "Curicó", "San Fernando", "Chillán", "Concepción")
+SECCIONES = ("Bodega", "Packing", "Cosecha", "Mantención", "Administración", "Despacho")
+
+
+def poblar(
+    repositorio: RepositorioSQLite,
+    empleados: int = 5000,
+    sucursales: int = 5,
+    guardias_por_sucursal: int = 4,
+    password: str = "clipcontrol",
+    semilla: int = 1
+) -> dict:
+    """Cargar sucursales, usuarios, un período activo y empleados con RUT válido"""
+    import bcrypt
+    from ruts import digito_verificador
+
+    azar = random.Random(semilla)
+    password_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+    filas_sucursales = repositorio.table("sucursales").insert([
+        {"nombre": f"Sucursal {i + 1}", "ciudad": CIUDADES[i % len(CIUDADES)], "activa": True}
+        for i in range(sucursales)
+    ]).execute().data
+    ids_sucursales = [s["id"] for s in filas_sucursales]
+
+    usuarios = [{"username": "admin", "password_hash": password_hash, "rol": "SUPERADMIN",
+                 "nombre_completo": "Administrador", "activo": True}]
+    for sucursal_id in ids_sucursales:
+        for i in range(guardias_por_sucursal):
+            usuarios.append({
+                "username": f"guardia{sucursal_id}_{i + 1}",
+                "password_hash": password_hash,
+                "rol": "GUARDIA",
+                "nombre_completo": f"Guardia {i + 1} Sucursal {sucursal_id}",
+                "sucursal_id": sucursal_id,
+                "activo": True
+            })
+    repositorio.table("usuarios").insert(usuarios).execute()
+
+    beneficio = repositorio.table("tipos_beneficio").insert(
+        {"nombre": "Caja navideña", "frecuencia": "ANUAL", "mes_entrega": 12}
+    ).execute().data[0]
+    hoy = date.today()
+    repositorio.table("periodos_entrega").update({"activo": False}).eq("activo", True).execute()
+    periodo = repositorio.table("periodos_entrega").insert({
+        "nombre": f"Entrega {hoy.year}",
+        "fecha_inicio": hoy - timedelta(days=7),
+        "fecha_fin": hoy + timedelta(days=30),
+        "tipo_beneficio_id": beneficio["id"],
+        "activo": True
+    }).execute().data[0]
+
+    numeros = azar.sample(range(5_000_000, 25_000_000), empleados)
+    for inicio in range(0, empleados, 1000):
+        repositorio.table("empleados").insert([
+            {
+                "rut": f"{numero}{digito_verificador(numero)}",
+                "nombre": azar.choice(NOMBRES),
+                "apellido": f"{azar.choice(APELLIDOS)} {azar.choice(APELLIDOS)}",
+                "tipo_contrato": "PLANTA" if azar.random() < 0.7 else "PLAZO_FIJO",
+                "seccion": azar.choice(SECCIONES),
+                "sucursal_id": azar.choice(ids_sucursales),
+                "activo": azar.random() < 0.97
+            }
+            for numero in numeros[inicio:inicio + 1000]
+        ]).execute()
+
+    return {
+        "sucursales": len(ids_sucursales),
+        "usuarios": len(usuarios),
+        "empleados": empleados,
+        "periodo_id": periodo["id"]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crear y poblar la base SQLite local de ClipControl")
+    parser.add_argument("--ruta", default=settings.SQLITE_PATH)
+    parser.add_argument("--empleados", type=int, default=5000)
+    parser.add_argument("--sucursales", type=int, default=5)
+    parser.add_argument("--guardias", type=int, default=4, help="Guardias por sucursal")
+    parser.add_argument("--password", default="clipcontrol", help="Contraseña de todos los usuarios de prueba")
+    args = parser.parse_args()
+
+    resumen = poblar(
+        RepositorioSQLite(args.ruta),
+        empleados=args.empleados,
+        sucursales=args.sucursales,
+        guardias_por_sucursal=args.guardias,
+        password=args.password
+    )
+    print(f"✅ Base {args.ruta} poblada: {resumen}")
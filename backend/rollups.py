@@ -0,0 +1,216 @@
+"""
+ClipControl Backend - Conteos de entregas pre-agregados (rollups)
+
+Cantidad de entregas por (hora, sucursal del empleado, usuario_id del
+guardia, tipo_contrato). Los reportes suman estos buckets en vez de
+recorrer la tabla de entregas. Se mantienen así:
+
+- cada escritura de este worker suma o resta su bucket al instante;
+- un hilo en segundo plano lee cada ROLLUPS_AL_DIA segundos solo las
+  entregas con id mayor al último visto (las que registraron otros workers);
+- el mismo hilo reconstruye todo desde cero al iniciar y cada
+  ROLLUPS_RECONSTRUIR segundos o a pedido (recoge también las anulaciones
+  hechas en otros workers).
+
+Los reportes nunca leen la tabla: responden con la última foto y, antes de
+la primera reconstrucción, con RollupsNoListos (503).
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from config import settings
+
+Clave = Tuple[str, Optional[int], Optional[int], Optional[str]]
+
+_COLUMNAS = "id, fecha_hora, usuario_id, empleados(sucursal_id, tipo_contrato)"
+
+
+def _hora(fecha_hora: Optional[str]) -> str:
+    """'2026-10-18T10:42:03+00:00' -> '2026-10-18T10' (la hora tal como viene de la BD)"""
+    return (fecha_hora or "")[:13]
+
+
+def _clave(fila: dict) -> Clave:
+    empleado = fila.get("empleados") or {}
+    return (_hora(fila.get("fecha_hora")), empleado.get("sucursal_id"), fila.get("usuario_id"), empleado.get("tipo_contrato"))
+
+
+class RollupsNoListos(Exception):
+    """Aún no termina la primera reconstrucción de este worker"""
+
+
+class RollupEntregas:
+    def __init__(self, intervalo_al_dia: float, intervalo_reconstruccion: float):
+        self.intervalo_al_dia = intervalo_al_dia
+        self.intervalo_reconstruccion = intervalo_reconstruccion
+        self._conteos: Dict[Clave, int] = {}
+        self._ultimo_id = 0
+        # Entregas con id > _ultimo_id ya sumadas por este worker (id -> bucket)
+        self._contadas: Dict[int, Clave] = {}
+        # Anulaciones ocurridas durante una reconstrucción: (id, bucket, ya leída por el recorrido)
+        self._bajas: Optional[list] = None
+        # Último id leído por la reconstrucción en curso
+        self._cursor = 0
+        self._proxima_reconstruccion = 0.0
+        self._iniciado = False
+        self._lock = threading.Lock()
+        self._actualizando = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def _leer_desde(self, supabase, desde_id: int):
+        """Entregas con id > desde_id, por páginas en orden de id"""
+        ultimo = desde_id
+        while True:
+            filas = supabase.table("entregas").select(_COLUMNAS).gt("id", ultimo).order("id").limit(1000).execute().data or []
+            if filas:
+                yield filas
+            if len(filas) < 1000:
+                break
+            ultimo = filas[-1]["id"]
+
+    def _sumar(self, conteos: Dict[Clave, int], clave: Clave, delta: int):
+        total = conteos.get(clave, 0) + delta
+        if total:
+            conteos[clave] = total
+        else:
+            conteos.pop(clave, None)
+
+    # ------------------------------------------
+    # Hilo de mantenimiento
+    # ------------------------------------------
+
+    def iniciar(self, supabase):
+        if self._hilo:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._trabajar, args=(supabase,), name="rollups", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        if not self._hilo:
+            return
+        self._detener.set()
+        self._despertar.set()
+        self._hilo.join(timeout=5)
+        self._hilo = None
+
+    def solicitar_reconstruccion(self):
+        """Pedir una reconstrucción al hilo de mantenimiento (no bloquea)"""
+        self._proxima_reconstruccion = 0.0
+        self._despertar.set()
+
+    def _trabajar(self, supabase):
+        while not self._detener.is_set():
+            try:
+                with self._actualizando:
+                    if time.monotonic() >= self._proxima_reconstruccion:
+                        self._reconstruir(supabase)
+                    else:
+                        self._poner_al_dia(supabase)
+            except Exception as e:
+                print(f"❌ Error actualizando rollups: {e}")
+            self._despertar.wait(self.intervalo_al_dia)
+            self._despertar.clear()
+
+    # ------------------------------------------
+    # Reconstrucción y puesta al día
+    # ------------------------------------------
+
+    def reconstruir(self, supabase) -> dict:
+        """Recalcular todos los buckets desde la tabla de entregas (bloquea hasta terminar)"""
+        with self._actualizando:
+            return self._reconstruir(supabase)
+
+    def _reconstruir(self, supabase) -> dict:
+        inicio = time.perf_counter()
+        with self._lock:
+            self._bajas = []
+            self._cursor = 0
+
+        conteos: Dict[Clave, int] = {}
+        leidas = 0
+        try:
+            for pagina in self._leer_desde(supabase, 0):
+                for fila in pagina:
+                    self._sumar(conteos, _clave(fila), 1)
+                leidas += len(pagina)
+                with self._lock:
+                    self._cursor = pagina[-1]["id"]
+        except Exception:
+            with self._lock:
+                self._bajas = None
+            raise
+
+        with self._lock:
+            ultimo_id = self._cursor
+            # Lo que este worker registró o anuló mientras se leía
+            for entrega_id, clave in list(self._contadas.items()):
+                if entrega_id > ultimo_id:
+                    self._sumar(conteos, clave, 1)
+                else:
+                    del self._contadas[entrega_id]
+            for entrega_id, clave, ya_leida in self._bajas:
+                if ya_leida:
+                    self._sumar(conteos, clave, -1)
+            self._bajas = None
+            self._conteos = conteos
+            self._ultimo_id = max(self._ultimo_id, ultimo_id)
+            self._proxima_reconstruccion = time.monotonic() + self.intervalo_reconstruccion
+            self._iniciado = True
+
+        duracion = time.perf_counter() - inicio
+        print(f"📈 Rollups reconstruidos: {leidas} entregas en {len(conteos)} buckets ({duracion:.2f} s)")
+        return {"entregas": leidas, "buckets": len(conteos), "duracion_segundos": round(duracion, 3)}
+
+    def _poner_al_dia(self, supabase):
+        """Sumar las entregas nuevas de otros workers (id mayor al último visto)"""
+        for pagina in self._leer_desde(supabase, self._ultimo_id):
+            with self._lock:
+                for fila in pagina:
+                    if self._contadas.pop(fila["id"], None) is None:
+                        self._sumar(self._conteos, _clave(fila), 1)
+                self._ultimo_id = max(self._ultimo_id, pagina[-1]["id"])
+                for entrega_id in [i for i in self._contadas if i <= self._ultimo_id]:
+                    del self._contadas[entrega_id]
+
+    # ------------------------------------------
+    # Escrituras
+    # ------------------------------------------
+
+    def registrar(self, entrega: dict, sucursal_id: Optional[int], tipo_contrato: Optional[str], delta: int = 1):
+        """Sumar (delta=1) una entrega recién guardada o restar (delta=-1) una anulada"""
+        entrega_id = entrega.get("id")
+        if entrega_id is None:
+            return
+        clave = (_hora(entrega.get("fecha_hora")), sucursal_id, entrega.get("usuario_id"), tipo_contrato)
+        with self._lock:
+            if not self._iniciado:
+                return
+            if delta > 0:
+                # Ya sumada si la puesta al día la alcanzó a leer
+                if entrega_id > self._ultimo_id and entrega_id not in self._contadas:
+                    self._contadas[entrega_id] = clave
+                    self._sumar(self._conteos, clave, 1)
+                return
+
+            if self._contadas.pop(entrega_id, None) is not None or entrega_id <= self._ultimo_id:
+                self._sumar(self._conteos, clave, -1)
+            if self._bajas is not None:
+                self._bajas.append((entrega_id, clave, entrega_id <= self._cursor))
+
+    # ------------------------------------------
+    # Lecturas
+    # ------------------------------------------
+
+    def buckets(self) -> Dict[Clave, int]:
+        """Copia de los buckets (hora, sucursal_id, usuario_id, tipo_contrato) -> entregas"""
+        with self._lock:
+            if not self._iniciado:
+                raise RollupsNoListos("Los reportes se están preparando, intenta en unos segundos")
+            return dict(self._conteos)
+
+
+rollups = RollupEntregas(settings.ROLLUPS_AL_DIA, settings.ROLLUPS_RECONSTRUIR)
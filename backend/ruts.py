@@ -0,0 +1,127 @@
+"""
+ClipControl Backend - RUT: normalización, dígito verificador e índice en memoria
+
+Las consultas manuales por RUT en portería pasan por un índice LRU con TTL
+(RUT normalizado -> fila de v_empleados_completo). Un RUT mal escrito se
+rechaza antes de llegar a la base de datos.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from config import settings
+from database import iterar_paginas
+
+_FORMATO_RUT = re.compile(r"^(\d{1,8})([0-9K])$")
+
+
+def digito_verificador(numero: int) -> str:
+    """Dígito verificador (módulo 11) del cuerpo de un RUT"""
+    suma, factor = 0, 2
+    while numero:
+        suma += (numero % 10) * factor
+        numero //= 10
+        factor = 2 if factor == 7 else factor + 1
+    resto = 11 - suma % 11
+    return {11: "0", 10: "K"}.get(resto, str(resto))
+
+
+def normalizar_rut(rut: str) -> str:
+    """
+    "12.345.678-5" -> "123456785" (sin puntos ni guion, K mayúscula).
+    ValueError si el formato o el dígito verificador no son válidos.
+    """
+    limpio = (rut or "").strip().replace(".", "").replace("-", "").replace(" ", "").upper()
+    coincide = _FORMATO_RUT.match(limpio)
+    if not coincide:
+        raise ValueError(f"RUT inválido: {rut}")
+    cuerpo, dv = coincide.groups()
+    if digito_verificador(int(cuerpo)) != dv:
+        raise ValueError(f"RUT inválido (dígito verificador): {rut}")
+    return limpio
+
+
+class IndiceRut:
+    """LRU acotado de empleados por RUT normalizado, con expiración por entrada"""
+
+    def __init__(self, max_entradas: int, ttl_segundos: float):
+        self.max_entradas = max_entradas
+        self.ttl = ttl_segundos
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _query(self, supabase):
+        return supabase.table("v_empleados_completo").select("*")
+
+    def _leer(self, rut: str) -> Optional[dict]:
+        with self._lock:
+            entrada = self._datos.get(rut)
+            if entrada is None:
+                return None
+            expira, fila = entrada
+            if time.monotonic() >= expira:
+                del self._datos[rut]
+                return None
+            self._datos.move_to_end(rut)
+            return dict(fila)
+
+    def guardar(self, fila: dict):
+        rut = fila.get("rut")
+        if not rut:
+            return
+        with self._lock:
+            self._datos[rut] = (time.monotonic() + self.ttl, dict(fila))
+            self._datos.move_to_end(rut)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, rut: str):
+        with self._lock:
+            self._datos.pop(rut, None)
+
+    def obtener(self, supabase, rut: str) -> Optional[dict]:
+        """Buscar por RUT ya normalizado: primero en memoria, si no en la vista"""
+        fila = self._leer(rut)
+        if fila is not None:
+            return fila
+        result = self._query(supabase).eq("rut", rut).execute()
+        if not result.data:
+            return None
+        self.guardar(result.data[0])
+        return dict(result.data[0])
+
+    def refrescar(self, supabase, rut: str) -> Optional[dict]:
+        """Releer un empleado después de crearlo o modificarlo"""
+        self.invalidar(rut)
+        return self.obtener(supabase, rut)
+
+    def precargar(self, supabase) -> int:
+        """Cargar todos los empleados activos (hasta el máximo del índice)"""
+        total = 0
+        for pagina in iterar_paginas(lambda: self._query(supabase).eq("activo", True).order("id")):
+            for fila in pagina:
+                self.guardar(fila)
+            total += len(pagina)
+            if total >= self.max_entradas:
+                break
+        print(f"🪪 Índice de RUT precargado: {min(total, self.max_entradas)} empleados")
+        return total
+
+
+indice_rut = IndiceRut(settings.RUT_INDICE_MAX, settings.RUT_INDICE_TTL)
+
+
+def precargar_en_segundo_plano(supabase):
+    """Precargar el índice sin bloquear la petición que activó el período"""
+    if not settings.RUT_INDICE_PRECARGAR:
+        return
+
+    def _precargar():
+        try:
+            indice_rut.precargar(supabase)
+        except Exception as e:
+            print(f"❌ Error precargando índice de RUT: {e}")
+
+    threading.Thread(target=_precargar, name="precarga-ruts", daemon=True).start()
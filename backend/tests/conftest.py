@@ -0,0 +1,61 @@
+"""
+Pruebas del backend sobre el respaldo SQLite local.
+
+La configuración se lee al importar `config`, así que el entorno se fija
+aquí antes de que cualquier prueba importe módulos del backend.
+"""
+import os
+import sys
+import tempfile
+
+_DIRECTORIO = tempfile.mkdtemp(prefix="clipcontrol-pruebas-")
+
+os.environ["SECRET_KEY"] = "pruebas-" + "x" * 40
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(_DIRECTORIO, "clipcontrol.db")
+os.environ["FOTOS_DIR"] = os.path.join(_DIRECTORIO, "fotos")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from repositorio_sqlite import RepositorioSQLite, poblar  # noqa: E402
+
+
+def periodo_activo(supabase) -> int:
+    return supabase.table("periodos_entrega").select("id").eq("activo", True).execute().data[0]["id"]
+
+
+def alterar_token(token: str, parte: int) -> str:
+    """Cambiar el final de una parte (separada por '.') de un token firmado"""
+    partes = token.split(".")
+    partes[parte] = partes[parte][:-2] + ("AA" if partes[parte][-2:] != "AA" else "BB")
+    return ".".join(partes)
+
+
+@pytest.fixture
+def repo():
+    """Repositorio en memoria con 2 sucursales, guardias, un período activo y 40 empleados"""
+    repositorio = RepositorioSQLite(":memory:")
+    poblar(repositorio, empleados=40, sucursales=2, guardias_por_sucursal=1)
+    return repositorio
+
+
+@pytest.fixture(scope="session")
+def supabase():
+    """Base SQLite compartida que usan los endpoints de `main`"""
+    from database import get_supabase
+    from repositorio_sqlite import get_repositorio_sqlite
+
+    poblar(get_repositorio_sqlite(), empleados=1500, sucursales=2, guardias_por_sucursal=1)
+    return get_supabase()
+
+
+@pytest.fixture(scope="session")
+def cliente(supabase):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    # Sin `with`: no corren los eventos de inicio ni los hilos de fondo
+    return TestClient(main.app)
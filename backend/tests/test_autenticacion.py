@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from autenticacion import TokenInvalido, crear_token_acceso, verificar_token_acceso
+from config import CLAVES_INSEGURAS, settings
+from conftest import alterar_token
+
+USUARIO = {"id": 7, "username": "guardia1", "rol": "guardia", "sucursal_id": 2, "nombre_completo": "Guardia Uno"}
+
+
+def test_token_de_acceso_valido():
+    usuario = verificar_token_acceso(crear_token_acceso(USUARIO))
+
+    assert (usuario.id, usuario.username, usuario.rol, usuario.sucursal_id) == (7, "guardia1", "GUARDIA", 2)
+
+
+@pytest.mark.parametrize("parte", [1, 2])
+def test_token_de_acceso_alterado(parte):
+    with pytest.raises(TokenInvalido):
+        verificar_token_acceso(alterar_token(crear_token_acceso(USUARIO), parte))
+
+
+def test_token_de_acceso_expirado(monkeypatch):
+    token = crear_token_acceso(USUARIO)
+    despues = time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60 + 1
+    monkeypatch.setattr(time, "time", lambda: despues)
+
+    with pytest.raises(TokenInvalido, match="expirada"):
+        verificar_token_acceso(token)
+
+
+@pytest.mark.parametrize("encabezados, estado", [
+    ({}, 401),
+    ({"Authorization": "Bearer " + alterar_token(crear_token_acceso({**USUARIO, "rol": "ADMIN"}), 1)}, 401),
+    ({"Authorization": "Bearer " + crear_token_acceso(USUARIO)}, 403),
+])
+def test_endpoint_protegido(cliente, encabezados, estado):
+    archivo = {"archivo": ("nomina.csv", b"rut;nombre\n", "text/csv")}
+    respuesta = cliente.post("/api/empleados/importar", files=archivo, data={"simular": "true"}, headers=encabezados)
+    assert respuesta.status_code == estado
+
+
+@pytest.mark.parametrize("clave", sorted(CLAVES_INSEGURAS))
+def test_secret_key_insegura(monkeypatch, clave):
+    monkeypatch.setattr(settings, "SECRET_KEY", clave)
+    with pytest.raises(ValueError):
+        settings.secret_key()
@@ -0,0 +1,88 @@
+import pytest
+
+from conftest import periodo_activo
+from entregados import entregados
+
+
+@pytest.fixture
+def empleado_id(supabase):
+    """Un empleado distinto en cada prueba, sin entregas en el período activo"""
+    usados = {e["empleado_id"] for e in supabase.table("entregas").select("empleado_id").execute().data}
+    libres = supabase.table("empleados").select("id").eq("activo", True).order("id", desc=True).limit(200).execute().data
+    return next(e["id"] for e in libres if e["id"] not in usados)
+
+
+def _completadas(supabase, empleado_id: int, periodo_id: int) -> int:
+    return len(
+        supabase.table("entregas").select("id").eq("empleado_id", empleado_id)
+        .eq("periodo_id", periodo_id).eq("estado", "COMPLETADO").execute().data
+    )
+
+
+def test_segunda_entrega_se_rechaza(cliente, supabase, empleado_id):
+    periodo_id = periodo_activo(supabase)
+    datos = {"empleado_id": empleado_id, "periodo_id": periodo_id}
+
+    assert cliente.post("/api/entregas", json=datos).status_code == 200
+    assert cliente.post("/api/entregas", json=datos).status_code == 400
+    assert _completadas(supabase, empleado_id, periodo_id) == 1
+
+
+def test_entrega_de_otro_worker_se_confirma_en_la_bd(cliente, supabase, empleado_id):
+    periodo_id = periodo_activo(supabase)
+    entregados.conjunto(supabase, periodo_id)
+    # Otro worker registró la entrega: el conjunto en memoria de este no la ve
+    supabase.table("entregas").insert({"empleado_id": empleado_id, "periodo_id": periodo_id}).execute()
+    assert not entregados.ya_retiro(supabase, periodo_id, empleado_id)
+
+    respuesta = cliente.post("/api/entregas", json={"empleado_id": empleado_id, "periodo_id": periodo_id})
+
+    assert respuesta.status_code == 400
+    assert entregados.ya_retiro(supabase, periodo_id, empleado_id)
+    assert _completadas(supabase, empleado_id, periodo_id) == 1
+
+
+def test_marca_en_memoria_sin_fila_no_bloquea(cliente, supabase, empleado_id):
+    periodo_id = periodo_activo(supabase)
+    # Anulada en otro worker: este aún la tiene marcada
+    entregados.marcar(periodo_id, empleado_id)
+
+    respuesta = cliente.post("/api/entregas", json={"empleado_id": empleado_id, "periodo_id": periodo_id})
+
+    assert respuesta.status_code == 200
+    assert _completadas(supabase, empleado_id, periodo_id) == 1
+
+
+def _validar(cliente, supabase, empleado_id: int, periodo_id: int):
+    empleado = supabase.table("empleados").select("rut, sucursal_id").eq("id", empleado_id).execute().data[0]
+    respuesta = cliente.post("/api/validar-retiro", json={
+        "rut": empleado["rut"], "periodo_id": periodo_id, "sucursal_id": empleado["sucursal_id"]
+    })
+    assert respuesta.status_code == 200
+    return respuesta.json()
+
+
+def test_validar_retiro_responde_desde_el_conjunto(cliente, supabase, empleado_id, monkeypatch):
+    import main
+
+    periodo_id = periodo_activo(supabase)
+    entregados.conjunto(supabase, periodo_id)
+
+    def sin_consultas(*args):
+        raise AssertionError("validar-retiro no debe consultar entregas si el conjunto no lo marca")
+
+    with monkeypatch.context() as parche:
+        parche.setattr(main, "_entrega_completada", sin_consultas)
+        assert _validar(cliente, supabase, empleado_id, periodo_id)["valido"] is True
+
+    assert cliente.post("/api/entregas", json={"empleado_id": empleado_id, "periodo_id": periodo_id}).status_code == 200
+    datos = _validar(cliente, supabase, empleado_id, periodo_id)
+    assert datos["ya_retiro"] is True
+    assert "ya retiró el" in datos["mensaje"]
+
+
+def test_validar_retiro_ignora_una_marca_sin_fila(cliente, supabase, empleado_id):
+    periodo_id = periodo_activo(supabase)
+    entregados.marcar(periodo_id, empleado_id)
+
+    assert _validar(cliente, supabase, empleado_id, periodo_id)["valido"] is True
@@ -0,0 +1,134 @@
+import io
+import os
+import time
+
+import pytest
+from PIL import Image
+
+from config import settings
+from conftest import periodo_activo
+from fotos import IngestaFotos, LimpiezaFotos, get_almacen_fotos, hash_de_referencia
+
+
+def _jpeg(ancho: int = 2400, alto: int = 1200) -> bytes:
+    imagen = Image.new("RGB", (ancho, alto), (200, 30, 30))
+    datos = io.BytesIO()
+    imagen.save(datos, format="JPEG", quality=95)
+    return datos.getvalue()
+
+
+@pytest.fixture
+def ingesta():
+    return IngestaFotos(workers=1, tamano_cola=4)
+
+
+@pytest.fixture
+def limpieza():
+    return LimpiezaFotos(intervalo=3600, gracia=60)
+
+
+def _entregas_con_foto(repo, ref: str, cantidad: int) -> list:
+    periodo_id = periodo_activo(repo)
+    empleados = repo.table("empleados").select("id").order("id").limit(cantidad).execute().data
+    return [
+        fila["id"] for fila in repo.table("entregas").insert([
+            {"empleado_id": e["id"], "periodo_id": periodo_id, "foto_entrega": ref} for e in empleados
+        ]).execute().data
+    ]
+
+
+def _foto(repo, entrega_id: int) -> str:
+    return repo.table("entregas").select("foto_entrega").eq("id", entrega_id).execute().data[0]["foto_entrega"]
+
+
+def test_guardar_deduplica_por_contenido():
+    almacen = get_almacen_fotos()
+    datos = _jpeg(640, 480)
+
+    primera = almacen.guardar(io.BytesIO(datos))
+    segunda = almacen.guardar(io.BytesIO(datos))
+
+    assert primera["ref"] == segunda["ref"]
+    assert not segunda["nuevo"]
+    assert hash_de_referencia(primera["ref"])
+
+
+def _envejecer(almacen, ref: str, segundos: float = 3600):
+    hace = time.time() - segundos
+    os.utime(almacen.ruta(ref), (hace, hace))
+
+
+def test_procesar_normaliza_y_reemplaza_la_referencia(repo, ingesta):
+    almacen = get_almacen_fotos()
+    ref = almacen.guardar(io.BytesIO(_jpeg(2400, 1300)))["ref"]
+    [entrega_id] = _entregas_con_foto(repo, ref, 1)
+
+    ingesta.procesar(repo, entrega_id, ref)
+
+    nueva = _foto(repo, entrega_id)
+    assert nueva != ref
+    with almacen.abrir(nueva) as archivo, Image.open(archivo) as imagen:
+        assert max(imagen.size) <= settings.FOTOS_MAX_LADO
+    with almacen.abrir_miniatura(nueva) as archivo:
+        assert archivo.read()
+
+
+def test_limpieza_borra_solo_originales_sin_referencia(repo, ingesta, limpieza):
+    almacen = get_almacen_fotos()
+    ref = almacen.guardar(io.BytesIO(_jpeg(2400, 1400)))["ref"]
+    primera, segunda = _entregas_con_foto(repo, ref, 2)
+
+    ingesta.procesar(repo, primera, ref)
+    _envejecer(almacen, ref)
+    limpieza.barrer(repo)
+
+    # La segunda entrega aún apunta al original
+    assert _foto(repo, segunda) == ref
+    assert almacen.existe(ref)
+
+    ingesta.procesar(repo, segunda, ref)
+    limpieza.barrer(repo)
+
+    assert _foto(repo, segunda) == _foto(repo, primera)
+    assert almacen.existe(_foto(repo, primera))
+    assert not almacen.existe(ref)
+
+
+def test_limpieza_respeta_la_gracia(repo, limpieza):
+    """Una foto recién guardada puede no tener aún su fila en entregas"""
+    almacen = get_almacen_fotos()
+    ref = almacen.guardar(io.BytesIO(_jpeg(800, 600)))["ref"]
+
+    limpieza.barrer(repo)
+    assert almacen.existe(ref)
+
+    _envejecer(almacen, ref)
+    limpieza.barrer(repo)
+    assert not almacen.existe(ref)
+
+
+def test_guardar_de_nuevo_renueva_la_gracia(repo, limpieza):
+    almacen = get_almacen_fotos()
+    datos = _jpeg(820, 600)
+    ref = almacen.guardar(io.BytesIO(datos))["ref"]
+    _envejecer(almacen, ref)
+
+    # Otra subida de los mismos bytes, cuya entrega aún no se inserta
+    assert not almacen.guardar(io.BytesIO(datos))["nuevo"]
+    limpieza.barrer(repo)
+
+    assert almacen.existe(ref)
+
+
+def test_eliminar_restaura_si_se_uso_durante_la_limpieza():
+    almacen = get_almacen_fotos()
+    ref = almacen.guardar(io.BytesIO(_jpeg(840, 600)))["ref"]
+
+    # Usada después de que la limpieza la eligió como candidata
+    assert not almacen.eliminar_si_sin_uso(ref, time.time() - 60)
+    assert almacen.existe(ref)
+
+    assert almacen.eliminar_si_sin_uso(ref, time.time() + 60)
+    assert not almacen.existe(ref)
+    # Una subida posterior la vuelve a guardar
+    assert almacen.guardar(io.BytesIO(_jpeg(840, 600)))["nuevo"]
@@ -0,0 +1,72 @@
+import io
+
+from nomina import importar_nomina
+
+ENCABEZADO = "rut;nombre;apellido;tipo_contrato;seccion;sucursal\n"
+
+
+def _activos(repo):
+    return repo.table("empleados").select("*").eq("activo", True).order("id").execute().data
+
+
+def _csv(empleados, extra=""):
+    filas = "".join(
+        f"{e['rut']};{e['nombre']};{e['apellido']};{e['tipo_contrato']};{e['seccion']};{e['sucursal_id']}\n" for e in empleados
+    )
+    return io.BytesIO((ENCABEZADO + filas + extra).encode())
+
+
+def test_diferencias_inserta_actualiza_y_desactiva(repo):
+    activos = _activos(repo)
+    ausente, renombrado, presentes = activos[0], activos[1], activos[2:]
+    renombrado = {**renombrado, "nombre": "Renombrado"}
+
+    resumen = importar_nomina(
+        repo, _csv([renombrado] + presentes, "11111111-1;Nueva;Persona;PLANTA;Bodega;1\n"), "nomina.csv",
+        desactivar_ausentes=True
+    )
+
+    assert resumen["con_error"] == 0
+    assert (resumen["insertados"], resumen["actualizados"], resumen["desactivados"]) == (1, 1, 1)
+    assert resumen["sin_cambios"] == len(presentes)
+    assert resumen["ruts_a_desactivar"] == [ausente["rut"]]
+    fila = repo.table("empleados").select("activo").eq("id", ausente["id"]).execute().data[0]
+    assert not fila["activo"]
+    fila = repo.table("empleados").select("nombre").eq("id", activos[1]["id"]).execute().data[0]
+    assert fila["nombre"] == "Renombrado"
+
+
+def test_fila_con_error_no_desactiva_a_su_empleado(repo):
+    activos = _activos(repo)
+    con_error = {**activos[0], "tipo_contrato": "PLNTA"}
+
+    resumen = importar_nomina(repo, _csv([con_error] + activos[1:]), "nomina.csv", desactivar_ausentes=True)
+
+    assert resumen["con_error"] == 1
+    assert resumen["errores"][0]["rut"] == activos[0]["rut"]
+    assert resumen["desactivados"] == 0
+    assert len(_activos(repo)) == len(activos)
+
+
+def test_con_errores_se_omite_la_desactivacion(repo):
+    activos = _activos(repo)
+
+    resumen = importar_nomina(
+        repo, _csv(activos[1:], "12.345.678-0;Mal;Rut;PLANTA;Bodega;1\n"), "nomina.csv", desactivar_ausentes=True
+    )
+
+    assert resumen["desactivacion_omitida"]
+    assert resumen["ruts_a_desactivar"] == [activos[0]["rut"]]
+    assert resumen["desactivados"] == 0
+    assert len(_activos(repo)) == len(activos)
+
+
+def test_simular_no_escribe(repo):
+    activos = _activos(repo)
+
+    resumen = importar_nomina(repo, _csv(activos[1:]), "nomina.csv", desactivar_ausentes=True, simular=True)
+
+    assert resumen["simulado"]
+    assert resumen["desactivados"] == 1
+    assert resumen["ruts_a_desactivar"] == [activos[0]["rut"]]
+    assert len(_activos(repo)) == len(activos)
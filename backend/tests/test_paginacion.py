@@ -0,0 +1,66 @@
+import base64
+import json
+
+import pytest
+
+from paginacion import codificar_cursor, decodificar_cursor, filtro_keyset_desc
+
+CLAVES = ("fecha_hora", "id")
+
+
+def _cursor_crudo(valores) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode()
+
+
+def test_cursor_ida_y_vuelta():
+    valores = {"fecha_hora": "2026-10-18T10:00:00+00:00", "id": 42}
+    assert decodificar_cursor(codificar_cursor(valores), CLAVES) == valores
+    assert decodificar_cursor("", CLAVES) is None
+
+
+@pytest.mark.parametrize("valores", [
+    {"fecha_hora": "2026-10-18T10:00:00", "id": "42"},
+    {"fecha_hora": "2026-10-18T10:00:00", "id": True},
+    {"fecha_hora": "2026-10-18T10:00:00", "id": 4.2},
+    {"fecha_hora": 'x",id.gt.0', "id": 1},
+    {"fecha_hora": "ayer", "id": 1},
+    {"fecha_hora": None, "id": 1},
+    {"id": 1},
+    ["2026-10-18", 1],
+])
+def test_cursor_invalido(valores):
+    with pytest.raises(ValueError):
+        decodificar_cursor(_cursor_crudo(valores), CLAVES)
+
+
+def test_cursor_no_base64():
+    with pytest.raises(ValueError):
+        decodificar_cursor("%%%", CLAVES)
+
+
+def test_filtro_keyset_rechaza_comillas():
+    assert filtro_keyset_desc("fecha_hora", "2026-10-18T10:00:00", 7) == \
+        'fecha_hora.lt."2026-10-18T10:00:00",and(fecha_hora.eq."2026-10-18T10:00:00",id.lt.7)'
+    with pytest.raises(ValueError):
+        filtro_keyset_desc("fecha_hora", 'x"),id.gt.(0', 7)
+
+
+@pytest.mark.parametrize("limit", [300, 1000])
+def test_keyset_de_empleados_recorre_todos(cliente, supabase, limit):
+    ids, cursor = [], ""
+    while cursor is not None:
+        respuesta = cliente.get("/api/empleados", params={"cursor": cursor, "limit": limit})
+        assert respuesta.status_code == 200
+        pagina = respuesta.json()
+        ids += [empleado["id"] for empleado in pagina["data"]]
+        cursor = pagina["next_cursor"]
+
+    activos = supabase.table("empleados").select("id", count="exact").eq("activo", True).limit(1).execute().count
+    assert len(ids) == len(set(ids)) == activos
+    assert ids == sorted(ids)
+
+
+@pytest.mark.parametrize("ruta", ["/api/entregas/lista", "/api/empleados"])
+def test_cursor_malformado_responde_400(cliente, ruta):
+    cursor = _cursor_crudo({"fecha_hora": 'x",id.gt.0', "id": "abc"})
+    assert cliente.get(ruta, params={"cursor": cursor}).status_code == 400
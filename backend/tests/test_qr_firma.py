@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import alterar_token
+from qr_firma import firmar_token, verificar_token
+
+
+def test_qr_valido():
+    ahora = datetime.now()
+    codigo, datos = verificar_token(firmar_token(11, 22, 3, ahora, ahora + timedelta(minutes=5)))
+
+    assert codigo == "OK"
+    assert (datos["token_id"], datos["empleado_id"], datos["periodo_id"]) == (11, 22, 3)
+
+
+def test_qr_sin_periodo():
+    ahora = datetime.now()
+    _, datos = verificar_token(firmar_token(1, 2, None, ahora, ahora + timedelta(minutes=5)))
+    assert datos["periodo_id"] is None
+
+
+@pytest.mark.parametrize("parte", [1, 2])
+def test_qr_alterado(parte):
+    ahora = datetime.now()
+    token = firmar_token(11, 22, 3, ahora, ahora + timedelta(minutes=5))
+    assert verificar_token(alterar_token(token, parte)) == ("TOKEN_INVALIDO", None)
+
+
+@pytest.mark.parametrize("token", ["", "s1", "s1.a.b.c", "s2.AAAA.AAAA", "s1.!!!.AAAA"])
+def test_qr_malformado(token):
+    assert verificar_token(token)[0] == "TOKEN_INVALIDO"
+
+
+def test_qr_expirado():
+    emitido = datetime.now() - timedelta(hours=1)
+    codigo, datos = verificar_token(firmar_token(11, 22, 3, emitido, emitido + timedelta(minutes=5)))
+
+    assert codigo == "TOKEN_EXPIRADO"
+    assert datos["empleado_id"] == 22
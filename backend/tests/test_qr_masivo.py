@@ -0,0 +1,35 @@
+import json
+
+from qr_masivo import stream_tokens_masivo
+
+
+def _eventos(repo, empleados: list, **opciones) -> list:
+    lineas = stream_tokens_masivo(repo, empleados, len(empleados), 10, chunk_size=5, paralelismo=2, **opciones)
+    return [json.loads(linea) for linea in lineas]
+
+
+def _empleados(repo, cantidad: int) -> list:
+    return repo.table("empleados").select("id, rut, nombre, apellido, tipo_contrato").order("id").limit(cantidad).execute().data
+
+
+def test_corrida_completa(repo):
+    eventos = _eventos(repo, _empleados(repo, 12))
+    fin = eventos[-1]
+
+    assert fin["tipo"] == "fin"
+    assert fin["success"] is True
+    assert (fin["qr_generados"], fin["qr_fallidos"], fin["chunks_fallidos"]) == (12, 0, 0)
+    assert sum(len(e["qr_data"]) for e in eventos if e["tipo"] == "chunk") == 12
+
+
+def test_corrida_parcial_no_es_exitosa(repo):
+    empleados = _empleados(repo, 12)
+    # Un empleado sin id hace fallar el insert de su bloque
+    empleados[6] = {**empleados[6], "id": None}
+
+    eventos = _eventos(repo, empleados)
+    fin = eventos[-1]
+
+    assert [e["chunk"] for e in eventos if e["tipo"] == "error"] == [1]
+    assert fin["success"] is False
+    assert (fin["qr_generados"], fin["qr_fallidos"], fin["chunks_fallidos"]) == (7, 5, 1)
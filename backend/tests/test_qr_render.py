@@ -0,0 +1,45 @@
+import io
+import zipfile
+
+import pytest
+
+import qr_render
+
+
+def _items(cantidad: int) -> list:
+    return [
+        {"empleado_id": i, "rut": f"1234567{i % 10}", "nombre": f"Empleado {i}", "tipo_contrato": "PLANTA",
+         "qr_string": f"s1.prueba{i}.firma"}
+        for i in range(cantidad)
+    ]
+
+
+@pytest.fixture
+def pool():
+    yield qr_render.get_pool()
+    qr_render.detener_pool()
+
+
+def test_pool_usa_spawn(pool):
+    # Un fork heredaría los locks de los hilos en segundo plano del worker
+    assert pool._mp_context.get_start_method() == "spawn"
+
+
+def test_pdf_una_pagina_cada_doce_etiquetas(pool):
+    pdf = b"".join(qr_render.stream_pdf(_items(13)))
+
+    assert pdf.startswith(b"%PDF")
+    assert pdf.count(b"/Type /Page ") == 2
+    assert b"/Count 2" in pdf
+
+
+def test_zip_un_png_por_empleado(pool):
+    datos = b"".join(qr_render.stream_zip(_items(5)))
+
+    with zipfile.ZipFile(io.BytesIO(datos)) as zf:
+        assert len(zf.namelist()) == 5
+
+
+def test_detener_pool_lo_recrea_al_volver_a_pedirlo(pool):
+    qr_render.detener_pool()
+    assert qr_render.get_pool() is not pool
@@ -0,0 +1,82 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from PIL import Image
+
+from conftest import periodo_activo
+from fotos import get_almacen_fotos
+from qr_firma import firmar_token
+
+RUTA = "/api/entregas/registrar-seguro"
+
+
+def _foto(semilla: int) -> bytes:
+    datos = io.BytesIO()
+    Image.new("RGB", (320, 240), (semilla % 256, 80, 120)).save(datos, format="JPEG")
+    return datos.getvalue()
+
+
+def _refs() -> set:
+    return {ref for ref, _ in get_almacen_fotos().listar()}
+
+
+@pytest.fixture
+def qr(supabase):
+    """(token firmado, fila de qr_tokens) de un empleado sin entregas"""
+    usados = {e["empleado_id"] for e in supabase.table("entregas").select("empleado_id").execute().data}
+    empleado = next(
+        e for e in supabase.table("empleados").select("id").eq("activo", True).order("id", desc=True).limit(300).execute().data
+        if e["id"] not in usados
+    )
+    ahora = datetime.now()
+    fila = supabase.table("qr_tokens").insert({
+        "empleado_id": empleado["id"],
+        "token": f"prueba-{empleado['id']}-{ahora.timestamp()}",
+        "fecha_generacion": ahora.isoformat(),
+        "fecha_expiracion": (ahora + timedelta(minutes=10)).isoformat()
+    }).execute().data[0]
+    periodo_id = periodo_activo(supabase)
+    return firmar_token(fila["id"], empleado["id"], periodo_id, ahora, ahora + timedelta(minutes=10)), fila
+
+
+def _registrar(cliente, token: str, fila: dict, periodo_id: int, semilla: int):
+    return cliente.post(RUTA, data={
+        "qr_token_id": fila["id"], "empleado_id": fila["empleado_id"], "usuario_id": 1,
+        "periodo_id": periodo_id, "qr_token": token
+    }, files={"foto": ("foto.jpg", _foto(semilla), "image/jpeg")})
+
+
+def test_registrar_guarda_la_foto(cliente, supabase, qr):
+    token, fila = qr
+
+    respuesta = _registrar(cliente, token, fila, periodo_activo(supabase), 1)
+
+    assert respuesta.status_code == 200
+    entrega = supabase.table("entregas").select("foto_entrega").eq("id", respuesta.json()["entrega_id"]).execute().data[0]
+    assert entrega["foto_entrega"] in _refs()
+
+
+def test_qr_ya_usado_no_deja_foto_huerfana(cliente, supabase, qr):
+    token, fila = qr
+    # Usado por otro worker: este aún no lo tiene marcado en memoria
+    supabase.table("qr_tokens").update({"usado": True}).eq("id", fila["id"]).execute()
+    antes = _refs()
+
+    respuesta = _registrar(cliente, token, fila, periodo_activo(supabase), 2)
+
+    assert respuesta.status_code == 400
+    assert "utilizado" in respuesta.json()["detail"]
+    assert _refs() == antes
+
+
+def test_qr_de_otro_periodo_se_rechaza(cliente, supabase, qr):
+    token, fila = qr
+    otro_periodo = periodo_activo(supabase) + 1000
+
+    respuesta = _registrar(cliente, token, fila, otro_periodo, 3)
+
+    assert respuesta.status_code == 400
+    assert "otro período" in respuesta.json()["detail"]
+    usado = supabase.table("qr_tokens").select("usado").eq("id", fila["id"]).execute().data[0]["usado"]
+    assert not usado
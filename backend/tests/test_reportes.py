@@ -0,0 +1,69 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import periodo_activo
+
+RUTA = "/api/reportes/entregas-por-fecha"
+
+
+@pytest.fixture(scope="module")
+def entregas(supabase):
+    """1200 entregas con horas repetidas, para cruzar el tope de 1000 filas por respuesta"""
+    periodo_id = periodo_activo(supabase)
+    empleados = supabase.table("empleados").select("id").order("id").limit(1000).execute().data
+    base = datetime(2026, 10, 1, 9)
+    filas = [
+        {"empleado_id": empleados[i % len(empleados)]["id"], "periodo_id": periodo_id, "estado": "ANULADO",
+         "fecha_hora": (base + timedelta(minutes=i // 3)).isoformat()}
+        for i in range(1200)
+    ]
+    for inicio in range(0, len(filas), 500):
+        supabase.table("entregas").insert(filas[inicio:inicio + 500]).execute()
+    return supabase.table("entregas").select("id", count="exact").gte("fecha_hora", "2026-10-01").limit(1).execute().count
+
+
+@pytest.mark.parametrize("limit", [250, 1000])
+def test_keyset_recorre_todas_las_filas_una_vez(cliente, entregas, limit):
+    ids, cursor = [], ""
+    while cursor is not None:
+        respuesta = cliente.get(RUTA,
+                                params={"cursor": cursor, "limit": limit, "fecha_inicio": "2026-10-01"})
+        assert respuesta.status_code == 200
+        pagina = respuesta.json()
+        ids += [entrega["id"] for entrega in pagina["data"]]
+        cursor = pagina["next_cursor"]
+
+    assert len(ids) == len(set(ids)) == entregas
+
+
+def test_sin_cursor_ni_limite_devuelve_el_rango_completo(cliente, entregas):
+    respuesta = cliente.get(RUTA, params={"fecha_inicio": "2026-10-01"})
+    assert respuesta.status_code == 200
+    ids = [entrega["id"] for entrega in respuesta.json()]
+    assert len(ids) == len(set(ids)) == entregas
+    assert "X-Resultados-Truncados" not in respuesta.headers
+
+
+def test_sin_cursor_se_trunca_al_limite(cliente, entregas):
+    respuesta = cliente.get(RUTA, params={"fecha_inicio": "2026-10-01", "limit": 1000})
+    assert respuesta.status_code == 200
+    assert len(respuesta.json()) == 1000
+    assert respuesta.headers["X-Resultados-Truncados"] == "true"
+
+
+@pytest.mark.parametrize("limit", [0, -1, 1001])
+def test_limite_fuera_de_rango(cliente, limit):
+    assert cliente.get(RUTA, params={"limit": limit}).status_code == 422
+
+
+def test_cursor_malformado_responde_400(cliente):
+    cursor = base64.urlsafe_b64encode(json.dumps({"fecha_hora": "2026-10-01", "id": "abc"}).encode()).decode()
+    assert cliente.get(RUTA, params={"cursor": cursor}).status_code == 400
+
+
+def test_el_navegador_puede_leer_el_aviso_de_truncado(cliente):
+    respuesta = cliente.get(RUTA, params={"limit": 1}, headers={"Origin": "http://localhost:5173"})
+    assert "x-resultados-truncados" in respuesta.headers["access-control-expose-headers"].lower()
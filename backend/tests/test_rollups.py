@@ -0,0 +1,94 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from conftest import periodo_activo
+from rollups import RollupEntregas, RollupsNoListos
+
+
+def _insertar(repo, cantidad: int, usuario_id=None) -> list:
+    periodo_id = periodo_activo(repo)
+    empleados = repo.table("empleados").select("id").order("id").limit(cantidad).execute().data
+    return repo.table("entregas").insert([
+        {"empleado_id": e["id"], "periodo_id": periodo_id, "usuario_id": usuario_id,
+         "fecha_hora": datetime(2026, 10, 18, 10 + i % 3).isoformat()}
+        for i, e in enumerate(empleados)
+    ]).execute().data
+
+
+def _empleado(repo, entrega: dict) -> dict:
+    return repo.table("empleados").select("sucursal_id, tipo_contrato").eq("id", entrega["empleado_id"]).execute().data[0]
+
+
+def _total(rollup) -> int:
+    return sum(rollup.buckets().values())
+
+
+@pytest.fixture
+def rollup():
+    return RollupEntregas(intervalo_al_dia=60, intervalo_reconstruccion=3600)
+
+
+def test_sin_reconstruir_no_hay_buckets(rollup):
+    with pytest.raises(RollupsNoListos):
+        rollup.buckets()
+
+
+def test_reconstruir_cuenta_todo(repo, rollup):
+    _insertar(repo, 30)
+
+    resumen = rollup.reconstruir(repo)
+
+    assert resumen["entregas"] == 30
+    assert _total(rollup) == 30
+    assert len(rollup.buckets()) == resumen["buckets"]
+
+
+def test_registrar_y_anular(repo, rollup):
+    _insertar(repo, 10)
+    rollup.reconstruir(repo)
+
+    nueva = _insertar(repo, 1, usuario_id=1)[0]
+    empleado = _empleado(repo, nueva)
+    rollup.registrar(nueva, empleado["sucursal_id"], empleado["tipo_contrato"])
+    rollup.registrar(nueva, empleado["sucursal_id"], empleado["tipo_contrato"])
+    assert _total(rollup) == 11
+
+    # La puesta al día no vuelve a sumar lo que este worker ya registró
+    rollup._poner_al_dia(repo)
+    assert _total(rollup) == 11
+
+    repo.table("entregas").delete().eq("id", nueva["id"]).execute()
+    rollup.registrar(nueva, empleado["sucursal_id"], empleado["tipo_contrato"], delta=-1)
+    assert _total(rollup) == 10
+
+    rollup.reconstruir(repo)
+    assert _total(rollup) == 10
+
+
+def test_poner_al_dia_suma_entregas_de_otros_workers(repo, rollup):
+    _insertar(repo, 10)
+    rollup.reconstruir(repo)
+
+    _insertar(repo, 5)
+    rollup._poner_al_dia(repo)
+
+    assert _total(rollup) == 15
+
+
+def test_reconstruccion_en_segundo_plano(repo, rollup):
+    _insertar(repo, 12)
+    rollup.iniciar(repo)
+    try:
+        for _ in range(100):
+            try:
+                if _total(rollup) == 12:
+                    break
+            except RollupsNoListos:
+                pass
+            time.sleep(0.05)
+    finally:
+        rollup.detener()
+
+    assert _total(rollup) == 12
@@ -0,0 +1,116 @@
+"""
+ClipControl Backend - Traspaso al sindicato de las cajas no retiradas
+
+Los empleados activos sin entrega en el período se calculan como diferencia
+de conjuntos y se insertan en cajas_no_retiradas por bloques. Quien ya tiene
+su caja registrada en el período se salta: volver a correr el traspaso
+después de una falla parcial solo inserta lo que faltó.
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from config import settings
+from database import iterar_paginas
+from qr_masivo import dividir_en_chunks, serializar_evento
+
+_en_curso = set()
+_lock = threading.Lock()
+
+
+class TraspasoEnCurso(Exception):
+    """Ya hay un traspaso corriendo para el período en este proceso"""
+
+
+def _ids(supabase, tabla: str, columna: str, **filtros) -> set:
+    def construir_query():
+        query = supabase.table(tabla).select(f"id, {columna}")
+        for campo, valor in filtros.items():
+            query = query.eq(campo, valor)
+        return query.order("id")
+
+    return {fila[columna] for pagina in iterar_paginas(construir_query) for fila in pagina}
+
+
+def traspasar_no_retiradas(supabase, periodo: dict, chunk_size: Optional[int] = None):
+    """
+    Generador de eventos (tipo, datos): "inicio", un "progreso" (o "error")
+    por bloque insertado y "fin". TraspasoEnCurso al arrancar si el período
+    ya se está procesando.
+    """
+    periodo_id = periodo['id']
+    with _lock:
+        if periodo_id in _en_curso:
+            raise TraspasoEnCurso(f"Ya hay un traspaso en curso para el período {periodo_id}")
+        _en_curso.add(periodo_id)
+
+    try:
+        inicio = time.perf_counter()
+        activos = sorted(_ids(supabase, "empleados", "id", activo=True))
+        retiraron = _ids(supabase, "entregas", "empleado_id", periodo_id=periodo_id)
+        ya_traspasados = _ids(supabase, "cajas_no_retiradas", "empleado_id", periodo_id=periodo_id)
+
+        no_retiraron = [empleado_id for empleado_id in activos if empleado_id not in retiraron]
+        por_traspasar = [empleado_id for empleado_id in no_retiraron if empleado_id not in ya_traspasados]
+
+        yield "inicio", {
+            "periodo_id": periodo_id,
+            "total_empleados": len(activos),
+            "retiraron": len(retiraron),
+            "no_retiraron": len(no_retiraron),
+            "ya_traspasados": len(no_retiraron) - len(por_traspasar),
+            "por_traspasar": len(por_traspasar)
+        }
+
+        fecha_traspaso = datetime.now().isoformat()
+        insertados = 0
+        fallidos = 0
+        for numero, chunk in enumerate(dividir_en_chunks(por_traspasar, chunk_size or settings.TRASPASO_CHUNK_SIZE)):
+            filas = [
+                {
+                    "periodo_id": periodo_id,
+                    "empleado_id": empleado_id,
+                    "tipo_beneficio_id": periodo.get('tipo_beneficio_id', 1),
+                    "fecha_limite": periodo['fecha_fin'],
+                    "estado": "TRASPASADO_SINDICATO",
+                    "fecha_traspaso": fecha_traspaso,
+                    "observaciones": "No retiró en plazo. Traspasado automáticamente al sindicato."
+                }
+                for empleado_id in chunk
+            ]
+            try:
+                supabase.table("cajas_no_retiradas").insert(filas).execute()
+            except Exception as e:
+                print(f"❌ Error en bloque {numero} del traspaso: {e}")
+                fallidos += len(chunk)
+                yield "error", {"chunk": numero, "total": len(chunk), "empleados_ids": chunk, "error": str(e)}
+                continue
+
+            insertados += len(chunk)
+            yield "progreso", {
+                "chunk": numero,
+                "procesados": insertados + fallidos,
+                "por_traspasar": len(por_traspasar),
+                "porcentaje": round((insertados + fallidos) / len(por_traspasar) * 100, 1)
+            }
+
+        yield "fin", {
+            "success": fallidos == 0,
+            "total_empleados": len(activos),
+            "retiraron": len(retiraron),
+            "no_retiraron": len(no_retiraron),
+            "traspasados_sindicato": insertados,
+            "ya_traspasados": len(no_retiraron) - len(por_traspasar),
+            "fallidos": fallidos,
+            "duracion_segundos": round(time.perf_counter() - inicio, 3)
+        }
+    finally:
+        with _lock:
+            _en_curso.discard(periodo_id)
+
+
+def stream_traspaso(eventos, formato: str = "ndjson"):
+    """Serializar los eventos del traspaso como NDJSON o SSE"""
+    for tipo, datos in eventos:
+        yield serializar_evento(tipo, datos, formato)
@@ -172,6 +172,7 @@ const Scanner: React.FC = () => {
     try {
       const data = {
         qr_token_id: qrData.token_id,
+        qr_token: qrData.token,
         empleado_id: empleado.id,
         usuario_id: user.id,
         periodo_id: qrData.periodo_id,
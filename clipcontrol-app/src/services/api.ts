@@ -45,6 +45,7 @@ const apiService = {
   // ✅ REGISTRAR ENTREGA CON FORMDATA
   registrarEntrega: async (data: {
     qr_token_id: number;
+    qr_token?: string;
     empleado_id: number;
     usuario_id: number;
     periodo_id: number;
@@ -68,6 +69,9 @@ const apiService = {
     // Crear FormData
     const formData = new FormData();
     formData.append('qr_token_id', data.qr_token_id.toString());
+    if (data.qr_token) {
+      formData.append('qr_token', data.qr_token);
+    }
     formData.append('empleado_id', data.empleado_id.toString());
     formData.append('usuario_id', data.usuario_id.toString());
     formData.append('periodo_id', data.periodo_id.toString());
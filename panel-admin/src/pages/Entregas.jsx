@@ -104,6 +104,10 @@ const limpiarFiltros = () => {
     });
   };
 
+  // Fotos servidas por el backend con caché HTTP: 'miniatura' para la tabla, 'completa' para el modal
+  const urlFoto = (entrega, variante = 'completa') =>
+    `${api.defaults.baseURL}/entregas/${entrega.id}/foto?variante=${variante}`;
+
   const verFoto = (entrega) => setFotoModal(entrega);
   const cerrarFotoModal = () => setFotoModal(null);
 
@@ -398,6 +402,7 @@ const limpiarFiltros = () => {
                         {entrega.foto_entrega ? (
                           <button onClick={() => verFoto(entrega)}
                             className="flex items-center gap-1 px-3 py-1 bg-green-50 text-green-700 border border-green-200 rounded-lg hover:bg-green-100 transition shadow-sm">
+                            <img src={urlFoto(entrega, 'miniatura')} loading="lazy" alt="" className="w-6 h-6 rounded object-cover" />
                             <Eye className="w-3.5 h-3.5" /> Ver
                           </button>
                         ) : <span className="text-gray-400 text-xs italic">Sin foto</span>}
@@ -459,7 +464,7 @@ const limpiarFiltros = () => {
             </div>
 
             <div className="p-6 flex justify-center bg-gray-200/50">
-              <img src={fotoModal.foto_entrega} alt="Foto de entrega" className="max-h-[400px] w-auto rounded-lg shadow-md object-contain border-4 border-white" />
+              <img src={urlFoto(fotoModal)} alt="Foto de entrega" className="max-h-[400px] w-auto rounded-lg shadow-md object-contain border-4 border-white" />
             </div>
 
             <div className="p-5 bg-white space-y-3 text-sm">